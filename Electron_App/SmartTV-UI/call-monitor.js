@@ -7,6 +7,8 @@ class CallMonitor {
         this.presenceInterval = null;
         this.notificationInterval = 1000; // Check every 1 seconds
         this.presenceUpdateInterval = 90000; // Update presence every 90 seconds
+        this.presenceSocket = null; // Socket.IO connection that keeps us online while open
+        this.socketPresenceActive = false;
     }
 
     // Get server URL from config - waits for config to be ready
@@ -77,10 +79,9 @@ class CallMonitor {
                 this.checkForPendingCalls();
             }, this.notificationInterval);
 
-            // Start presence heartbeat to stay online
-            this.presenceInterval = setInterval(() => {
-                this.updatePresence('online');
-            }, this.presenceUpdateInterval);
+            // Presence follows a Socket.IO connection; HTTP heartbeats are the fallback
+            this.connectPresenceSocket();
+            this.startPresenceHeartbeat();
 
             // Do an immediate check
             this.checkForPendingCalls();
@@ -96,9 +97,11 @@ class CallMonitor {
             clearInterval(this.checkInterval);
             this.checkInterval = null;
         }
-        if (this.presenceInterval) {
-            clearInterval(this.presenceInterval);
-            this.presenceInterval = null;
+        this.stopPresenceHeartbeat();
+        if (this.presenceSocket) {
+            this.presenceSocket.disconnect();
+            this.presenceSocket = null;
+            this.socketPresenceActive = false;
         }
         this.isMonitoring = false;
         console.log('Stopped call monitoring');
@@ -244,6 +247,80 @@ class CallMonitor {
         }, 5000);
     }
 
+    // Start HTTP presence heartbeats, unless a presence socket keeps us online
+    startPresenceHeartbeat() {
+        if (this.presenceInterval || this.socketPresenceActive) return;
+        this.presenceInterval = setInterval(() => {
+            this.updatePresence('online');
+        }, this.presenceUpdateInterval);
+    }
+
+    stopPresenceHeartbeat() {
+        if (this.presenceInterval) {
+            clearInterval(this.presenceInterval);
+            this.presenceInterval = null;
+        }
+    }
+
+    // Load the Socket.IO client bundled in node_modules
+    loadSocketIo() {
+        if (window.io) return Promise.resolve(window.io);
+        return new Promise((resolve) => {
+            const script = document.createElement('script');
+            script.src = 'node_modules/socket.io-client/dist/socket.io.min.js';
+            script.onload = () => resolve(window.io || null);
+            script.onerror = () => resolve(null);
+            document.head.appendChild(script);
+        });
+    }
+
+    // Bind presence to a Socket.IO connection: the server marks us online on
+    // presence_hello and offline as soon as the connection drops, and
+    // Engine.IO pings keep it alive, so no HTTP heartbeats are needed
+    async connectPresenceSocket() {
+        if (this.presenceSocket) return;
+
+        const io = await this.loadSocketIo();
+        if (!io) {
+            console.log('Socket.IO client not available, using HTTP presence heartbeats');
+            return;
+        }
+
+        const serverUrl = await this.getServerUrl();
+        const token = window.electronAPI?.getEnvVariable?.('PRESENCE_HELLO_TOKEN');
+        const socket = io(serverUrl, { transports: ['websocket'] });
+        this.presenceSocket = socket;
+
+        // Sent on every (re)connect, since the server forgets closed connections
+        socket.on('connect', () => {
+            socket.emit('presence_hello', { username: this.currentUser.username, token });
+        });
+
+        socket.on('presence_ack', () => {
+            console.log(`[${new Date().toISOString()}] 🔌 PRESENCE_SOCKET_BOUND: ${this.currentUser.username}`);
+            this.socketPresenceActive = true;
+            this.stopPresenceHeartbeat();
+        });
+
+        // Status changes of our contacts, pushed to this TV's user room
+        socket.on('contact_presence', (data) => {
+            window.dispatchEvent(new CustomEvent('contact-presence', { detail: data }));
+        });
+
+        socket.on('presence_error', (data) => {
+            console.error('Presence socket rejected:', data?.message);
+            this.socketPresenceActive = false;
+            this.startPresenceHeartbeat();
+        });
+
+        socket.on('disconnect', () => {
+            this.socketPresenceActive = false;
+            if (this.isMonitoring) {
+                this.startPresenceHeartbeat();
+            }
+        });
+    }
+
     // Update presence status
     async updatePresence(status = 'online') {
         if (!this.currentUser) return;
@@ -1,5 +1,7 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify, request
 from database.database import db_manager
+from database.records import dumps
+from database.timestamps import NOW_MS_SQL
 import logging
 from datetime import datetime
 
@@ -7,6 +9,20 @@ logger = logging.getLogger(__name__)
 
 admin_bp = Blueprint('admin', __name__)
 
+# Seconds a cached "last 24 hours" count may lag behind the sliding window
+STATS_WINDOW_MAX_AGE = 60
+
+# Sliding 24-hour windows over the indexed epoch-ms columns
+ACTIVE_USERS_QUERY = f"SELECT COUNT(*) as count FROM users WHERE last_seen_ms > {NOW_MS_SQL} - 86400000"
+RECENT_CALLS_QUERY = f"SELECT COUNT(*) as count FROM calls WHERE created_ms > {NOW_MS_SQL} - 86400000"
+
+def _records_response(payload, booleans=()):
+    """JSON response serialized straight from Record rows, bypassing per-row dicts"""
+    return Response(dumps(payload, booleans), mimetype='application/json')
+
+def _include_history() -> bool:
+    return request.args.get('include_history', 'false').lower() == 'true'
+
 @admin_bp.route('/users')
 def get_all_users():
     """Get all users from the database"""
@@ -17,27 +33,13 @@ def get_all_users():
         FROM users 
         ORDER BY created_at DESC
         """
-        users = db_manager.execute_query(query, fetch='all')
-        
-        # Convert rows to dictionaries
-        users_list = []
-        for user in users or []:
-            users_list.append({
-                'id': user['id'],
-                'username': user['username'],
-                'display_name': user['display_name'],
-                'device_type': user['device_type'],
-                'created_at': user['created_at'],
-                'last_seen': user['last_seen'],
-                'is_active': bool(user['is_active']),
-                'metadata': user['metadata']
-            })
+        users = db_manager.execute_read(query, fetch='records')
         
-        return jsonify({
+        return _records_response({
             'success': True,
-            'users': users_list,
-            'count': len(users_list)
-        })
+            'users': users,
+            'count': len(users)
+        }, booleans=('is_active',))
         
     except Exception as e:
         logger.error(f"Failed to get users: {e}")
@@ -48,37 +50,27 @@ def get_all_users():
 
 @admin_bp.route('/sessions')
 def get_all_sessions():
-    """Get all user sessions from the database"""
+    """Get all user sessions from the database (?include_history=true adds archived sessions)"""
     try:
-        query = """
+        if _include_history():
+            columns, source = ", s.archived_at", "user_sessions_all"
+        else:
+            columns, source = "", "user_sessions"
+        
+        query = f"""
         SELECT s.id, s.user_id, s.session_token, s.room_name, s.session_type,
-               s.started_at, s.ended_at, s.is_active, u.username
-        FROM user_sessions s
+               s.started_at, s.ended_at, s.is_active, u.username{columns}
+        FROM {source} s
         LEFT JOIN users u ON s.user_id = u.id
         ORDER BY s.started_at DESC
         """
-        sessions = db_manager.execute_query(query, fetch='all')
-        
-        # Convert rows to dictionaries
-        sessions_list = []
-        for session in sessions or []:
-            sessions_list.append({
-                'id': session['id'],
-                'user_id': session['user_id'],
-                'username': session['username'],
-                'session_token': session['session_token'],
-                'room_name': session['room_name'],
-                'session_type': session['session_type'],
-                'started_at': session['started_at'],
-                'ended_at': session['ended_at'],
-                'is_active': bool(session['is_active'])
-            })
+        sessions = db_manager.execute_read(query, fetch='records')
         
-        return jsonify({
+        return _records_response({
             'success': True,
-            'sessions': sessions_list,
-            'count': len(sessions_list)
-        })
+            'sessions': sessions,
+            'count': len(sessions)
+        }, booleans=('is_active',))
         
     except Exception as e:
         logger.error(f"Failed to get sessions: {e}")
@@ -89,41 +81,28 @@ def get_all_sessions():
 
 @admin_bp.route('/calls')
 def get_all_calls():
-    """Get all calls from the database"""
+    """Get all calls from the database (?include_history=true adds archived calls)"""
     try:
-        query = """
+        if _include_history():
+            columns, source = ", c.archived_at", "calls_all"
+        else:
+            columns, source = "", "calls"
+        
+        query = f"""
         SELECT c.id, c.caller_id, c.callee_id, c.call_id, c.room_name,
                c.status, c.created_at, c.answered_at, c.ended_at, c.duration,
-               u1.username as caller_username, u2.username as callee_username
-        FROM calls c
+               u1.username as caller_username, u2.username as callee_username{columns}
+        FROM {source} c
         LEFT JOIN users u1 ON c.caller_id = u1.id
         LEFT JOIN users u2 ON c.callee_id = u2.id
         ORDER BY c.created_at DESC
         """
-        calls = db_manager.execute_query(query, fetch='all')
-        
-        # Convert rows to dictionaries
-        calls_list = []
-        for call in calls or []:
-            calls_list.append({
-                'id': call['id'],
-                'caller_id': call['caller_id'],
-                'callee_id': call['callee_id'],
-                'caller_username': call['caller_username'],
-                'callee_username': call['callee_username'],
-                'call_id': call['call_id'],
-                'room_name': call['room_name'],
-                'status': call['status'],
-                'created_at': call['created_at'],
-                'answered_at': call['answered_at'],
-                'ended_at': call['ended_at'],
-                'duration': call['duration']
-            })
+        calls = db_manager.execute_read(query, fetch='records')
         
-        return jsonify({
+        return _records_response({
             'success': True,
-            'calls': calls_list,
-            'count': len(calls_list)
+            'calls': calls,
+            'count': len(calls)
         })
         
     except Exception as e:
@@ -142,27 +121,14 @@ def get_all_presence():
                u.username
         FROM user_presence p
         LEFT JOIN users u ON p.user_id = u.id
-        ORDER BY p.updated_at DESC
+        ORDER BY p.updated_ms DESC
         """
-        presence = db_manager.execute_query(query, fetch='all')
-        
-        # Convert rows to dictionaries
-        presence_list = []
-        for p in presence or []:
-            presence_list.append({
-                'id': p['id'],
-                'user_id': p['user_id'],
-                'username': p['username'],
-                'status': p['status'],
-                'last_seen': p['last_seen'],
-                'socket_id': p['socket_id'],
-                'updated_at': p['updated_at']
-            })
+        presence = db_manager.execute_read(query, fetch='records')
         
-        return jsonify({
+        return _records_response({
             'success': True,
-            'presence': presence_list,
-            'count': len(presence_list)
+            'presence': presence,
+            'count': len(presence)
         })
         
     except Exception as e:
@@ -185,28 +151,13 @@ def get_all_contacts():
         LEFT JOIN users u2 ON uc.contact_user_id = u2.id
         ORDER BY uc.added_at DESC
         """
-        contacts = db_manager.execute_query(query, fetch='all')
-        
-        # Convert rows to dictionaries
-        contacts_list = []
-        for contact in contacts or []:
-            contacts_list.append({
-                'id': contact['id'],
-                'user_id': contact['user_id'],
-                'contact_user_id': contact['contact_user_id'],
-                'user_username': contact['user_username'],
-                'user_display_name': contact['user_display_name'],
-                'contact_username': contact['contact_username'],
-                'contact_display_name': contact['contact_display_name'],
-                'added_at': contact['added_at'],
-                'is_favorite': bool(contact['is_favorite'])
-            })
+        contacts = db_manager.execute_read(query, fetch='records')
         
-        return jsonify({
+        return _records_response({
             'success': True,
-            'contacts': contacts_list,
-            'count': len(contacts_list)
-        })
+            'contacts': contacts,
+            'count': len(contacts)
+        }, booleans=('is_favorite',))
         
     except Exception as e:
         logger.error(f"Failed to get contacts: {e}")
@@ -227,28 +178,12 @@ def get_all_game_scores():
         LEFT JOIN users u ON g.user_id = u.id
         ORDER BY g.played_at DESC
         """
-        scores = db_manager.execute_query(query, fetch='all')
-        
-        # Convert rows to dictionaries
-        scores_list = []
-        for score in scores or []:
-            scores_list.append({
-                'id': score['id'],
-                'user_id': score['user_id'],
-                'username': score['username'],
-                'game_type': score['game_type'],
-                'score': score['score'],
-                'questions_answered': score['questions_answered'],
-                'correct_answers': score['correct_answers'],
-                'game_duration': score['game_duration'],
-                'played_at': score['played_at'],
-                'room_name': score['room_name']
-            })
+        scores = db_manager.execute_read(query, fetch='records')
         
-        return jsonify({
+        return _records_response({
             'success': True,
-            'scores': scores_list,
-            'count': len(scores_list)
+            'scores': scores,
+            'count': len(scores)
         })
         
     except Exception as e:
@@ -260,70 +195,71 @@ def get_all_game_scores():
 
 @admin_bp.route('/stats')
 def get_database_stats():
-    """Get summary statistics for the database"""
+    """Get summary statistics for the database
+    
+    Counts come from the result cache and are recomputed only after a write
+    to the table they count.
+    """
     try:
         stats = {}
         
         # Total users
-        total_users = db_manager.execute_query(
+        total_users = db_manager.execute_cached(
             "SELECT COUNT(*) as count FROM users", 
-            fetch='one'
+            fetch='one', read_only=True
         )
         stats['total_users'] = total_users['count'] if total_users else 0
         
         # Active users (seen in last 24 hours)
-        active_users = db_manager.execute_query(
-            "SELECT COUNT(*) as count FROM users WHERE last_seen > datetime('now', '-1 day')", 
-            fetch='one'
+        active_users = db_manager.execute_cached(
+            ACTIVE_USERS_QUERY,
+            fetch='one', read_only=True, max_age=STATS_WINDOW_MAX_AGE
         )
         stats['active_users'] = active_users['count'] if active_users else 0
         
         # Total calls
-        total_calls = db_manager.execute_query(
+        total_calls = db_manager.execute_cached(
             "SELECT COUNT(*) as count FROM calls", 
-            fetch='one'
+            fetch='one', read_only=True
         )
         stats['total_calls'] = total_calls['count'] if total_calls else 0
         
         # Active sessions
-        active_sessions = db_manager.execute_query(
+        active_sessions = db_manager.execute_cached(
             "SELECT COUNT(*) as count FROM user_sessions WHERE is_active = 1", 
-            fetch='one'
+            fetch='one', read_only=True
         )
         stats['active_sessions'] = active_sessions['count'] if active_sessions else 0
         
-        # Online users
-        online_users = db_manager.execute_query(
-            "SELECT COUNT(*) as count FROM user_presence WHERE status = 'online'", 
-            fetch='one'
-        )
-        stats['online_users'] = online_users['count'] if online_users else 0
+        # Online users, from the in-memory presence registry
+        from services.presence_registry import presence_registry
+        stats['online_users'] = presence_registry.count('online')
         
         # Recent calls (last 24 hours)
-        recent_calls = db_manager.execute_query(
-            "SELECT COUNT(*) as count FROM calls WHERE created_at > datetime('now', '-1 day')", 
-            fetch='one'
+        recent_calls = db_manager.execute_cached(
+            RECENT_CALLS_QUERY,
+            fetch='one', read_only=True, max_age=STATS_WINDOW_MAX_AGE
         )
         stats['recent_calls'] = recent_calls['count'] if recent_calls else 0
         
         # Total contacts
-        total_contacts = db_manager.execute_query(
+        total_contacts = db_manager.execute_cached(
             "SELECT COUNT(*) as count FROM user_contacts", 
-            fetch='one'
+            fetch='one', read_only=True
         )
         stats['total_contacts'] = total_contacts['count'] if total_contacts else 0
         
         # Users with contacts
-        users_with_contacts = db_manager.execute_query(
+        users_with_contacts = db_manager.execute_cached(
             "SELECT COUNT(DISTINCT user_id) as count FROM user_contacts", 
-            fetch='one'
+            fetch='one', read_only=True
         )
         stats['users_with_contacts'] = users_with_contacts['count'] if users_with_contacts else 0
         
         # Favorite contacts
-        favorite_contacts = db_manager.execute_query(
+        favorite_contacts = db_manager.execute_cached(
             "SELECT COUNT(*) as count FROM user_contacts WHERE is_favorite = 1", 
-            fetch='one'
+            fetch='one', read_only=True
         )
         stats['favorite_contacts'] = favorite_contacts['count'] if favorite_contacts else 0
         
@@ -359,6 +295,68 @@ def background_service_status():
             'error': str(e)
         }), 500
 
+@admin_bp.route('/archive', methods=['POST'])
+def run_archive():
+    """Move finished calls and ended sessions to the history tables now"""
+    try:
+        from services.background_service import background_service
+        
+        archived = background_service.archiver.run()
+        
+        return jsonify({
+            'success': True,
+            'archived': archived,
+            'archive': background_service.archiver.stats()
+        })
+    
+    except Exception as e:
+        logger.error(f"Failed to archive calls and sessions: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@admin_bp.route('/backups')
+def list_backups():
+    """List database backups with their manifests"""
+    try:
+        from services.background_service import background_service
+        
+        backups = background_service.backups.list_backups()
+        
+        return jsonify({
+            'success': True,
+            'backups': backups,
+            'count': len(backups)
+        })
+    
+    except Exception as e:
+        logger.error(f"Failed to list backups: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@admin_bp.route('/backups', methods=['POST'])
+def create_backup():
+    """Take an online database backup now"""
+    try:
+        from services.background_service import background_service
+        
+        manifest = background_service.backups.create_backup()
+        
+        return jsonify({
+            'success': True,
+            'backup': manifest
+        })
+    
+    except Exception as e:
+        logger.error(f"Failed to create backup: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @admin_bp.route('/health')
 def admin_health():
     """Admin health check endpoint"""
@@ -370,11 +368,20 @@ def admin_health():
         from services.background_service import background_service
         bg_status = background_service.get_status()
         
+        from services.heartbeat_buffer import heartbeat_buffer
+        from services.presence_registry import presence_registry
+        from services.presence_feed import presence_feed
+        from services.contact_graph import contact_graph
+        
         return jsonify({
             'success': True,
             'admin_status': 'healthy',
             'database': health_data,
-            'background_service': bg_status
+            'background_service': bg_status,
+            'heartbeat_buffer': heartbeat_buffer.stats(),
+            'presence_registry': presence_registry.stats(),
+            'presence_feed': presence_feed.stats(),
+            'contact_graph': contact_graph.stats()
         })
         
     except Exception as e:
@@ -385,6 +392,65 @@ def admin_health():
             'error': str(e)
         }), 500
 
+@admin_bp.route('/db-stats')
+def get_db_query_stats():
+    """Per-statement latency, rows and lock-wait aggregates, plus per-endpoint
+    lock waits, retries and lock errors under contention
+
+    Query parameters: sort (default total_ms, e.g. p95_ms, count, lock_wait_ms)
+    and limit (number of statements to return).
+    """
+    try:
+        sort = request.args.get('sort', 'total_ms')
+        limit = request.args.get('limit', type=int)
+        
+        try:
+            query_stats = db_manager.query_stats.snapshot(sort=sort, limit=limit)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'query_stats': query_stats,
+            'pool': db_manager.pool.stats(),
+            'read_pool': db_manager.read_pool.stats(),
+            'result_cache': db_manager.result_cache.stats(),
+            'contention': db_manager.contention.snapshot(),
+            'retry_policy': db_manager.retry_policy.to_dict(),
+            'timestamp': datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logger.error(f"Failed to get database query stats: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@admin_bp.route('/db-stats/reset', methods=['POST'])
+def reset_db_query_stats():
+    """Clear the query statistics"""
+    try:
+        db_manager.query_stats.reset()
+        db_manager.contention.reset()
+        logger.info("🔧 Database query stats reset via admin API")
+        
+        return jsonify({
+            'success': True,
+            'message': 'Query stats reset',
+            'timestamp': datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logger.error(f"Failed to reset database query stats: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @admin_bp.route('/sync-twilio', methods=['POST'])
 def manual_sync_twilio():
     """Manually trigger Twilio call sync for testing"""
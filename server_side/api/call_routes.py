@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from services.call_service import CallService
 from services.user_service import UserService
+from api.responses import busy_response
+from database.contention import DatabaseBusyError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,7 +13,14 @@ user_service = UserService()
 
 @call_bp.route('/online-users', methods=['GET'])
 def get_online_users():
-    """Get list of users currently online, optionally filtered by contact list"""
+    """
+    Get list of users currently online, optionally filtered by contact list
+    
+    Every response carries a version. Passing it back as ?since=<version>
+    returns only the users whose status, display name or favorite flag
+    changed, plus the usernames that left the list (full=false). A cursor
+    that is too old gets a full snapshot (full=true).
+    """
     try:
         # Get current user from query param (optional)
         current_user = request.args.get('exclude_user')
@@ -19,17 +28,23 @@ def get_online_users():
         contacts_only = request.args.get('contacts_only', 'false').lower() == 'true'
         # Check if we should include offline users
         include_offline = request.args.get('include_offline', 'true').lower() == 'true'
+        # Version cursor from a previous response (optional)
+        since = request.args.get('since', type=int)
         
-        users = call_service.get_online_users(
-            exclude_username=current_user, 
+        result = call_service.get_online_users_since(
+            exclude_username=current_user,
             contacts_only=contacts_only,
-            include_offline=include_offline
+            since=since
         )
+        users = result['users']
         
         return jsonify({
             'success': True,
             'users': users,
             'count': len(users),
+            'version': result['version'],
+            'full': result['full'],
+            'removed': result['removed'],
             'contacts_only': contacts_only,
             'include_offline': include_offline
         }), 200
@@ -93,6 +108,9 @@ def initiate_call():
             'call': call_result
         }), 200
         
+    except DatabaseBusyError as e:
+        logger.warning(f"Call initiation deferred, database busy: {e}")
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Failed to initiate call: {e}")
         return jsonify({
@@ -345,6 +363,9 @@ def update_presence():
             'message': 'Presence updated'
         }), 200
         
+    except DatabaseBusyError as e:
+        logger.warning(f"Presence update deferred, database busy: {e}")
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Failed to update presence: {e}")
         return jsonify({
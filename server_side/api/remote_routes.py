@@ -1,13 +1,41 @@
 from flask import Blueprint, request
-from flask_socketio import emit, join_room, leave_room
+from flask_socketio import emit, join_room
+from services.call_service import CallService
+from services.contact_graph import contact_graph
+import hmac
 import logging
+import os
 
 remote_bp = Blueprint('remote', __name__)
 logger = logging.getLogger(__name__)
 
+call_service = CallService()
+
+# Shared secret TVs must send with presence_hello. Without it every hello is
+# rejected, unless PRESENCE_HELLO_INSECURE=true accepts any registered username.
+PRESENCE_HELLO_TOKEN = os.getenv('PRESENCE_HELLO_TOKEN')
+PRESENCE_HELLO_INSECURE = os.getenv('PRESENCE_HELLO_INSECURE', 'false').lower() == 'true'
+
+def user_room(username: str) -> str:
+    """Room joined by a TV's bound connections; receives its contacts' presence"""
+    return f"user:{username}"
+
+def is_valid_presence_token(token) -> bool:
+    if not PRESENCE_HELLO_TOKEN:
+        return PRESENCE_HELLO_INSECURE
+    return isinstance(token, str) and hmac.compare_digest(token.encode(), PRESENCE_HELLO_TOKEN.encode())
+
 def register_socketio_events(socketio):
     """Register WebSocket events for mobile remote control"""
     
+    if not PRESENCE_HELLO_TOKEN:
+        if PRESENCE_HELLO_INSECURE:
+            logger.warning("⚠️ PRESENCE_HELLO_TOKEN is not set and PRESENCE_HELLO_INSECURE=true: "
+                           "any client can mark any registered user online over Socket.IO")
+        else:
+            logger.warning("⚠️ PRESENCE_HELLO_TOKEN is not set: every presence_hello will be rejected "
+                           "and TVs fall back to HTTP heartbeats")
+    
     @socketio.on('connect')
     def handle_connect():
         logger.info(f"Mobile remote connected: {request.sid}")
@@ -16,6 +44,34 @@ def register_socketio_events(socketio):
     @socketio.on('disconnect')
     def handle_disconnect():
         logger.info(f"Mobile remote disconnected: {request.sid}")
+        # A TV that said presence_hello goes offline with its last connection
+        call_service.disconnect_presence(request.sid)
+    
+    @socketio.on('presence_hello')
+    def handle_presence_hello(data):
+        """TV binds this connection to its username and stays online until it closes"""
+        data = data or {}
+        username = data.get('username')
+        
+        if not username or not is_valid_presence_token(data.get('token')):
+            logger.warning(f"Rejected presence_hello from {request.sid}")
+            emit('presence_error', {'message': 'Invalid username or token'})
+            return
+        
+        if not call_service.connect_presence(username, request.sid):
+            emit('presence_error', {'message': 'User not found'})
+            return
+        
+        # Engine.IO pings keep the connection, and so the presence, alive
+        join_room(user_room(username))
+        emit('presence_ack', {'username': username, 'status': 'online'})
+    
+    def push_contact_presence(changes):
+        # Only users who have the changed TV as a contact are told about it
+        for watcher, users in contact_graph.fan_out(changes).items():
+            socketio.emit('contact_presence', {'users': users}, room=user_room(watcher))
+    
+    call_service.calls.add_presence_listener(push_contact_presence)
     
     @socketio.on('remote_command')
     def handle_remote_command(data):
@@ -0,0 +1,20 @@
+"""
+JSON error responses shared by the blueprints
+"""
+
+from flask import jsonify
+from database.contention import DatabaseBusyError
+
+# Seconds a client should wait before retrying a request that lost a lock race
+BUSY_RETRY_AFTER = 1
+
+def busy_response(error: DatabaseBusyError):
+    """503 with Retry-After: the database stayed locked, the request can be repeated"""
+    response = jsonify({
+        'error': 'Server busy, please retry',
+        'reason': error.kind,
+        'retry_after': BUSY_RETRY_AFTER
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(BUSY_RETRY_AFTER)
+    return response
@@ -5,11 +5,14 @@ import datetime
 import platform
 import subprocess
 from werkzeug.utils import secure_filename
+from database.database import db_manager
 
 update_bp = Blueprint('update', __name__)
 
 UPDATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'updates')
 VERSIONS_FILE = os.path.join(UPDATES_DIR, 'versions.json')
+# Result cache version key bumped by save_versions()
+VERSIONS_CACHE_KEY = 'updates.versions'
 
 os.makedirs(UPDATES_DIR, exist_ok=True)
 
@@ -52,10 +55,26 @@ def load_versions():
             return json.load(f)
     return {'versions': []}
 
+def load_versions_cached():
+    """Shared, read-only copy of versions.json, re-read only after it changes
+
+    Keyed by the file's mtime and size as well, so edits made outside this
+    process (upload_update.py, a manual edit) are picked up too.
+    """
+    try:
+        stat = os.stat(VERSIONS_FILE)
+        file_key = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        file_key = None
+    return db_manager.result_cache.get_or_load(
+        ('file', VERSIONS_FILE, file_key), (VERSIONS_CACHE_KEY,), load_versions
+    )
+
 def save_versions(data):
     """Save version metadata to versions.json"""
     with open(VERSIONS_FILE, 'w') as f:
         json.dump(data, f, indent=2)
+    db_manager.mark_written(VERSIONS_CACHE_KEY)
 
 @update_bp.route('/check', methods=['GET'])
 def check_for_updates():
@@ -67,7 +86,7 @@ def check_for_updates():
     # Get system architecture
     system_arch = get_system_architecture()
     
-    versions_data = load_versions()
+    versions_data = load_versions_cached()
     versions = versions_data.get('versions', [])
     
     if not versions:
@@ -118,7 +137,7 @@ def check_for_updates():
 def download_update(version):
     """Download a specific version of the .deb package"""
     system_arch = get_system_architecture()
-    versions_data = load_versions()
+    versions_data = load_versions_cached()
     versions = versions_data.get('versions', [])
     
     # Find compatible version for this architecture
@@ -162,7 +181,7 @@ def download_update(version):
 @update_bp.route('/versions', methods=['GET'])
 def list_versions():
     """List all available versions"""
-    versions_data = load_versions()
+    versions_data = load_versions_cached()
     return jsonify(versions_data)
 
 @update_bp.route('/upload', methods=['POST'])
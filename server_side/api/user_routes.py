@@ -306,7 +306,7 @@ def get_active_users():
 def user_service_health():
     """Health check for user service"""
     try:
-        health_data = user_service.db.health_check()
+        health_data = user_service.users.health_check()
         
         return jsonify({
             'service': 'user_management',
@@ -0,0 +1,239 @@
+"""
+Opt-in capture of anonymized request traces for workload replay
+
+Set WORKLOAD_CAPTURE_PATH to append one compact JSON line per request served
+by the blueprints registered in create_app: route rule, method, parameters,
+status, server-side latency and response size. replay_workload.py drives a
+capture against a local server.
+
+Nothing identifying is written. Usernames and other identifiers are replaced
+by keyed pseudonyms that keep their format (five alphanumerics for
+usernames), so the same TV maps to the same pseudonym throughout a capture
+and replayed requests still pass validation. Free text is replaced by
+placeholder text of the same length; numbers, booleans and enumerations such
+as status or session_type are kept, as are the numeric query arguments since
+and limit (query strings arrive as text). Set WORKLOAD_CAPTURE_SALT to keep
+pseudonyms stable across restarts; by default every process draws its own.
+
+Records are buffered in memory and appended by a background thread, so a
+slow SD card never delays a response.
+"""
+
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_FORMAT = 'smarttv-workload'
+CAPTURE_VERSION = 1
+
+# Parameters naming a user; pseudonyms keep the 5-character username format
+USER_KEYS = frozenset({
+    'username', 'caller', 'callee', 'contact_username', 'current_user', 'exclude_user', 'identity'
+})
+
+# Opaque identifiers; pseudonyms keep the value's length
+ID_KEYS = frozenset({'call_id', 'room_name', 'session_token', 'socket_id'})
+
+# Enumerations, flags and numeric query arguments that carry no user data and shape the workload
+KEEP_KEYS = frozenset({
+    'status', 'action', 'app', 'device_type', 'direction', 'game_type', 'session_type',
+    'sort', 'version', 'versions', 'contacts_only', 'include_history', 'include_offline',
+    'since', 'limit'
+})
+
+_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+class WorkloadRecorder:
+    """Anonymizes requests and appends them to a capture file"""
+    
+    def __init__(self, path: str = None, salt: str = None, sample_rate: float = None,
+                 flush_interval_ms: int = None, max_bytes: int = None):
+        self.path = path or os.getenv('WORKLOAD_CAPTURE_PATH')
+        self.salt = (salt or os.getenv('WORKLOAD_CAPTURE_SALT') or secrets.token_hex(16)).encode()
+        if sample_rate is None:
+            sample_rate = float(os.getenv('WORKLOAD_CAPTURE_SAMPLE', 1.0))
+        self.sample_rate = sample_rate
+        self.flush_interval = (flush_interval_ms or int(os.getenv('WORKLOAD_CAPTURE_FLUSH_MS', 1000))) / 1000.0
+        self.max_bytes = max_bytes or int(os.getenv('WORKLOAD_CAPTURE_MAX_MB', 256)) * 1024 * 1024
+        
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._header_written = False
+        self._full = False
+        
+        self._recorded = 0
+        self._written = 0
+        self._dropped = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+    
+    def pseudonym(self, value: str, user: bool = False) -> str:
+        """Stable keyed replacement for an identifier"""
+        digest = hmac.new(self.salt, str(value).encode(), hashlib.sha256).digest()
+        length = 5 if user else max(len(str(value)), 8)
+        number = int.from_bytes(digest, 'big')
+        chars = []
+        for _ in range(length):
+            number, index = divmod(number, len(_ALPHABET))
+            chars.append(_ALPHABET[index])
+        return ''.join(chars)
+    
+    def anonymize(self, value, key: str = None):
+        """Replace identifiers and free text inside a parameter value"""
+        if isinstance(value, dict):
+            return {k: self.anonymize(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.anonymize(item, key) for item in value]
+        if not isinstance(value, str):
+            return value
+        if key in USER_KEYS:
+            return self.pseudonym(value, user=True)
+        if key in ID_KEYS:
+            return self.pseudonym(value)
+        if key in KEEP_KEYS:
+            return value
+        return 'x' * len(value)
+    
+    def init_app(self, app):
+        """Register the capture hooks; does nothing unless a capture path is set"""
+        if not self.enabled:
+            return
+        
+        @app.before_request
+        def start_capture():
+            g.capture_started = time.perf_counter()
+        
+        @app.after_request
+        def capture_request(response):
+            try:
+                self.capture(response)
+            except Exception as e:
+                logger.error(f"Failed to capture request: {e}")
+            return response
+        
+        atexit.register(self.stop)
+        logger.info(f"🎥 Capturing anonymized workload to {self.path}")
+    
+    def capture(self, response):
+        """Queue one record for the request being answered"""
+        started = g.get('capture_started')
+        if started is None or request.url_rule is None or request.method == 'OPTIONS':
+            return
+        if self._full or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return
+        
+        record = {
+            't': round(time.time(), 3),
+            'm': request.method,
+            'r': request.url_rule.rule,
+            'e': request.endpoint,
+            's': response.status_code,
+            'ms': round((time.perf_counter() - started) * 1000, 3),
+            'n': response.calculate_content_length(),
+        }
+        if request.view_args:
+            record['v'] = self.anonymize(request.view_args)
+        if request.args:
+            record['q'] = self.anonymize(request.args.to_dict())
+        body = request.get_json(silent=True) if request.is_json else None
+        if body is not None:
+            record['b'] = self.anonymize(body)
+        elif request.content_length:
+            record['rb'] = request.content_length
+        
+        with self._lock:
+            self._pending.append(record)
+            self._recorded += 1
+        if self._thread is None:
+            self.start()
+    
+    def flush(self) -> int:
+        """Append queued records to the capture file; returns records written"""
+        with self._flush_lock:
+            with self._lock:
+                records, self._pending = self._pending, []
+            if not records:
+                return 0
+            
+            lines = []
+            if not self._header_written:
+                lines.append(json.dumps({
+                    'capture': CAPTURE_FORMAT,
+                    'version': CAPTURE_VERSION,
+                    'started_at': datetime.now().isoformat(),
+                    'salt_id': hashlib.sha256(self.salt).hexdigest()[:8],
+                    'sample_rate': self.sample_rate
+                }, separators=(',', ':')))
+            lines.extend(json.dumps(record, separators=(',', ':')) for record in records)
+            data = ('\n'.join(lines) + '\n').encode()
+            
+            try:
+                size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                if size + len(data) > self.max_bytes:
+                    self._full = True
+                    self._dropped += len(records)
+                    logger.warning(f"🎥 Workload capture {self.path} reached {self.max_bytes // (1024 * 1024)} MB, capture stopped")
+                    return 0
+                with open(self.path, 'ab') as f:
+                    f.write(data)
+            except OSError as e:
+                self._dropped += len(records)
+                logger.error(f"Failed to write workload capture: {e}")
+                return 0
+            
+            self._header_written = True
+            self._written += len(records)
+            return len(records)
+    
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='workload-capture', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Stop the writer thread and append anything still queued"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'sample_rate': self.sample_rate,
+            'recorded': self._recorded,
+            'written': self._written,
+            'pending': pending,
+            'dropped': self._dropped,
+            'stopped_at_size_limit': self._full
+        }
+    
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+# Global instance
+workload_recorder = WorkloadRecorder()
@@ -1,7 +1,7 @@
 import os
 import logging
 import atexit
-from flask import Flask
+from flask import Flask, request
 from flask_cors import CORS
 from flask_socketio import SocketIO
 from dotenv import load_dotenv
@@ -18,8 +18,31 @@ def create_app():
     # Enable CORS
     CORS(app)
     
-    # Initialize SocketIO
-    socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
+    # Initialize SocketIO. A TV bound with presence_hello goes offline when it
+    # misses a ping, at most ping_interval + ping_timeout seconds after it vanished
+    socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True,
+                        ping_interval=int(os.getenv('SOCKETIO_PING_INTERVAL', 25)),
+                        ping_timeout=int(os.getenv('SOCKETIO_PING_TIMEOUT', 20)))
+    
+    # Attribute database lock waits and retries to the endpoint being served
+    from database.contention import DatabaseBusyError, set_endpoint
+    from api.responses import busy_response
+    
+    @app.before_request
+    def track_endpoint():
+        set_endpoint(request.endpoint)
+    
+    @app.teardown_request
+    def clear_endpoint(exc=None):
+        set_endpoint(None)
+    
+    @app.errorhandler(DatabaseBusyError)
+    def database_busy(e):
+        return busy_response(e)
+    
+    # Anonymized request traces for replay_workload.py (WORKLOAD_CAPTURE_PATH)
+    from api.workload_capture import workload_recorder
+    workload_recorder.init_app(app)
     
     # Add basic routes
     @app.route('/')
@@ -50,6 +73,21 @@ def create_app():
     # Register SocketIO events for mobile remote control
     register_socketio_events(socketio)
     
+    # Rebuild presence from the last checkpoint before serving requests
+    from services.presence_registry import presence_registry
+    try:
+        presence_registry.load()
+        presence_registry.start()
+    except Exception as e:
+        logging.error(f"❌ Failed to load presence registry: {e}")
+    
+    # Reverse contact edges for contact_presence pushes
+    from services.contact_graph import contact_graph
+    try:
+        contact_graph.load()
+    except Exception as e:
+        logging.error(f"❌ Failed to load contact graph: {e}")
+    
     # Start background service
     from services.background_service import background_service
     
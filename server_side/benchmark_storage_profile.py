@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark read latency under heartbeat write load for each storage profile.
+Usage: python benchmark_storage_profile.py [--users 20000] [--writers 4] [--readers 4] [--seconds 5]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from database.database import DatabaseManager, STORAGE_PROFILES
+from database.timestamps import NOW_MS_SQL
+from seed_fleet import seed_fleet, username
+
+ONLINE_USERS_QUERY = """
+    SELECT u.username, u.display_name, u.last_seen,
+           COALESCE(up.status, 'offline') as presence_status,
+           COALESCE(up.updated_at, u.last_seen) as updated_at
+    FROM users u
+    LEFT JOIN user_presence up ON u.id = up.user_id
+    WHERE u.username != ?
+    ORDER BY CASE WHEN COALESCE(up.status, 'offline') = 'online' THEN 1 ELSE 0 END DESC,
+             u.username ASC
+"""
+
+PENDING_CALLS_QUERY = """
+    SELECT c.call_id, c.status, c.created_at,
+           u1.username as caller_username,
+           u1.display_name as caller_display_name
+    FROM calls c
+    JOIN users u1 ON c.caller_id = u1.id
+    JOIN users u2 ON c.callee_id = u2.id
+    WHERE u2.username = ? AND c.status IN ('pending', 'ringing')
+    ORDER BY c.created_at DESC
+"""
+
+def heartbeat_writer(db, user_count, stop):
+    """Mimic CallService.update_presence plus UserService.update_last_seen"""
+    while not stop.is_set():
+        user_id = random.randint(1, user_count)
+        db.execute_query(
+            f"""INSERT INTO user_presence (user_id, status, updated_at, updated_ms)
+               VALUES (?, 'online', CURRENT_TIMESTAMP, {NOW_MS_SQL})
+               ON CONFLICT(user_id) DO UPDATE SET
+               status = excluded.status, updated_at = excluded.updated_at, updated_ms = excluded.updated_ms""",
+            (user_id,)
+        )
+        db.execute_query(
+            f"UPDATE users SET last_seen = CURRENT_TIMESTAMP, last_seen_ms = {NOW_MS_SQL} WHERE id = ?",
+            (user_id,)
+        )
+
+def reader(db, user_count, stop, latencies):
+    """Alternate the online-users and pending-calls reads, recording latency"""
+    while not stop.is_set():
+        name = username(random.randrange(user_count))
+        query = ONLINE_USERS_QUERY if random.random() < 0.5 else PENDING_CALLS_QUERY
+        started = time.perf_counter()
+        db.execute_query(query, (name,), fetch='all')
+        latencies.append((time.perf_counter() - started) * 1000)
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_profile(profile, args):
+    """Run the mixed workload against a fresh database using one profile"""
+    work_dir = tempfile.mkdtemp(prefix=f"smarttv-bench-{profile}-")
+    try:
+        db = DatabaseManager(
+            db_path=os.path.join(work_dir, 'bench.db'),
+            pool_size=args.writers + args.readers,
+            storage_profile=profile
+        )
+        seed_fleet(db, args.users, args.seed)
+        
+        stop = threading.Event()
+        latencies = []
+        threads = [threading.Thread(target=heartbeat_writer, args=(db, args.users, stop))
+                   for _ in range(args.writers)]
+        threads += [threading.Thread(target=reader, args=(db, args.users, stop, latencies))
+                    for _ in range(args.readers)]
+        
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        
+        db.close()
+        return latencies
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare SQLite storage profiles under heartbeat load')
+    parser.add_argument('--users', type=int, default=20000, help='Number of seeded users')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for seed_fleet')
+    parser.add_argument('--writers', type=int, default=4, help='Concurrent heartbeat writer threads')
+    parser.add_argument('--readers', type=int, default=4, help='Concurrent reader threads')
+    parser.add_argument('--seconds', type=float, default=5, help='Duration per profile')
+    parser.add_argument('--profiles', nargs='+', default=sorted(STORAGE_PROFILES),
+                        choices=sorted(STORAGE_PROFILES), help='Profiles to compare')
+    args = parser.parse_args()
+    
+    print("⏱️  SmartTV storage profile benchmark")
+    print(f"   {args.users} users, {args.writers} writers, {args.readers} readers, {args.seconds}s per profile")
+    print("=" * 72)
+    print(f"{'profile':<10}{'reads':>8}{'reads/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    
+    for profile in args.profiles:
+        latencies = run_profile(profile, args)
+        if not latencies:
+            print(f"{profile:<10}{'no reads completed':>30}")
+            continue
+        
+        print(f"{profile:<10}{len(latencies):>8}{len(latencies) / args.seconds:>10.0f}"
+              f"{statistics.median(latencies):>10.2f}{percentile(latencies, 95):>10.2f}"
+              f"{percentile(latencies, 99):>10.2f}{max(latencies):>10.2f}")
+
+if __name__ == "__main__":
+    main()
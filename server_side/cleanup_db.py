@@ -19,6 +19,10 @@ def cleanup_database():
     
     try:
         conn = sqlite3.connect(db_path)
+        presence_path = os.getenv('PRESENCE_DB_PATH')
+        if presence_path:
+            # user_presence lives in the separate presence database
+            conn.execute("ATTACH DATABASE ? AS presence", (presence_path,))
         cursor = conn.cursor()
         
         # Get counts before deletion
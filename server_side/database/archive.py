@@ -0,0 +1,135 @@
+"""
+Hot/cold archival: move finished calls and ended sessions into history tables
+
+Live tables only hold rows the signaling path can still touch, so their
+indexes stay small. Rows move in batches, each batch its own short write
+transaction (copy into <table>_history, delete from the live table), so the
+archiver never holds the write lock long enough to delay call signaling.
+Everything stays queryable through the calls_all / user_sessions_all views.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any
+from database.database import db_manager
+
+logger = logging.getLogger(__name__)
+
+FINISHED_CALL_STATUSES = ('declined', 'cancelled', 'ended', 'missed')
+
+class ArchiveSpec:
+    """How one live table is archived"""
+    
+    def __init__(self, table: str, history_table: str, columns: tuple, predicate: str):
+        self.table = table
+        self.history_table = history_table
+        self.columns = ', '.join(columns)
+        # Rows eligible for archival; takes the cutoff timestamp as its only parameter
+        self.predicate = predicate
+
+ARCHIVE_SPECS = {
+    'calls': ArchiveSpec(
+        'calls', 'calls_history',
+        ('id', 'caller_id', 'callee_id', 'call_id', 'room_name', 'status',
+         'created_at', 'answered_at', 'ended_at', 'duration'),
+        f"status IN ({', '.join(repr(s) for s in FINISHED_CALL_STATUSES)}) AND created_at < ?"
+    ),
+    'user_sessions': ArchiveSpec(
+        'user_sessions', 'user_sessions_history',
+        ('id', 'user_id', 'session_token', 'room_name', 'session_type',
+         'started_at', 'ended_at', 'is_active'),
+        "is_active = 0 AND ended_at < ?"
+    ),
+}
+
+def cutoff_timestamp(age: timedelta) -> str:
+    """UTC timestamp ``age`` ago, in the CURRENT_TIMESTAMP format the tables use"""
+    return (datetime.now(timezone.utc) - age).strftime('%Y-%m-%d %H:%M:%S')
+
+class Archiver:
+    """Batched mover from live tables to their history tables"""
+    
+    def __init__(self, db=None, batch_size: int = None, call_age: timedelta = None,
+                 session_age: timedelta = None):
+        self.db = db or db_manager
+        self.batch_size = batch_size or int(os.getenv('ARCHIVE_BATCH_SIZE', 500))
+        self.call_age = call_age or timedelta(minutes=int(os.getenv('CALL_ARCHIVE_AFTER_MINUTES', 60)))
+        self.session_age = session_age or timedelta(hours=int(os.getenv('SESSION_ARCHIVE_AFTER_HOURS', 24)))
+        
+        self._archived = {table: 0 for table in ARCHIVE_SPECS}
+        self._batches = 0
+        self._last_run = None
+        self._last_run_ms = 0.0
+    
+    def archive(self, table: str, cutoff: str) -> int:
+        """Move every eligible row older than cutoff; returns rows moved"""
+        spec = ARCHIVE_SPECS[table]
+        moved = 0
+        while True:
+            batch = self._archive_batch(spec, cutoff)
+            moved += batch
+            if batch < self.batch_size:
+                break
+            # Give queued writers the lock between batches
+            time.sleep(0)
+        
+        self._archived[table] += moved
+        return moved
+    
+    def _archive_batch(self, spec: ArchiveSpec, cutoff: str) -> int:
+        with self.db.transaction():
+            rows = self.db.execute_query(
+                f"SELECT id FROM {spec.table} WHERE {spec.predicate} LIMIT ?",
+                (cutoff, self.batch_size),
+                fetch='all'
+            )
+            if not rows:
+                return 0
+            
+            ids = tuple(row['id'] for row in rows)
+            placeholders = ', '.join('?' * len(ids))
+            self.db.execute_query(
+                f"""INSERT OR REPLACE INTO {spec.history_table} ({spec.columns}, archived_at)
+                    SELECT {spec.columns}, CURRENT_TIMESTAMP FROM {spec.table}
+                    WHERE id IN ({placeholders})""",
+                ids
+            )
+            self.db.execute_query(f"DELETE FROM {spec.table} WHERE id IN ({placeholders})", ids)
+        
+        self._batches += 1
+        return len(ids)
+    
+    def run(self) -> Dict[str, int]:
+        """Archive calls and sessions past their configured age"""
+        started = time.perf_counter()
+        moved = {
+            'calls': self.archive('calls', cutoff_timestamp(self.call_age)),
+            'user_sessions': self.archive('user_sessions', cutoff_timestamp(self.session_age)),
+        }
+        self._last_run = datetime.now().isoformat()
+        self._last_run_ms = (time.perf_counter() - started) * 1000
+        return moved
+    
+    def stats(self) -> Dict[str, Any]:
+        """Live/history row counts and archiver counters"""
+        tables = {}
+        for table, spec in ARCHIVE_SPECS.items():
+            tables[table] = {
+                'live_rows': self.db.execute_read(f"SELECT COUNT(*) FROM {spec.table}", fetch='one')[0],
+                'history_rows': self.db.execute_read(f"SELECT COUNT(*) FROM {spec.history_table}", fetch='one')[0],
+                'archived_since_start': self._archived[table],
+            }
+        return {
+            'tables': tables,
+            'batch_size': self.batch_size,
+            'call_archive_after_minutes': int(self.call_age.total_seconds() // 60),
+            'session_archive_after_hours': int(self.session_age.total_seconds() // 3600),
+            'batches': self._batches,
+            'last_run': self._last_run,
+            'last_run_ms': round(self._last_run_ms, 1)
+        }
+
+# Global instance
+archiver = Archiver()
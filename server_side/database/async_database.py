@@ -0,0 +1,107 @@
+"""
+asyncio front end for DatabaseManager
+
+SQLite calls block, so every statement runs on a dedicated thread pool sized
+to the connection pool. Coroutines await the result instead of holding a
+request thread, which lets one event loop serve many concurrent socket
+clients and long-polls while at most ``max_workers`` statements are in
+flight.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Dict, Any
+from database.database import db_manager
+from database.result_cache import written_tables
+
+logger = logging.getLogger(__name__)
+
+class AsyncTransaction:
+    """Statements issued inside AsyncDatabaseManager.transaction()"""
+    
+    def __init__(self, manager: 'AsyncDatabaseManager', conn: sqlite3.Connection):
+        self._manager = manager
+        self._conn = conn
+        # Tables to invalidate in the result cache once the transaction commits
+        self.written = set()
+    
+    async def execute_query(self, query: str, params: tuple = (), fetch: str = None):
+        """Same contract as DatabaseManager.execute_query, on the transaction's connection"""
+        result = await self._manager.run(self._manager.db._run_query, self._conn, query, params, fetch)
+        self.written.update(written_tables(query))
+        return result
+    
+    async def executemany(self, query: str, seq_of_params) -> int:
+        cursor = await self._manager.run(self._conn.executemany, query, seq_of_params)
+        self.written.update(written_tables(query))
+        return cursor.rowcount
+
+class AsyncDatabaseManager:
+    """Awaitable mirror of DatabaseManager backed by a dedicated executor"""
+    
+    def __init__(self, db=None, max_workers: int = None):
+        self.db = db or db_manager
+        if max_workers is None:
+            max_workers = int(os.getenv('DB_ASYNC_WORKERS', self.db.pool.max_size))
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='smarttv-db')
+    
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking callable on the database executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+    
+    async def execute_query(self, query: str, params: tuple = (), fetch: str = None):
+        """Execute a query with optional fetch mode (see DatabaseManager.execute_query)"""
+        return await self.run(self.db.execute_query, query, params, fetch)
+    
+    async def execute_read(self, query: str, params: tuple = (), fetch: str = 'all'):
+        """Read on the read-only pool (see DatabaseManager.execute_read)"""
+        return await self.run(self.db.execute_read, query, params, fetch)
+    
+    async def execute_cached(self, query: str, params: tuple = (), fetch: str = 'all',
+                             max_age: float = None, read_only: bool = False):
+        """Read through the result cache (see DatabaseManager.execute_cached)"""
+        return await self.run(self.db.execute_cached, query, params, fetch, max_age, read_only)
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """Async unit of work on one pooled connection
+
+        Unlike DatabaseManager.transaction() this cannot rely on thread-local
+        state, since consecutive statements may run on different executor
+        threads; issue them through the yielded AsyncTransaction instead.
+        """
+        conn = await self.run(self.db.pool.acquire)
+        tx = AsyncTransaction(self, conn)
+        try:
+            await self.run(conn.execute, "BEGIN IMMEDIATE")
+            try:
+                yield tx
+                await self.run(conn.execute, "COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    await self.run(conn.execute, "ROLLBACK")
+                raise
+        finally:
+            self.db.pool.release(conn)
+        if tx.written:
+            self.db.table_versions.bump(tx.written)
+    
+    async def health_check(self) -> Dict[str, Any]:
+        """Database health check plus executor sizing"""
+        health = await self.run(self.db.health_check)
+        health['async_workers'] = self.max_workers
+        return health
+    
+    def close(self):
+        """Stop accepting work; the underlying DatabaseManager stays open"""
+        self.executor.shutdown(wait=True)
+
+# Global instance
+async_db_manager = AsyncDatabaseManager()
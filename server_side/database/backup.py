@@ -0,0 +1,230 @@
+"""
+Online backups of smarttv.db through the SQLite backup API
+
+A backup copies a bounded number of pages per step and sleeps between
+steps, so the copy never holds a lock long enough to stall call signaling.
+The source connection keeps one read transaction open for the whole copy:
+in WAL mode that pins a consistent snapshot, so concurrent heartbeat writes
+neither tear the copy nor force the backup to restart.
+
+Each backup is written next to a manifest (<name>.json) with its SHA-256,
+size, page count and schema version. restore() checks the checksum before
+copying the snapshot back over the live database in a single step.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+from urllib.parse import quote
+from database.database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Outside the checkout, so snapshots are never committed or wiped by a redeploy
+DEFAULT_BACKUP_DIR = os.path.join(os.getenv('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'),
+                                  'smarttv', 'backups')
+BACKUP_PREFIX = 'smarttv-'
+
+# Row counts recorded in the manifest as a quick sanity check after restore
+MANIFEST_TABLES = ('users', 'calls', 'user_sessions', 'user_contacts', 'game_scores')
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def open_read_only(path: str) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True, isolation_level=None)
+
+class BackupError(RuntimeError):
+    """Raised when a backup cannot be created, verified or restored"""
+
+class BackupManager:
+    """Creates, lists, verifies, prunes and restores database snapshots"""
+    
+    def __init__(self, db=None, backup_dir: str = None, pages_per_step: int = None,
+                 step_sleep_ms: float = None, keep: int = None):
+        self.db = db or db_manager
+        self.backup_dir = backup_dir or os.getenv('DB_BACKUP_DIR', DEFAULT_BACKUP_DIR)
+        self.pages_per_step = pages_per_step or int(os.getenv('DB_BACKUP_PAGES_PER_STEP', 256))
+        if step_sleep_ms is None:
+            step_sleep_ms = float(os.getenv('DB_BACKUP_STEP_SLEEP_MS', 5))
+        self.step_sleep = step_sleep_ms / 1000
+        self.keep = keep if keep is not None else int(os.getenv('DB_BACKUP_KEEP', 7))
+        self._last_backup: Optional[Dict[str, Any]] = None
+        self._failures = 0
+    
+    def create_backup(self) -> Dict[str, Any]:
+        """Snapshot the live database; returns the backup's manifest"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        name = f"{BACKUP_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        path = os.path.join(self.backup_dir, f"{name}.db")
+        partial = f"{path}.partial"
+        started = time.perf_counter()
+        steps = 0
+        
+        def progress(status, remaining, total):
+            nonlocal steps
+            steps += 1
+        
+        try:
+            source = open_read_only(self.db.db_path)
+            target = sqlite3.connect(partial, isolation_level=None)
+            try:
+                # Pin one snapshot for the whole copy
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                source.backup(target, pages=self.pages_per_step, progress=progress, sleep=self.step_sleep)
+                source.execute("COMMIT")
+                
+                # A standalone file: no -wal sidecar needed to open it
+                target.execute("PRAGMA journal_mode = DELETE")
+                check = target.execute("PRAGMA quick_check").fetchone()[0]
+                if check != 'ok':
+                    raise BackupError(f"Backup failed quick_check: {check}")
+                
+                manifest = {
+                    'name': name,
+                    'file': os.path.basename(path),
+                    'created_at': datetime.now().isoformat(),
+                    'source': os.path.abspath(self.db.db_path),
+                    'schema_version': target.execute("PRAGMA user_version").fetchone()[0],
+                    'page_size': target.execute("PRAGMA page_size").fetchone()[0],
+                    'page_count': target.execute("PRAGMA page_count").fetchone()[0],
+                    'row_counts': {
+                        table: target.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                        for table in MANIFEST_TABLES
+                    },
+                }
+            finally:
+                target.close()
+                source.close()
+            
+            os.replace(partial, path)
+            manifest.update({
+                'size_bytes': os.path.getsize(path),
+                'sha256': file_sha256(path),
+                'pages_per_step': self.pages_per_step,
+                'steps': steps,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+            })
+            with open(self._manifest_path(name), 'w') as f:
+                json.dump(manifest, f, indent=2)
+        
+        except Exception:
+            self._failures += 1
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        
+        self._last_backup = manifest
+        logger.info(f"💾 Database backup {name}: {manifest['page_count']} pages in {steps} steps, "
+                    f"{manifest['elapsed_ms']}ms")
+        self.prune()
+        return manifest
+    
+    def list_backups(self) -> List[Dict[str, Any]]:
+        """Manifests of all backups, newest first"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        
+        manifests = []
+        for filename in os.listdir(self.backup_dir):
+            if filename.startswith(BACKUP_PREFIX) and filename.endswith('.json'):
+                with open(os.path.join(self.backup_dir, filename)) as f:
+                    manifests.append(json.load(f))
+        manifests.sort(key=lambda m: m['name'], reverse=True)
+        return manifests
+    
+    def get_manifest(self, name: str) -> Dict[str, Any]:
+        """Manifest for a backup name; 'latest' picks the newest backup"""
+        if name == 'latest':
+            backups = self.list_backups()
+            if not backups:
+                raise BackupError(f"No backups found in {self.backup_dir}")
+            return backups[0]
+        
+        name = os.path.basename(name)
+        if name.endswith('.db'):
+            name = name[:-3]
+        manifest_path = self._manifest_path(name)
+        if not os.path.exists(manifest_path):
+            raise BackupError(f"Unknown backup '{name}' in {self.backup_dir}")
+        with open(manifest_path) as f:
+            return json.load(f)
+    
+    def verify(self, name: str) -> Dict[str, Any]:
+        """Recompute a backup's checksum and compare it with its manifest"""
+        manifest = self.get_manifest(name)
+        path = os.path.join(self.backup_dir, manifest['file'])
+        if not os.path.exists(path):
+            raise BackupError(f"Backup file {path} is missing")
+        
+        actual = file_sha256(path)
+        if actual != manifest['sha256']:
+            raise BackupError(f"Checksum mismatch for {manifest['name']}: "
+                              f"manifest {manifest['sha256']}, file {actual}")
+        return manifest
+    
+    def restore(self, name: str, target_path: str = None) -> Dict[str, Any]:
+        """Copy a verified backup over target_path (the live database by default)
+
+        Runs as one backup step through SQLite, so existing -wal/-shm files
+        stay consistent with the restored pages. Stop the server first:
+        pooled connections would keep serving their cached schema.
+        """
+        manifest = self.verify(name)
+        target_path = target_path or self.db.db_path
+        started = time.perf_counter()
+        
+        source = open_read_only(os.path.join(self.backup_dir, manifest['file']))
+        target = sqlite3.connect(target_path, isolation_level=None)
+        try:
+            source.backup(target, pages=-1)
+        finally:
+            target.close()
+            source.close()
+        
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        if os.path.abspath(target_path) == os.path.abspath(self.db.db_path):
+            self.db.table_versions.bump_all()
+        logger.info(f"♻️ Restored {manifest['name']} to {target_path} in {elapsed_ms}ms")
+        return dict(manifest, restored_to=os.path.abspath(target_path), restore_ms=elapsed_ms)
+    
+    def prune(self) -> int:
+        """Delete all but the newest ``keep`` backups; returns backups removed"""
+        if self.keep <= 0:
+            return 0
+        
+        removed = 0
+        for manifest in self.list_backups()[self.keep:]:
+            for path in (os.path.join(self.backup_dir, manifest['file']), self._manifest_path(manifest['name'])):
+                if os.path.exists(path):
+                    os.remove(path)
+            removed += 1
+        return removed
+    
+    def stats(self) -> Dict[str, Any]:
+        """Backup settings and the most recent result"""
+        return {
+            'backup_dir': self.backup_dir,
+            'pages_per_step': self.pages_per_step,
+            'step_sleep_ms': self.step_sleep * 1000,
+            'keep': self.keep,
+            'backups': len(self.list_backups()),
+            'failures': self._failures,
+            'last_backup': self._last_backup
+        }
+    
+    def _manifest_path(self, name: str) -> str:
+        return os.path.join(self.backup_dir, f"{name}.json")
+
+# Global instance
+backup_manager = BackupManager()
@@ -0,0 +1,183 @@
+"""
+Lock contention handling for DatabaseManager
+
+SQLite reports a lost lock race as SQLITE_BUSY or SQLITE_LOCKED. busy_timeout
+already makes a statement wait for the lock, but some busy results come back
+without waiting: a deferred transaction that cannot upgrade to a writer, a
+WAL snapshot that went stale, or recovery after a crash. Those clear up
+within milliseconds. Statements that are safe to run again are retried a few
+times with jittered exponential backoff. A lock error that persists is raised
+as DatabaseBusyError, so routes can answer 503 with Retry-After instead of 500.
+
+Lock waits, retries and lock errors are counted per endpoint. Flask sets the
+endpoint name for each request; other threads are counted under their
+thread name.
+"""
+
+import os
+import random
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Dict, Any, Optional
+from database.pool import PoolTimeoutError
+
+# Extended result codes (sqlite3 exceptions carry them from Python 3.11)
+LOCK_ERROR_KINDS = {
+    'SQLITE_BUSY': 'busy',
+    'SQLITE_BUSY_RECOVERY': 'busy_recovery',
+    'SQLITE_BUSY_SNAPSHOT': 'busy_snapshot',
+    'SQLITE_BUSY_TIMEOUT': 'busy_timeout',
+    'SQLITE_LOCKED': 'locked',
+    'SQLITE_LOCKED_SHAREDCACHE': 'locked',
+}
+
+# Kinds worth retrying: the lock is usually free again within milliseconds.
+# busy_timeout means SQLite already waited the full busy timeout, and
+# pool_timeout means every pooled connection stayed checked out.
+RETRYABLE_KINDS = ('busy', 'busy_recovery', 'busy_snapshot', 'locked')
+
+# A statement that failed on a lock did not apply, but only statements that
+# give the same result when run twice are retried. Plain INSERTs are left to
+# the caller.
+_IDEMPOTENT_RE = re.compile(
+    r'^\s*(?:SELECT|WITH|PRAGMA|BEGIN|COMMIT|UPDATE|DELETE|REPLACE|INSERT\s+OR\s+(?:REPLACE|IGNORE))\b',
+    re.IGNORECASE
+)
+_UPSERT_RE = re.compile(r'\bON\s+CONFLICT\b.*\bDO\s+(?:UPDATE|NOTHING)\b', re.IGNORECASE | re.DOTALL)
+
+# Endpoints beyond this many are counted under OTHER_ENDPOINTS
+DEFAULT_MAX_ENDPOINTS = 200
+OTHER_ENDPOINTS = '(other endpoints)'
+
+class DatabaseBusyError(sqlite3.OperationalError):
+    """A statement kept failing on a database lock, or no connection was free"""
+    
+    def __init__(self, message: str, kind: str, attempts: int):
+        super().__init__(message)
+        self.kind = kind
+        self.attempts = attempts
+
+def classify_lock_error(exc: BaseException) -> Optional[str]:
+    """Lock error kind for an exception, or None if it is not lock contention"""
+    if isinstance(exc, DatabaseBusyError):
+        return exc.kind
+    if isinstance(exc, PoolTimeoutError):
+        return 'pool_timeout'
+    if not isinstance(exc, sqlite3.OperationalError):
+        return None
+    
+    kind = LOCK_ERROR_KINDS.get(getattr(exc, 'sqlite_errorname', None))
+    if kind:
+        return kind
+    message = str(exc).lower()
+    if 'database is locked' in message:
+        return 'busy'
+    if 'table is locked' in message or 'schema is locked' in message:
+        return 'locked'
+    return None
+
+@lru_cache(maxsize=1024)
+def is_idempotent(query: str) -> bool:
+    """Whether running the statement a second time gives the same result"""
+    return bool(_IDEMPOTENT_RE.match(query) or _UPSERT_RE.search(query))
+
+class RetryPolicy:
+    """Bounded retries with full-jitter exponential backoff"""
+    
+    def __init__(self, attempts: int = None, base_ms: float = None, max_ms: float = None):
+        self.attempts = attempts if attempts is not None else int(os.getenv('DB_RETRY_ATTEMPTS', 3))
+        self.base_ms = base_ms or float(os.getenv('DB_RETRY_BASE_MS', 10))
+        self.max_ms = max_ms or float(os.getenv('DB_RETRY_MAX_MS', 200))
+    
+    def delay(self, retry: int) -> float:
+        """Seconds to sleep before retry number ``retry`` (0-based)"""
+        return random.uniform(0, min(self.max_ms, self.base_ms * 2 ** retry)) / 1000
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {'attempts': self.attempts, 'base_ms': self.base_ms, 'max_ms': self.max_ms}
+
+_context = threading.local()
+
+def set_endpoint(name: Optional[str]):
+    """Attribute this thread's statements to an endpoint (None clears it)"""
+    _context.endpoint = name
+
+def current_endpoint() -> str:
+    return getattr(_context, 'endpoint', None) or threading.current_thread().name
+
+class EndpointContention:
+    """Counters for one endpoint"""
+    
+    __slots__ = ('statements', 'lock_wait_ms', 'max_lock_wait_ms', 'retries', 'recovered', 'failed', 'errors')
+    
+    def __init__(self):
+        self.statements = 0
+        self.lock_wait_ms = 0.0
+        self.max_lock_wait_ms = 0.0
+        self.retries = 0
+        self.recovered = 0
+        self.failed = 0
+        self.errors: Dict[str, int] = {}
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'statements': self.statements,
+            'lock_wait_ms': round(self.lock_wait_ms, 3),
+            'avg_lock_wait_ms': round(self.lock_wait_ms / self.statements, 3) if self.statements else 0.0,
+            'max_lock_wait_ms': round(self.max_lock_wait_ms, 3),
+            'retries': self.retries,
+            'recovered': self.recovered,
+            'failed': self.failed,
+            'lock_errors': dict(self.errors)
+        }
+
+class ContentionStats:
+    """Per-endpoint lock wait, retry and lock error counters"""
+    
+    def __init__(self, max_endpoints: int = DEFAULT_MAX_ENDPOINTS):
+        self.max_endpoints = max_endpoints
+        self._endpoints: Dict[str, EndpointContention] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, lock_wait_ms: float, errors=(), retries: int = 0, failed: bool = False):
+        """Count one statement; errors are the lock error kinds it hit, retried or not"""
+        endpoint = current_endpoint()
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                if len(self._endpoints) >= self.max_endpoints:
+                    endpoint = OTHER_ENDPOINTS
+                stats = self._endpoints.setdefault(endpoint, EndpointContention())
+            stats.statements += 1
+            stats.lock_wait_ms += lock_wait_ms
+            if lock_wait_ms > stats.max_lock_wait_ms:
+                stats.max_lock_wait_ms = lock_wait_ms
+            for kind in errors:
+                stats.errors[kind] = stats.errors.get(kind, 0) + 1
+            stats.retries += retries
+            if failed:
+                stats.failed += 1
+            elif retries:
+                stats.recovered += 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Endpoints ordered by total lock wait, plus totals"""
+        with self._lock:
+            endpoints = {name: stats.to_dict() for name, stats in self._endpoints.items()}
+        
+        totals = {'statements': 0, 'lock_wait_ms': 0.0, 'retries': 0, 'recovered': 0, 'failed': 0, 'lock_errors': {}}
+        for stats in endpoints.values():
+            for key in ('statements', 'lock_wait_ms', 'retries', 'recovered', 'failed'):
+                totals[key] += stats[key]
+            for kind, count in stats['lock_errors'].items():
+                totals['lock_errors'][kind] = totals['lock_errors'].get(kind, 0) + count
+        totals['lock_wait_ms'] = round(totals['lock_wait_ms'], 3)
+        
+        ordered = sorted(endpoints.items(), key=lambda item: item[1]['lock_wait_ms'], reverse=True)
+        return {'totals': totals, 'endpoints': dict(ordered)}
+    
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
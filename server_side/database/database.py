@@ -1,16 +1,142 @@
 import sqlite3
 import os
+import re
 import logging
+import shutil
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from urllib.parse import quote
 from typing import Optional, Dict, Any
 import json
 
+from database.pool import ConnectionPool
+from database.migrator import MigrationRunner
+from database.query_stats import QueryStats
+from database.records import fetch_records
+from database.contention import (ContentionStats, DatabaseBusyError, RetryPolicy, RETRYABLE_KINDS,
+                                 classify_lock_error, is_idempotent)
+from database.result_cache import ResultCache, TableVersions, read_tables, written_tables
+from database.timestamps import sql_epoch_ms
+
 logger = logging.getLogger(__name__)
 
+# Named PRAGMA profiles applied once to every new connection.
+# 'wal' lets heartbeat writers and API readers run concurrently;
+# 'legacy' reproduces SQLite's defaults (rollback journal) for comparison.
+STORAGE_PROFILES = {
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,       # milliseconds
+        'cache_size': -16000,       # negative = KiB, i.e. ~16 MB per connection
+        'mmap_size': 67108864,      # 64 MB
+        'temp_store': 'MEMORY'
+    },
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT'
+    }
+}
+
+# Order matters: journal_mode must be set before synchronous takes effect
+PRAGMA_ORDER = ('busy_timeout', 'journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store')
+
+_PRAGMA_VALUE_RE = re.compile(r'^-?[A-Za-z0-9_]+$')
+_SYNCHRONOUS_NAMES = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+_TEMP_STORE_NAMES = {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'}
+_AUTO_VACUUM_NAMES = {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}
+
+# Leaf pages per table/index, and how many do not directly follow their
+# predecessor in key order; needs SQLITE_ENABLE_DBSTAT_VTAB
+_DBSTAT_QUERY = """
+    SELECT name, COUNT(*) AS pages, SUM(unused) AS unused, SUM(pgsize) AS bytes,
+           SUM(CASE WHEN pagetype = 'leaf' THEN 1 ELSE 0 END) AS leaf_pages,
+           SUM(CASE WHEN pagetype = 'leaf' AND prev_leaf IS NOT NULL AND pageno != prev_leaf + 1
+                    THEN 1 ELSE 0 END) AS out_of_order
+    FROM (
+        SELECT name, pageno, pagetype, unused, pgsize,
+               LAG(CASE WHEN pagetype = 'leaf' THEN pageno END)
+                   OVER (PARTITION BY name, pagetype = 'leaf' ORDER BY path) AS prev_leaf
+        FROM dbstat
+    )
+    GROUP BY name
+    ORDER BY bytes DESC
+"""
+_INSERT_RE = re.compile(r'^\s*(INSERT|REPLACE)\b', re.IGNORECASE)
+
+# user_presence is rewritten by every heartbeat. With PRESENCE_DB_PATH set it
+# lives in its own file, attached to every connection under this schema name;
+# unqualified references to user_presence resolve to it once main has none.
+PRESENCE_SCHEMA = 'presence'
+PRESENCE_DDL = """
+    CREATE TABLE IF NOT EXISTS {schema}.user_presence (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER UNIQUE NOT NULL,
+        status TEXT DEFAULT 'offline',
+        last_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
+        socket_id TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_ms INTEGER
+    );
+"""
+# Created once updated_ms exists; tables from before it get the column first
+PRESENCE_INDEX_DDL = """
+    CREATE INDEX IF NOT EXISTS {schema}.idx_user_presence_status_updated_ms
+        ON user_presence(status, updated_ms, user_id);
+    DROP INDEX IF EXISTS {schema}.idx_user_presence_status_updated;
+"""
+PRESENCE_COLUMNS = 'id, user_id, status, last_seen, socket_id, updated_at, updated_ms'
+
+def resolve_storage_profile(profile=None) -> Dict[str, Any]:
+    """Build the PRAGMA settings for a profile name or dict, applying env overrides
+
+    Any setting can be overridden with DB_PRAGMA_<NAME>, e.g. DB_PRAGMA_MMAP_SIZE=0.
+    """
+    if profile is None:
+        profile = os.getenv('DB_STORAGE_PROFILE', 'wal')
+    
+    if isinstance(profile, str):
+        if profile not in STORAGE_PROFILES:
+            raise ValueError(f"Unknown storage profile '{profile}', expected one of {sorted(STORAGE_PROFILES)}")
+        settings = dict(STORAGE_PROFILES[profile], profile=profile)
+    else:
+        settings = dict(STORAGE_PROFILES['wal'], **profile)
+        settings.setdefault('profile', 'custom')
+    
+    for name in PRAGMA_ORDER:
+        override = os.getenv(f'DB_PRAGMA_{name.upper()}')
+        if override:
+            settings[name] = override
+    
+    for name in PRAGMA_ORDER:
+        if not _PRAGMA_VALUE_RE.match(str(settings[name])):
+            raise ValueError(f"Invalid value for PRAGMA {name}: {settings[name]!r}")
+    
+    return settings
+
+def _row_count(query: str, fetch: str, result) -> int:
+    """Rows returned (reads) or affected (writes) by one execute_query call"""
+    if fetch in ('all', 'records'):
+        return len(result)
+    if fetch == 'one':
+        return 0 if result is None else 1
+    if _INSERT_RE.match(query):
+        return 1
+    return max(result, 0)
+
 class DatabaseManager:
     """SQLite database manager for SmartTV application"""
     
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, pool_size: int = None, pool_timeout: float = None,
+                 storage_profile=None, presence_path: str = None):
+        if db_path is None:
+            db_path = os.getenv('SMARTTV_DB_PATH')
         if db_path is None:
             # Default to database folder in server_side directory
             db_dir = os.path.join(os.path.dirname(__file__))
@@ -18,68 +144,537 @@ class DatabaseManager:
             db_path = os.path.join(db_dir, 'smarttv.db')
         
         self.db_path = db_path
+        self.storage_profile = resolve_storage_profile(storage_profile)
+        # Separate presence database (e.g. on tmpfs); None keeps presence in the main file
+        self.presence_path = presence_path or os.getenv('PRESENCE_DB_PATH') or None
+        if self.presence_path and (self.presence_path == ':memory:' or self.presence_path.startswith('file:')):
+            # Every pooled connection would get its own private, empty database
+            raise ValueError(f"PRESENCE_DB_PATH must be a file path, not {self.presence_path!r}; "
+                             f"use a tmpfs path such as /dev/shm/smarttv-presence.db to keep presence in RAM")
+        self.busy_timeout_ms = int(self.storage_profile['busy_timeout'])
+        self.presence_synchronous = os.getenv('PRESENCE_DB_SYNCHRONOUS', 'OFF')
+        if not _PRAGMA_VALUE_RE.match(self.presence_synchronous):
+            raise ValueError(f"Invalid value for PRESENCE_DB_SYNCHRONOUS: {self.presence_synchronous!r}")
+        self._local = threading.local()  # per-thread (or greenlet) open transaction
+        self.pool = ConnectionPool(
+            self._create_connection,
+            max_size=pool_size or int(os.getenv('DB_POOL_SIZE', 8)),
+            timeout=pool_timeout or float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            name='smarttv'
+        )
+        # Admin and reporting reads get their own smaller pool of read-only
+        # connections, so a large listing never holds a connection that call
+        # signaling is waiting for
+        self.read_pool = ConnectionPool(
+            self._create_read_connection,
+            max_size=int(os.getenv('DB_READ_POOL_SIZE', 2)),
+            timeout=float(os.getenv('DB_READ_POOL_TIMEOUT', 30)),
+            name='smarttv-read'
+        )
+        self.read_yield_steps = int(os.getenv('DB_READ_YIELD_STEPS', 1000))
+        self.query_stats = QueryStats()
+        self.retry_policy = RetryPolicy()
+        self.contention = ContentionStats()
+        self.table_versions = TableVersions()
+        self.result_cache = ResultCache(self.table_versions)
+        # Last dbstat breakdown; the scan reads every page, so it is taken in the background
+        self._page_scan: Optional[Dict[str, Any]] = None
         self.init_database()
     
-    def get_connection(self) -> sqlite3.Connection:
-        """Get a database connection with row factory"""
-        conn = sqlite3.connect(self.db_path)
+    def _create_connection(self) -> sqlite3.Connection:
+        """Open a new connection configured for use by any pool thread"""
+        # Autocommit mode: statements commit individually unless transaction() issues BEGIN
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
         conn.row_factory = sqlite3.Row  # Enable column access by name
+        # Only sticks on a brand-new file (before journal_mode writes the header);
+        # existing databases switch with full_vacuum()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._apply_storage_profile(conn)
+        if self.presence_path:
+            self._attach_presence(conn)
+        return conn
+    
+    def _create_read_connection(self) -> sqlite3.Connection:
+        """Open a read-only connection for the read pool"""
+        uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        # journal_mode and synchronous belong to the writer; a read-only
+        # connection can neither set nor needs them
+        for name in ('busy_timeout', 'cache_size', 'mmap_size', 'temp_store'):
+            conn.execute(f"PRAGMA {name} = {self.storage_profile[name]}")
+        if self.presence_path:
+            self._attach_presence(conn, read_only=True)
+        if self.read_yield_steps > 0:
+            conn.set_progress_handler(self._yield_to_writers, self.read_yield_steps)
         return conn
     
+    def _attach_presence(self, conn: sqlite3.Connection, read_only: bool = False):
+        """Attach the presence database with its own, weaker durability settings
+        
+        Presence is rebuilt by the next round of heartbeats, so losing the
+        last writes on power loss is acceptable: synchronous defaults to OFF.
+        """
+        if read_only:
+            target = f"file:{quote(os.path.abspath(self.presence_path))}?mode=ro"
+        else:
+            target = self.presence_path
+        conn.execute(f"ATTACH DATABASE ? AS {PRESENCE_SCHEMA}", (target,))
+        if not read_only:
+            conn.execute(f"PRAGMA {PRESENCE_SCHEMA}.journal_mode = WAL")
+            conn.execute(f"PRAGMA {PRESENCE_SCHEMA}.synchronous = {self.presence_synchronous}")
+    
+    def _yield_to_writers(self) -> int:
+        """Progress handler for read connections: let the write path run first
+        
+        Called every read_yield_steps SQLite VM instructions. While any
+        read-write connection is in use or awaited, sleep(0) hands the GIL
+        (or, under eventlet/gevent, the hub) to the waiting writer.
+        """
+        if self.pool.busy():
+            time.sleep(0)
+        return 0
+    
+    def _apply_storage_profile(self, conn: sqlite3.Connection):
+        """Apply the configured PRAGMA profile to a freshly opened connection"""
+        for name in PRAGMA_ORDER:
+            conn.execute(f"PRAGMA {name} = {self.storage_profile[name]}")
+    
+    def get_storage_settings(self) -> Dict[str, Any]:
+        """Read back the PRAGMA settings that are active on a pooled connection"""
+        with self.pool.connection() as conn:
+            active = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in PRAGMA_ORDER}
+        
+        active['synchronous'] = _SYNCHRONOUS_NAMES.get(active['synchronous'], active['synchronous'])
+        active['temp_store'] = _TEMP_STORE_NAMES.get(active['temp_store'], active['temp_store'])
+        active['journal_mode'] = str(active['journal_mode']).upper()
+        active['profile'] = self.storage_profile['profile']
+        active['presence_db'] = os.path.abspath(self.presence_path) if self.presence_path else 'main'
+        if self.presence_path:
+            active['presence_synchronous'] = self.presence_synchronous.upper()
+        return active
+    
+    def get_fragmentation_stats(self, scan_pages: bool = False) -> Dict[str, Any]:
+        """Freelist size plus per-table fill and leaf ordering from dbstat
+        
+        fragmentation_ratio is the share of leaf pages that are not stored
+        right after the previous leaf of the same table, i.e. the extra
+        seeks a full scan pays; unused_ratio is the share of allocated bytes
+        holding no data. The dbstat scan reads the whole file, so it only
+        runs with scan_pages=True (the background vacuum job); otherwise the
+        last scan is reported with its scanned_at time.
+        """
+        with self.read_pool.connection() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            if scan_pages:
+                try:
+                    objects = conn.execute(_DBSTAT_QUERY).fetchall()
+                except sqlite3.OperationalError:
+                    objects = None  # SQLite built without the dbstat table
+        
+        wal_path = f"{self.db_path}-wal"
+        stats = {
+            'auto_vacuum': _AUTO_VACUUM_NAMES.get(auto_vacuum, auto_vacuum),
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_count': freelist_count,
+            'free_ratio': round(freelist_count / page_count, 4) if page_count else 0.0,
+            'reclaimable_bytes': freelist_count * page_size,
+            'file_bytes': os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,
+            'wal_bytes': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            'fragmentation_ratio': None,
+            'tables': None,
+            'scanned_at': None
+        }
+        
+        if scan_pages:
+            scan = {'fragmentation_ratio': None, 'tables': None, 'scanned_at': datetime.now().isoformat()}
+            if objects is not None:
+                leaf_pages = sum(row['leaf_pages'] for row in objects)
+                out_of_order = sum(row['out_of_order'] for row in objects)
+                scan['fragmentation_ratio'] = round(out_of_order / leaf_pages, 4) if leaf_pages else 0.0
+                scan['tables'] = {
+                    row['name']: {
+                        'pages': row['pages'],
+                        'unused_ratio': round(row['unused'] / row['bytes'], 4) if row['bytes'] else 0.0,
+                        'fragmentation_ratio': round(row['out_of_order'] / row['leaf_pages'], 4) if row['leaf_pages'] else 0.0
+                    }
+                    for row in objects
+                }
+            self._page_scan = scan
+        
+        if self._page_scan:
+            stats.update(self._page_scan)
+        return stats
+    
+    def incremental_vacuum(self, max_pages: int) -> Dict[str, Any]:
+        """Return up to max_pages free pages to the filesystem
+        
+        A no-op unless the database uses auto_vacuum=INCREMENTAL (new files,
+        or older ones after full_vacuum()). Each call is one short write transaction, so it can run while
+        the server is live.
+        """
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return {'pages_freed': 0, 'skipped': 'auto_vacuum is not INCREMENTAL'}
+            
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if before:
+                # The pragma frees one page per VM step, but Cursor.execute() stops
+                # after the first step for statements without result columns;
+                # executescript() steps it to completion
+                conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+                # Let the shrunken file reach disk without waiting on readers
+                conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+            after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        
+        return {
+            'pages_freed': before - after,
+            'freelist_before': before,
+            'freelist_after': after,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    
+    def full_vacuum(self, min_free_ratio: float = 2.0) -> Dict[str, Any]:
+        """Rewrite the database with a full VACUUM, switching it to auto_vacuum=INCREMENTAL
+        
+        Needed once for databases created before migration 0004. VACUUM holds
+        the write lock until it finishes and needs about twice the file size
+        free on disk (the rebuilt copy plus the WAL), so it is refused when
+        less than min_free_ratio times the file size is available.
+        """
+        file_bytes = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        free_bytes = shutil.disk_usage(os.path.dirname(os.path.abspath(self.db_path))).free
+        if free_bytes < file_bytes * min_free_ratio:
+            logger.warning(f"🧽 Full vacuum skipped: {free_bytes / 1024 / 1024:.1f} MB free, "
+                           f"{file_bytes * min_free_ratio / 1024 / 1024:.1f} MB needed")
+            return {'vacuumed': False, 'skipped': 'not enough free disk space',
+                    'file_bytes': file_bytes, 'free_bytes': free_bytes}
+        
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            mode_before = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            logger.info(f"🧽 Full vacuum of {self.db_path} ({file_bytes / 1024 / 1024:.1f} MB, "
+                           f"auto_vacuum={_AUTO_VACUUM_NAMES.get(mode_before, mode_before)}) started; "
+                           f"writes wait until it finishes")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            mode_after = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        
+        result = {
+            'vacuumed': True,
+            'auto_vacuum_before': _AUTO_VACUUM_NAMES.get(mode_before, mode_before),
+            'auto_vacuum_after': _AUTO_VACUUM_NAMES.get(mode_after, mode_after),
+            'bytes_before': file_bytes,
+            'bytes_after': os.path.getsize(self.db_path),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+        logger.info(f"🧽 Full vacuum finished in {result['elapsed_ms']}ms: "
+                       f"{result['bytes_before']} -> {result['bytes_after']} bytes, "
+                       f"auto_vacuum={result['auto_vacuum_after']}")
+        return result
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """Get a dedicated (unpooled) database connection with row factory"""
+        return self._create_connection()
+    
     def init_database(self):
-        """Initialize database with schema"""
+        """Bring the schema up to date by applying any pending migrations"""
         try:
-            schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
+            with self.pool.connection() as conn:
+                runner = MigrationRunner(conn)
+                current = runner.current_version()
             
-            with open(schema_path, 'r') as f:
-                schema_sql = f.read()
+                if current >= runner.latest_version:
+                    logger.info(f"Database schema current (v{current}) at {self.db_path}")
+                else:
+                    applied = runner.migrate()
+                    logger.info(f"Database initialized at {self.db_path}: migrated v{current} -> "
+                                f"v{runner.current_version()} ({len(applied)} migrations)")
             
-            with self.get_connection() as conn:
-                conn.executescript(schema_sql)
-                conn.commit()
-                logger.info(f"Database initialized at {self.db_path}")
-                
+            self._init_presence_store()
+        
         except Exception as e:
             logger.error(f"Failed to initialize database: {e}")
             raise
     
+    def _init_presence_store(self):
+        """Create user_presence where it belongs and move rows left behind in main"""
+        with self.pool.connection() as conn:
+            if not self.presence_path:
+                # Also recreates the table if presence was split out earlier
+                conn.executescript(PRESENCE_DDL.format(schema='main'))
+                self._upgrade_presence_table(conn, 'main')
+                return
+            
+            conn.executescript(PRESENCE_DDL.format(schema=PRESENCE_SCHEMA))
+            self._upgrade_presence_table(conn, PRESENCE_SCHEMA)
+            in_main = conn.execute(
+                "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'user_presence'"
+            ).fetchone()
+            if not in_main:
+                return
+            self._upgrade_presence_table(conn, 'main')
+            
+            # Only hand the rows over to a file every connection shares
+            attached_file = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}.get(PRESENCE_SCHEMA)
+            if not attached_file:
+                raise RuntimeError(f"Presence database {self.presence_path!r} is not a file; "
+                                   f"keeping main.user_presence")
+            
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                expected = conn.execute("SELECT COUNT(*) FROM main.user_presence").fetchone()[0]
+                moved = conn.execute(
+                    f"""INSERT OR REPLACE INTO {PRESENCE_SCHEMA}.user_presence ({PRESENCE_COLUMNS})
+                        SELECT {PRESENCE_COLUMNS} FROM main.user_presence"""
+                ).rowcount
+                if moved != expected:
+                    raise RuntimeError(f"Copied {moved} of {expected} presence rows; keeping main.user_presence")
+                conn.execute("DROP TABLE main.user_presence")
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            logger.info(f"Moved {moved} presence rows to {self.presence_path}")
+    
+    def _upgrade_presence_table(self, conn: sqlite3.Connection, schema: str):
+        """Add and backfill updated_ms on a user_presence table created before it existed"""
+        columns = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(user_presence)")}
+        if 'updated_ms' not in columns:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(f"ALTER TABLE {schema}.user_presence ADD COLUMN updated_ms INTEGER")
+                backfilled = conn.execute(
+                    f"UPDATE {schema}.user_presence SET updated_ms = {sql_epoch_ms('updated_at')}"
+                ).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            logger.info(f"Added updated_ms to {schema}.user_presence ({backfilled} rows)")
+        conn.executescript(PRESENCE_INDEX_DDL.format(schema=schema))
+    
+    def get_schema_version(self) -> int:
+        """Current schema version (PRAGMA user_version)"""
+        with self.pool.connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+    
     def execute_query(self, query: str, params: tuple = (), fetch: str = None):
-        """Execute a query with optional fetch mode"""
+        """Execute a query with optional fetch mode
+        
+        Inside transaction() the statement runs on the transaction's connection.
+        fetch='records' returns lightweight Record tuples (see database.records)
+        instead of sqlite3.Row objects. Writes return the new row id for
+        INSERT/REPLACE and the affected row count for UPDATE/DELETE.
+        Outside a transaction, idempotent statements that hit a transient lock
+        error are retried with jittered backoff (see database.contention);
+        a lock error that persists raises DatabaseBusyError.
+        """
+        return self._execute(self.pool, query, params, fetch, getattr(self._local, 'conn', None))
+    
+    def execute_read(self, query: str, params: tuple = (), fetch: str = 'all'):
+        """Run a read on the read-only pool (admin listings, reports, statistics)
+        
+        Same fetch modes as execute_query(). The connection is opened with
+        mode=ro and query_only, so any write raises. It never joins an open
+        transaction() and only sees committed data.
+        """
+        return self._execute(self.read_pool, query, params, fetch)
+    
+    def execute_cached(self, query: str, params: tuple = (), fetch: str = 'all',
+                       max_age: float = None, read_only: bool = False):
+        """Run a SELECT through the result cache (see database.result_cache)
+        
+        The result is reused until a committed write touches one of the tables
+        the query reads, or until max_age seconds pass (RESULT_CACHE_MAX_AGE by
+        default; pass a short max_age for queries using datetime('now')).
+        Cached results are shared between callers and must not be mutated.
+        read_only=True loads misses through execute_read(). Inside
+        transaction() the cache is bypassed so the caller sees its own writes.
+        """
+        if getattr(self._local, 'conn', None) is not None:
+            return self.execute_query(query, params, fetch)
+        
+        params = tuple(params)
+        load = self.execute_read if read_only else self.execute_query
+        return self.result_cache.get_or_load(
+            (fetch, query, params), read_tables(query),
+            lambda: load(query, params, fetch), max_age
+        )
+    
+    def mark_written(self, *tables: str):
+        """Invalidate cached reads of these tables; deferred to COMMIT inside transaction()
+        
+        execute_query() calls this for every write it runs. Code that writes
+        through a raw connection (executemany in a transaction) calls it itself.
+        """
+        written = getattr(self._local, 'written', None)
+        if written is not None:
+            written.update(tables)
+        else:
+            self.table_versions.bump(tables)
+    
+    def _execute(self, pool: ConnectionPool, query: str, params: tuple, fetch: str,
+                 conn: sqlite3.Connection = None):
+        def attempt():
+            if conn is not None:
+                return self._run_query(conn, query, params, fetch), 0.0
+            acquire_started = time.perf_counter()
+            with pool.connection() as pooled:
+                waited = time.perf_counter() - acquire_started
+                return self._run_query(pooled, query, params, fetch), waited
+        
+        # Inside transaction() only the whole unit of work could be retried
+        retryable = conn is None and is_idempotent(query)
+        started = time.perf_counter()
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(query, params)
-                
-                if fetch == 'one':
-                    return cursor.fetchone()
-                elif fetch == 'all':
-                    return cursor.fetchall()
-                else:
-                    conn.commit()
-                    return cursor.lastrowid
-                    
+            result, lock_wait, errors, retries = self._run_with_retries(attempt, query, retryable)
+        
         except Exception as e:
+            self.query_stats.record(query, params, (time.perf_counter() - started) * 1000,
+                                    lock_wait_ms=getattr(e, 'lock_wait_ms', 0.0), error=True)
             logger.error(f"Database query failed: {e}")
             raise
+        
+        self.query_stats.record(query, params, (time.perf_counter() - started) * 1000,
+                                _row_count(query, fetch, result), lock_wait * 1000)
+        self.contention.record(lock_wait * 1000, errors, retries)
+        tables = written_tables(query)
+        if tables:
+            self.mark_written(*tables)
+        return result
+    
+    def _run_with_retries(self, attempt, statement: str, retryable: bool):
+        """Call attempt() until it succeeds, retrying transient lock errors
+        
+        attempt() returns (result, seconds spent waiting for a connection).
+        Returns (result, seconds waited on locks, lock error kinds hit,
+        retries). A lock error that is final is counted and raised as
+        DatabaseBusyError; other exceptions propagate unchanged.
+        """
+        lock_wait = 0.0
+        errors = []
+        retries = 0
+        while True:
+            attempt_started = time.perf_counter()
+            try:
+                result, waited = attempt()
+                return result, lock_wait + waited, errors, retries
+            except Exception as e:
+                kind = classify_lock_error(e)
+                if kind is None:
+                    raise
+                if kind == 'busy' and (time.perf_counter() - attempt_started) * 1000 >= self.busy_timeout_ms:
+                    # SQLite already waited out busy_timeout for this one
+                    kind = 'busy_timeout'
+                errors.append(kind)
+                lock_wait += time.perf_counter() - attempt_started
+                
+                if retryable and kind in RETRYABLE_KINDS and retries < self.retry_policy.attempts:
+                    delay = self.retry_policy.delay(retries)
+                    time.sleep(delay)
+                    lock_wait += delay
+                    retries += 1
+                    continue
+                
+                self.contention.record(lock_wait * 1000, errors, retries, failed=True)
+                error = DatabaseBusyError(f"{e} ({kind} after {retries + 1} attempts)", kind, retries + 1)
+                error.lock_wait_ms = lock_wait * 1000
+                raise error from e
+    
+    def _run_query(self, conn: sqlite3.Connection, query: str, params: tuple, fetch: str):
+        if fetch == 'records':
+            return fetch_records(conn, query, params)
+        
+        cursor = conn.execute(query, params)
+        
+        if fetch == 'one':
+            return cursor.fetchone()
+        elif fetch == 'all':
+            return cursor.fetchall()
+        elif _INSERT_RE.match(query):
+            return cursor.lastrowid
+        else:
+            return cursor.rowcount
+    
+    @contextmanager
+    def transaction(self, immediate: bool = True):
+        """Unit of work: run several statements atomically on one connection
+        
+        Opens the write transaction with BEGIN IMMEDIATE so concurrent writers
+        serialize up front instead of failing on lock upgrade. That takes the
+        write lock of every attached database file; immediate=False defers
+        each lock to the first write on its file, so a transaction that starts
+        by writing presence rows does not hold the main database's lock. Every
+        execute_query() made by the same thread inside the block joins the
+        transaction; nested transaction() blocks join the outermost one.
+        Commits on success and rolls back on any exception. Cached results
+        of the tables written are invalidated after COMMIT. BEGIN and COMMIT
+        are retried on transient lock errors; statements inside are not.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        
+        begin = "BEGIN IMMEDIATE" if immediate else "BEGIN"
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            _, _, errors, retries = self._run_with_retries(lambda: (conn.execute(begin), 0.0), begin, True)
+            # Waiting for a connection and for the write lock is all lock wait
+            lock_wait = (time.perf_counter() - started) * 1000
+            self.query_stats.record(begin, (), lock_wait, lock_wait_ms=lock_wait)
+            self.contention.record(lock_wait, errors, retries)
+            self._local.conn = conn
+            self._local.written = written = set()
+            try:
+                yield conn
+                # A COMMIT that hit a lock leaves the transaction open and can be retried
+                self._run_with_retries(lambda: (conn.execute("COMMIT"), 0.0), "COMMIT", True)
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._local.conn = None
+                self._local.written = None
+            # Only committed writes invalidate cached results
+            if written:
+                self.table_versions.bump(written)
     
     def health_check(self) -> Dict[str, Any]:
         """Perform database health check"""
         try:
-            with self.get_connection() as conn:
+            with self.pool.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT COUNT(*) as user_count FROM users")
                 user_count = cursor.fetchone()['user_count']
                 
                 cursor.execute("SELECT COUNT(*) as active_sessions FROM user_sessions WHERE is_active = 1")
                 active_sessions = cursor.fetchone()['active_sessions']
-                
-                return {
-                    'status': 'healthy',
-                    'db_path': self.db_path,
-                    'total_users': user_count,
-                    'active_sessions': active_sessions,
-                    'timestamp': datetime.now().isoformat()
-                }
+            
+            return {
+                'status': 'healthy',
+                'db_path': self.db_path,
+                'total_users': user_count,
+                'active_sessions': active_sessions,
+                'schema_version': self.get_schema_version(),
+                'storage': self.get_storage_settings(),
+                'pool': self.pool.stats(),
+                'read_pool': self.read_pool.stats(),
+                'result_cache': self.result_cache.stats(),
+                'fragmentation': self.get_fragmentation_stats(),
+                'timestamp': datetime.now().isoformat()
+            }
         except Exception as e:
             logger.error(f"Database health check failed: {e}")
             return {
@@ -87,6 +682,11 @@ class DatabaseManager:
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
             }
+    
+    def close(self):
+        """Close all pooled connections"""
+        self.read_pool.close()
+        self.pool.close()
 
 # Global database instance
 db_manager = DatabaseManager()
\ No newline at end of file
@@ -0,0 +1,25 @@
+-- Composite, covering and partial indexes for the hot query predicates
+
+-- Pending/ringing calls for a callee, newest first (get_pending_calls_for_user)
+CREATE INDEX IF NOT EXISTS idx_calls_callee_status ON calls(callee_id, status, created_at);
+
+-- Status sweeps by age (cleanup_old_calls, Twilio sync of accepted calls)
+CREATE INDEX IF NOT EXISTS idx_calls_status_created ON calls(status, created_at);
+
+-- Active call between two users (initiate_call conflict check); only live calls are indexed
+CREATE INDEX IF NOT EXISTS idx_calls_active_pair ON calls(caller_id, callee_id)
+    WHERE status IN ('pending', 'ringing', 'accepted');
+
+-- Contact list and favorite lookups, covering the contact id
+CREATE INDEX IF NOT EXISTS idx_user_contacts_user_favorite ON user_contacts(user_id, is_favorite, contact_user_id);
+
+-- Online/stale presence sweeps, covering the user id
+CREATE INDEX IF NOT EXISTS idx_user_presence_status_updated ON user_presence(status, updated_at, user_id);
+
+-- Superseded by the composite indexes above or by UNIQUE constraint indexes
+DROP INDEX IF EXISTS idx_users_username;
+DROP INDEX IF EXISTS idx_calls_callee_id;
+DROP INDEX IF EXISTS idx_calls_status;
+DROP INDEX IF EXISTS idx_user_presence_user_id;
+DROP INDEX IF EXISTS idx_user_presence_status;
+DROP INDEX IF EXISTS idx_user_contacts_user_id;
@@ -0,0 +1,57 @@
+-- Cold storage for finished calls and ended sessions (see database/archive.py)
+-- Rows keep their live ids; archived_at records when they were moved
+
+CREATE TABLE IF NOT EXISTS calls_history (
+    id INTEGER PRIMARY KEY,
+    caller_id INTEGER NOT NULL,
+    callee_id INTEGER NOT NULL,
+    call_id TEXT NOT NULL,
+    room_name TEXT,
+    status TEXT,
+    created_at DATETIME,
+    answered_at DATETIME,
+    ended_at DATETIME,
+    duration INTEGER DEFAULT 0,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_sessions_history (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    session_token TEXT NOT NULL,
+    room_name TEXT,
+    session_type TEXT,
+    started_at DATETIME,
+    ended_at DATETIME,
+    is_active BOOLEAN DEFAULT 0,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_calls_history_call_id ON calls_history(call_id);
+CREATE INDEX IF NOT EXISTS idx_calls_history_caller ON calls_history(caller_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_calls_history_callee ON calls_history(callee_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_calls_history_created ON calls_history(created_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_history_user_id ON user_sessions_history(user_id);
+
+-- Ended-session sweep for the archiver
+CREATE INDEX IF NOT EXISTS idx_sessions_active_ended ON user_sessions(is_active, ended_at);
+DROP INDEX IF EXISTS idx_sessions_active;
+
+-- Unified read API: live and archived rows, archived_at is NULL for live rows
+CREATE VIEW IF NOT EXISTS calls_all AS
+    SELECT id, caller_id, callee_id, call_id, room_name, status, created_at,
+           answered_at, ended_at, duration, NULL AS archived_at
+    FROM calls
+    UNION ALL
+    SELECT id, caller_id, callee_id, call_id, room_name, status, created_at,
+           answered_at, ended_at, duration, archived_at
+    FROM calls_history;
+
+CREATE VIEW IF NOT EXISTS user_sessions_all AS
+    SELECT id, user_id, session_token, room_name, session_type, started_at,
+           ended_at, is_active, NULL AS archived_at
+    FROM user_sessions
+    UNION ALL
+    SELECT id, user_id, session_token, room_name, session_type, started_at,
+           ended_at, is_active, archived_at
+    FROM user_sessions_history;
@@ -0,0 +1,8 @@
+-- migrate:no-transaction
+-- Switch to incremental auto-vacuum so freed pages can be returned to the
+-- filesystem in small batches (DatabaseManager.incremental_vacuum).
+-- New files already get it from DatabaseManager. An existing database keeps
+-- its mode until the one-time full VACUUM, which is not run here because it
+-- blocks startup and needs twice the file size on disk: run vacuum_db.py.
+
+PRAGMA auto_vacuum = INCREMENTAL;
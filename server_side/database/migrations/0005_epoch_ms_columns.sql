@@ -0,0 +1,24 @@
+-- Integer epoch-millisecond copies of the timestamps used for age checks (see database/timestamps.py)
+-- The text columns stay for display and for the history tables. user_presence can live in
+-- its own file (PRESENCE_DB_PATH), so its updated_ms column is added by DatabaseManager.
+
+ALTER TABLE users ADD COLUMN last_seen_ms INTEGER;
+ALTER TABLE calls ADD COLUMN created_ms INTEGER;
+ALTER TABLE calls ADD COLUMN answered_ms INTEGER;
+ALTER TABLE calls ADD COLUMN ended_ms INTEGER;
+
+-- Existing text values are UTC (CURRENT_TIMESTAMP); julianday also accepts ISO 'T' and 'Z' forms
+UPDATE users SET last_seen_ms = CAST(ROUND((julianday(last_seen) - 2440587.5) * 86400000) AS INTEGER)
+    WHERE last_seen IS NOT NULL;
+UPDATE calls SET created_ms = CAST(ROUND((julianday(created_at) - 2440587.5) * 86400000) AS INTEGER),
+                 answered_ms = CAST(ROUND((julianday(answered_at) - 2440587.5) * 86400000) AS INTEGER),
+                 ended_ms = CAST(ROUND((julianday(ended_at) - 2440587.5) * 86400000) AS INTEGER);
+
+-- Recently seen users, most recent first (active users stats, list_active)
+CREATE INDEX IF NOT EXISTS idx_users_last_seen_ms ON users(last_seen_ms);
+
+-- Calls placed in a time window (recent calls stats)
+CREATE INDEX IF NOT EXISTS idx_calls_created_ms ON calls(created_ms);
+
+-- Superseded by idx_users_last_seen_ms
+DROP INDEX IF EXISTS idx_users_last_seen;
@@ -0,0 +1,125 @@
+"""
+Versioned schema migrations tracked with SQLite's PRAGMA user_version
+"""
+
+import logging
+import os
+import re
+import sqlite3
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+DATABASE_DIR = os.path.dirname(__file__)
+SCHEMA_PATH = os.path.join(DATABASE_DIR, 'schema.sql')
+MIGRATIONS_DIR = os.path.join(DATABASE_DIR, 'migrations')
+
+# Migration files are named NNNN_description.sql; schema.sql is version 1
+_MIGRATION_FILE_RE = re.compile(r'^(\d{4})_([a-z0-9_]+)\.sql$')
+# Statements such as VACUUM cannot run inside a transaction
+NO_TRANSACTION_MARKER = '-- migrate:no-transaction'
+
+class Migration:
+    """A numbered schema change loaded from a .sql file"""
+    
+    def __init__(self, version: int, name: str, path: str):
+        self.version = version
+        self.name = name
+        self.path = path
+        
+        with open(path, 'r') as f:
+            self.sql = f.read()
+        
+        self.transactional = NO_TRANSACTION_MARKER not in self.sql
+    
+    def statements(self) -> List[str]:
+        """Split the script into complete statements (trigger bodies stay intact)"""
+        statements = []
+        buffer = ''
+        for line in self.sql.splitlines(keepends=True):
+            if not buffer and line.strip().startswith('--'):
+                continue
+            buffer += line
+            if sqlite3.complete_statement(buffer):
+                statements.append(buffer.strip())
+                buffer = ''
+        if buffer.strip():
+            statements.append(buffer.strip())
+        return statements
+    
+    def __repr__(self):
+        return f"Migration({self.version}, '{self.name}')"
+
+def load_migrations() -> List[Migration]:
+    """Baseline schema plus every numbered file in the migrations directory"""
+    migrations = [Migration(1, 'initial_schema', SCHEMA_PATH)]
+    
+    if os.path.isdir(MIGRATIONS_DIR):
+        for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+            match = _MIGRATION_FILE_RE.match(filename)
+            if match:
+                migrations.append(Migration(int(match.group(1)), match.group(2),
+                                            os.path.join(MIGRATIONS_DIR, filename)))
+    
+    versions = [m.version for m in migrations]
+    if versions != list(range(1, len(migrations) + 1)):
+        raise RuntimeError(f"Migration versions must be contiguous from 1, found {versions}")
+    
+    return migrations
+
+class MigrationRunner:
+    """Applies pending migrations exactly once, in order"""
+    
+    def __init__(self, conn: sqlite3.Connection, migrations: List[Migration] = None):
+        self.conn = conn
+        self.migrations = migrations if migrations is not None else load_migrations()
+    
+    @property
+    def latest_version(self) -> int:
+        return self.migrations[-1].version if self.migrations else 0
+    
+    def current_version(self) -> int:
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+    
+    def pending(self) -> List[Migration]:
+        current = self.current_version()
+        return [m for m in self.migrations if m.version > current]
+    
+    def migrate(self) -> List[Migration]:
+        """Apply pending migrations; returns the ones applied by this call"""
+        applied = []
+        for migration in self.pending():
+            if self._apply(migration):
+                applied.append(migration)
+        return applied
+    
+    def _apply(self, migration: Migration) -> bool:
+        conn = self.conn
+        
+        if not migration.transactional:
+            if self.current_version() >= migration.version:
+                return False
+            for statement in migration.statements():
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {migration.version}")
+            logger.info(f"Applied migration {migration.version:04d}_{migration.name}")
+            return True
+        
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if self.current_version() >= migration.version:
+                conn.execute("ROLLBACK")
+                return False
+            
+            for statement in migration.statements():
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {migration.version}")
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        
+        logger.info(f"Applied migration {migration.version:04d}_{migration.name}")
+        return True
@@ -0,0 +1,178 @@
+"""
+Bounded SQLite connection pool used by DatabaseManager
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection becomes available in time"""
+
+class ConnectionPool:
+    """Thread-safe pool of ready-configured SQLite connections
+
+    Connections are opened lazily up to ``max_size`` and handed out LIFO so
+    the most recently used (warm) connection is reused first. The pool only
+    relies on ``threading`` primitives, so it is green-thread safe when
+    eventlet/gevent monkey patching is applied before the database module is
+    imported.
+    """
+    
+    def __init__(self, factory: Callable[[], sqlite3.Connection], max_size: int = 8,
+                 timeout: float = 10.0, name: str = 'default'):
+        if max_size < 1:
+            raise ValueError("Connection pool max_size must be at least 1")
+        
+        self.name = name
+        self.max_size = max_size
+        self.timeout = timeout
+        self._factory = factory
+        self._idle: List[sqlite3.Connection] = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        
+        # Metrics
+        self._checkouts = 0
+        self._returns = 0
+        self._created = 0
+        self._discarded = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._waiting = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+    
+    def acquire(self, timeout: float = None) -> sqlite3.Connection:
+        """Check out a connection, opening a new one if the pool is not full"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        waited = False
+        
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f"Connection pool '{self.name}' is closed")
+                
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                
+                if self._size < self.max_size:
+                    # Reserve the slot before releasing the lock to connect
+                    self._size += 1
+                    conn = None
+                    break
+                
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {timeout}s waiting for a '{self.name}' database connection"
+                    )
+                
+                waited = True
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            
+            wait_time = time.monotonic() - started
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._total_wait += wait_time
+            self._max_wait = max(self._max_wait, wait_time)
+        
+        if conn is None:
+            try:
+                conn = self._factory()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._checkouts -= 1
+                    self._cond.notify()
+                raise
+            
+            with self._cond:
+                self._created += 1
+        
+        return conn
+    
+    def release(self, conn: sqlite3.Connection, discard: bool = False):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error as e:
+                logger.warning(f"Discarding broken pooled connection: {e}")
+                discard = True
+        
+        with self._cond:
+            self._returns += 1
+            
+            if discard or self._closed:
+                self._size -= 1
+                self._discarded += 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append(conn)
+            
+            self._cond.notify()
+    
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def busy(self) -> bool:
+        """Whether any connection is checked out or awaited (advisory, read without the lock)"""
+        return self._waiting > 0 or self._size > len(self._idle)
+    
+    def close(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._size -= 1
+                self._close_quietly(self._idle.pop())
+            self._cond.notify_all()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool usage counters and wait-time metrics"""
+        with self._cond:
+            return {
+                'name': self.name,
+                'max_size': self.max_size,
+                'open_connections': self._size,
+                'idle_connections': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'returns': self._returns,
+                'connections_created': self._created,
+                'connections_discarded': self._discarded,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'avg_wait_ms': round(self._total_wait / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 3)
+            }
+    
+    @staticmethod
+    def _close_quietly(conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,188 @@
+"""
+Per-statement latency histograms and slow-query logging for DatabaseManager
+"""
+
+import bisect
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Any
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Statements beyond this many distinct shapes are counted under OTHER_STATEMENTS
+DEFAULT_MAX_STATEMENTS = 500
+OTHER_STATEMENTS = '(other statements)'
+
+# Numeric columns of the aggregate table that snapshot() can sort by
+SORT_FIELDS = ('count', 'errors', 'total_ms', 'avg_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+               'rows', 'avg_rows', 'lock_wait_ms', 'max_lock_wait_ms')
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+
+def normalize_sql(query: str) -> str:
+    """Single-line statement shape: comments dropped, literals and IN lists collapsed to ?"""
+    query = _COMMENT_RE.sub(' ', query)
+    query = _STRING_RE.sub('?', query)
+    query = _NUMBER_RE.sub('?', query)
+    query = _IN_LIST_RE.sub('IN (?)', query)
+    return ' '.join(query.split())
+
+def redact_params(params) -> List[str]:
+    """Describe parameters by type and size only, so logs never carry user data"""
+    redacted = []
+    for value in params or ():
+        if value is None:
+            redacted.append('NULL')
+        elif isinstance(value, (str, bytes)):
+            redacted.append(f"<{type(value).__name__}:{len(value)}>")
+        else:
+            redacted.append(f"<{type(value).__name__}>")
+    return redacted
+
+class StatementStats:
+    """Aggregates for one normalized statement"""
+    
+    __slots__ = ('count', 'errors', 'total_ms', 'max_ms', 'rows', 'lock_wait_ms', 'max_lock_wait_ms', 'buckets')
+    
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.lock_wait_ms = 0.0
+        self.max_lock_wait_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    
+    def percentile(self, pct: float) -> float:
+        """Upper bound of the bucket holding the given percentile"""
+        if not self.count:
+            return 0.0
+        target = self.count * pct / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max_ms, 3),
+            'rows': self.rows,
+            'avg_rows': round(self.rows / self.count, 2) if self.count else 0.0,
+            'lock_wait_ms': round(self.lock_wait_ms, 3),
+            'max_lock_wait_ms': round(self.max_lock_wait_ms, 3),
+            'histogram': {
+                (f"le_{bound}" if i < len(LATENCY_BUCKETS_MS) else 'inf'): n
+                for i, (bound, n) in enumerate(zip(LATENCY_BUCKETS_MS + (None,), self.buckets))
+            }
+        }
+
+class QueryStats:
+    """Thread-safe registry of StatementStats keyed by normalized SQL
+
+    Lock wait is the time spent waiting for a pooled connection, plus the
+    time BEGIN IMMEDIATE blocks on SQLite's write lock for transactions.
+    """
+    
+    def __init__(self, slow_query_ms: float = None, max_statements: int = None, enabled: bool = None):
+        if slow_query_ms is None:
+            slow_query_ms = float(os.getenv('DB_SLOW_QUERY_MS', 200))
+        if max_statements is None:
+            max_statements = int(os.getenv('DB_QUERY_STATS_MAX', DEFAULT_MAX_STATEMENTS))
+        if enabled is None:
+            enabled = os.getenv('DB_QUERY_STATS', 'true').lower() == 'true'
+        
+        self.slow_query_ms = slow_query_ms
+        self.max_statements = max_statements
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._statements: Dict[str, StatementStats] = {}
+        # Raw query text -> normalized form, so each shape is only parsed once
+        self._normalized: Dict[str, str] = {}
+        self._slow_queries = 0
+    
+    def record(self, query: str, params, elapsed_ms: float, rows: int = 0,
+               lock_wait_ms: float = 0.0, error: bool = False):
+        """Add one execution to its statement's aggregates, logging it if slow"""
+        if not self.enabled:
+            return
+        
+        key = self._normalized.get(query)
+        if key is None:
+            key = normalize_sql(query)
+            if len(self._normalized) < self.max_statements * 4:
+                self._normalized[query] = key
+        
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)
+        slow = self.slow_query_ms > 0 and elapsed_ms >= self.slow_query_ms
+        
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                if len(self._statements) >= self.max_statements:
+                    key = OTHER_STATEMENTS
+                    stats = self._statements.get(key)
+                if stats is None:
+                    stats = self._statements[key] = StatementStats()
+            
+            stats.count += 1
+            stats.errors += 1 if error else 0
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.rows += rows or 0
+            stats.lock_wait_ms += lock_wait_ms
+            stats.max_lock_wait_ms = max(stats.max_lock_wait_ms, lock_wait_ms)
+            stats.buckets[bucket] += 1
+            if slow:
+                self._slow_queries += 1
+        
+        if slow:
+            logger.warning(
+                f"🐢 Slow query {elapsed_ms:.1f}ms (lock wait {lock_wait_ms:.1f}ms, rows {rows}): "
+                f"{key} params={redact_params(params)}"
+            )
+    
+    def snapshot(self, sort: str = 'total_ms', limit: int = None) -> Dict[str, Any]:
+        """Aggregate table, heaviest statements first"""
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Cannot sort query stats by '{sort}', expected one of {', '.join(SORT_FIELDS)}")
+        
+        with self._lock:
+            statements = [dict(stats.to_dict(), sql=sql) for sql, stats in self._statements.items()]
+            slow_queries = self._slow_queries
+        
+        statements.sort(key=lambda s: s[sort], reverse=True)
+        
+        return {
+            'enabled': self.enabled,
+            'slow_query_ms': self.slow_query_ms,
+            'slow_queries': slow_queries,
+            'distinct_statements': len(statements),
+            'total_queries': sum(s['count'] for s in statements),
+            'total_ms': round(sum(s['total_ms'] for s in statements), 3),
+            'buckets_ms': list(LATENCY_BUCKETS_MS),
+            'statements': statements[:limit] if limit else statements
+        }
+    
+    def reset(self):
+        """Drop all aggregates, e.g. before measuring a specific workload"""
+        with self._lock:
+            self._statements.clear()
+            self._slow_queries = 0
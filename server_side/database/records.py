@@ -0,0 +1,165 @@
+"""
+Tuple-backed result rows and a JSON encoder that writes them directly
+
+List endpoints used to fetch sqlite3.Row objects, copy each into a dict and
+hand the dicts to jsonify. Records skip both copies: one slotted tuple
+subclass is generated per column shape, name lookups go through an index
+shared by the class, and the encoder encodes a result set column by column
+into a per-shape JSON template. Output matches jsonify (compact, sorted
+keys, ASCII-escaped), so switching an endpoint does not change its payload.
+"""
+
+import json
+import math
+import sqlite3
+import threading
+from operator import itemgetter
+from typing import Dict, List, Tuple, Any, Iterable
+
+class Record(tuple):
+    """Read-only result row: index by position or column name, like sqlite3.Row"""
+    
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+    _index: Dict[str, int] = {}
+    
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise IndexError(f"No item with that key: {key}") from None
+        return tuple.__getitem__(self, key)
+    
+    def keys(self) -> List[str]:
+        return list(self._fields)
+    
+    def get(self, key: str, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+    
+    def _asdict(self) -> Dict[str, Any]:
+        return dict(zip(self._fields, self))
+    
+    def _replace(self, **changes) -> 'Record':
+        """Copy with some columns replaced; unknown names raise like __getitem__"""
+        values = list(self)
+        for name, value in changes.items():
+            if name not in self._index:
+                raise IndexError(f"No item with that key: {name}")
+            values[self._index[name]] = value
+        return self.__class__(values)
+    
+    def __repr__(self) -> str:
+        return f"Record({', '.join(f'{name}={value!r}' for name, value in zip(self._fields, self))})"
+
+_classes: Dict[Tuple[str, ...], type] = {}
+_classes_lock = threading.Lock()
+
+def record_class(fields: Tuple[str, ...]) -> type:
+    """Record subclass for one column shape, created once and reused"""
+    cls = _classes.get(fields)
+    if cls is not None:
+        return cls
+    
+    with _classes_lock:
+        cls = _classes.get(fields)
+        if cls is None:
+            index = {}
+            for position, name in enumerate(fields):
+                # Duplicate column names resolve to the first, as with sqlite3.Row
+                index.setdefault(name, position)
+            namespace = {'__slots__': (), '_fields': fields, '_index': index}
+            for name, position in index.items():
+                if name.isidentifier() and not name.startswith('_') and not hasattr(Record, name):
+                    namespace[name] = property(itemgetter(position))
+            cls = _classes[fields] = type('Record', (Record,), namespace)
+    return cls
+
+def fetch_records(conn: sqlite3.Connection, query: str, params: tuple = ()) -> List[Record]:
+    """Run a SELECT and return its rows as Records of one shared class"""
+    cursor = conn.cursor()
+    # Plain tuples from the C layer; the connection default is sqlite3.Row
+    cursor.row_factory = None
+    cursor.execute(query, params)
+    if cursor.description is None:
+        return []
+    cls = record_class(tuple(column[0] for column in cursor.description))
+    return list(map(cls, cursor.fetchall()))
+
+# JSON encoding
+
+_encode_str = json.encoder.encode_basestring_ascii
+
+def _encode_float(value: float) -> str:
+    if math.isfinite(value):
+        return float.__repr__(value)
+    return json.dumps(value)
+
+_SCALAR_ENCODERS = {
+    str: _encode_str,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+}
+
+_templates: Dict[Tuple[type, frozenset], Any] = {}
+
+def _template(cls: type, booleans: frozenset):
+    """%-template for one record shape, plus the column positions it consumes in order"""
+    key = (cls, booleans)
+    template = _templates.get(key)
+    if template is None:
+        fields = cls._fields
+        order = tuple(sorted(cls._index.values(), key=fields.__getitem__))
+        members = [_encode_str(fields[position]).replace('%', '%%') + ':%s' for position in order]
+        template = _templates[key] = ('{' + ','.join(members) + '}', order,
+                                      tuple(fields[position] in booleans for position in order))
+    return template
+
+def _encode_column(values: tuple, as_bool: bool, booleans: frozenset) -> List[str]:
+    if as_bool:
+        return ['true' if value else 'false' for value in values]
+    # Columns are usually all TEXT or all INTEGER, possibly with NULLs; try
+    # those shapes before falling back to per-value dispatch
+    for encode in (_encode_str, int.__repr__):
+        try:
+            return list(map(encode, values))
+        except TypeError:
+            pass
+        try:
+            return ['null' if value is None else encode(value) for value in values]
+        except TypeError:
+            pass
+    return [_encode(value, booleans) for value in values]
+
+def _encode_records(records: List[Record], booleans: frozenset) -> List[str]:
+    """Encode Records of one class column by column, then fill each row's template"""
+    template, order, is_bool = _template(records[0].__class__, booleans)
+    columns = list(zip(*records))
+    encoded = [_encode_column(columns[position], as_bool, booleans) for position, as_bool in zip(order, is_bool)]
+    return list(map(template.__mod__, zip(*encoded)))
+
+def _encode(value, booleans: frozenset) -> str:
+    scalar = _SCALAR_ENCODERS.get(value.__class__)
+    if scalar:
+        return scalar(value)
+    if isinstance(value, Record):
+        return _encode_records([value], booleans)[0]
+    if isinstance(value, dict) and all(key.__class__ is str for key in value):
+        return '{' + ','.join(f"{_encode_str(key)}:{_encode(value[key], booleans)}"
+                              for key in sorted(value)) + '}'
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], Record) and all(item.__class__ is value[0].__class__ for item in value):
+            return '[' + ','.join(_encode_records(value, booleans)) + ']'
+        return '[' + ','.join(_encode(item, booleans) for item in value) + ']'
+    return json.dumps(value, separators=(',', ':'), sort_keys=True)
+
+def dumps(payload, booleans: Iterable[str] = ()) -> str:
+    """Serialize dicts, lists and Records to the same JSON jsonify would produce
+
+    SQLite has no boolean type, so record columns named in ``booleans`` are
+    written as true/false instead of 1/0.
+    """
+    return _encode(payload, frozenset(booleans))
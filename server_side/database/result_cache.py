@@ -0,0 +1,237 @@
+"""
+Result cache for read-mostly queries, invalidated by per-table write versions
+
+Every table has a version counter. DatabaseManager bumps the counters of the
+tables a statement writes once the write is committed (at COMMIT for
+statements inside transaction()). A cached result remembers the versions of
+the tables its query reads, taken before the query ran; a lookup that finds
+any of them changed is a miss. Taking the versions first means a write that
+races the read can only leave an entry that is already stale, never one that
+looks current.
+
+Heartbeat flushes only touch users.last_seen, users.last_seen_ms and
+user_presence. Those columns are versioned separately from the rest of users,
+so reads that never select them (profile stats, username lookups, most admin
+counts) survive heartbeat traffic.
+
+Entries live in one LRU bounded by entry count and an estimate of their size
+in bytes. Counters are per process: writes from other processes (maintenance
+scripts) are only picked up once entries reach max_age.
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Callable, Hashable, Iterable, Optional, Tuple
+from database.query_stats import normalize_sql
+
+# Views and the tables they read
+VIEW_TABLES = {
+    'calls_all': ('calls', 'calls_history'),
+    'user_sessions_all': ('user_sessions', 'user_sessions_history'),
+}
+
+# Columns rewritten by heartbeat traffic, versioned as '<table>.<column>'
+VOLATILE_COLUMNS = {
+    'users': ('last_seen', 'last_seen_ms'),
+}
+
+_WRITE_TARGET_RE = re.compile(
+    r'^\s*(INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+["`\[]?(\w+)',
+    re.IGNORECASE
+)
+_SET_CLAUSE_RE = re.compile(r'\bSET\b(.*?)(?:\bWHERE\b|$)', re.IGNORECASE | re.DOTALL)
+_SET_COLUMN_RE = re.compile(r'(?:^|,)\s*["`\[]?(\w+)["`\]]?\s*=')
+_READ_SOURCE_RE = re.compile(r'\b(?:FROM|JOIN)\s+["`\[]?([A-Za-z_]\w*)', re.IGNORECASE)
+_SELECT_STAR_RE = re.compile(r'(?:\bSELECT|,)\s*(?:\w+\.)?\*')
+
+@lru_cache(maxsize=1024)
+def written_tables(query: str) -> Tuple[str, ...]:
+    """Version keys a write statement invalidates; empty for reads"""
+    match = _WRITE_TARGET_RE.match(query)
+    if not match:
+        return ()
+    
+    table = match.group(2).lower()
+    volatile = VOLATILE_COLUMNS.get(table)
+    if volatile and match.group(1).upper().startswith('UPDATE'):
+        set_clause = _SET_CLAUSE_RE.search(normalize_sql(query))
+        columns = _SET_COLUMN_RE.findall(set_clause.group(1)) if set_clause else []
+        if columns and all(column.lower() in volatile for column in columns):
+            return tuple(f"{table}.{column.lower()}" for column in columns)
+    return (table,)
+
+@lru_cache(maxsize=1024)
+def read_tables(query: str) -> Tuple[str, ...]:
+    """Version keys a SELECT depends on: its tables (views expanded) and volatile columns it reads"""
+    normalized = normalize_sql(query)
+    tables = []
+    for name in _READ_SOURCE_RE.findall(normalized):
+        for table in VIEW_TABLES.get(name.lower(), (name.lower(),)):
+            if table not in tables:
+                tables.append(table)
+    
+    lowered = normalized.lower()
+    selects_all = _SELECT_STAR_RE.search(normalized) is not None
+    for table in list(tables):
+        for column in VOLATILE_COLUMNS.get(table, ()):
+            if selects_all or re.search(rf'\b{column}\b', lowered):
+                tables.append(f"{table}.{column}")
+    return tuple(tables)
+
+def estimate_size(value) -> int:
+    """Rough in-memory size in bytes; lists are sized from their first item"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    elif isinstance(value, list):
+        if value:
+            size += len(value) * estimate_size(value[0])
+    elif isinstance(value, (tuple, sqlite3.Row)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+class TableVersions:
+    """Write counters per table (and per volatile column)"""
+    
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.bumps = 0
+    
+    def bump(self, tables: Iterable[str]):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self.bumps += 1
+    
+    def bump_all(self):
+        """Invalidate everything, e.g. after the database file was replaced"""
+        with self._lock:
+            self._epoch += 1
+            self.bumps += 1
+    
+    def snapshot(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        versions = self._versions
+        return (self._epoch,) + tuple(versions.get(table, 0) for table in tables)
+    
+    def to_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._versions, _epoch=self._epoch)
+
+class CacheEntry:
+    __slots__ = ('versions', 'expires_at', 'value', 'size')
+    
+    def __init__(self, versions: tuple, expires_at: float, value, size: int):
+        self.versions = versions
+        self.expires_at = expires_at
+        self.value = value
+        self.size = size
+
+class ResultCache:
+    """LRU of query results keyed by (fetch, query, params), validated against TableVersions"""
+    
+    def __init__(self, versions: TableVersions = None, max_entries: int = None, max_bytes: int = None,
+                 max_age: float = None, enabled: bool = None):
+        self.versions = versions or TableVersions()
+        self.max_entries = max_entries or int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 2000))
+        self.max_bytes = max_bytes or int(os.getenv('RESULT_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+        self.max_age = max_age or float(os.getenv('RESULT_CACHE_MAX_AGE', 300))
+        if enabled is None:
+            enabled = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+        self.enabled = enabled
+        
+        self._entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._reset_counters()
+    
+    def _reset_counters(self):
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._expired = 0
+        self._evictions = 0
+        self._too_large = 0
+    
+    def get_or_load(self, key: Hashable, tables: Tuple[str, ...], load: Callable[[], Any],
+                    max_age: Optional[float] = None):
+        """Cached result for key, or load() it; the result is shared and must not be mutated"""
+        if not self.enabled:
+            return load()
+        
+        versions = self.versions.snapshot(tables)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.versions == versions and entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry.value
+                if entry.versions != versions:
+                    self._stale += 1
+                else:
+                    self._expired += 1
+                self._remove(key)
+            self._misses += 1
+        
+        value = load()
+        self._store(key, CacheEntry(versions, now + (max_age or self.max_age), value, estimate_size(value)))
+        return value
+    
+    def _store(self, key: Hashable, entry: CacheEntry):
+        # One oversized result would flush most of the cache for a single hit
+        if entry.size > self.max_bytes // 4:
+            with self._lock:
+                self._too_large += 1
+            return
+        
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+    
+    def _remove(self, key: Hashable):
+        self._bytes -= self._entries.pop(key).size
+    
+    def clear(self):
+        """Drop every entry and reset the hit/miss counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._reset_counters()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Size, limits, hit/miss counters and the current table versions"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            stats = {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'max_age_seconds': self.max_age,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0.0,
+                'stale': self._stale,
+                'expired': self._expired,
+                'evictions': self._evictions,
+                'too_large': self._too_large,
+            }
+        stats['invalidations'] = self.versions.bumps
+        stats['table_versions'] = self.versions.to_dict()
+        return stats
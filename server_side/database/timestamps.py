@@ -0,0 +1,25 @@
+"""
+Epoch-millisecond timestamps
+
+Columns ending in _ms hold UTC milliseconds since the epoch. They sit next to
+the CURRENT_TIMESTAMP text columns, which are kept for display and for the
+history tables. Liveness and age checks compare the integers, so nothing is
+parsed per row and local time never gets mixed with UTC.
+"""
+
+import time
+
+def sql_epoch_ms(expression: str) -> str:
+    """SQL converting a CURRENT_TIMESTAMP-style text (or 'now') to epoch ms"""
+    return f"CAST(ROUND((julianday({expression}) - 2440587.5) * 86400000) AS INTEGER)"
+
+# Statement time as epoch ms; SQLite keeps 'now' fixed within one statement,
+# so it matches any CURRENT_TIMESTAMP written by the same statement
+NOW_MS_SQL = sql_epoch_ms("'now'")
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+def format_ms(ms: int) -> str:
+    """Epoch ms in SQLite CURRENT_TIMESTAMP format (UTC)"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ms / 1000))
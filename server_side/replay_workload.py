@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Replay a captured workload (WORKLOAD_CAPTURE_PATH) against a running server.
+Usage: python replay_workload.py capture.jsonl [--url http://localhost:3001] [--speed 1] [--register]
+
+Requests are sent open-loop at their captured offsets divided by --speed, so a
+slow server builds a backlog just as it would under real traffic. Reports
+per-route latency percentiles next to the latencies seen during capture.
+
+Captured ?since= cursors only mean something to the server that issued them,
+so each one is replaced by the version the replay target last returned for
+the same route and arguments (or dropped, asking for a full list).
+"""
+
+import argparse
+import json
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode
+
+# Routes that change server state beyond the data they are sent
+DEFAULT_EXCLUDE = ('/api/updates/upload', '/api/updates/delete/', '/api/admin/db-stats/reset', '/api/admin/backups')
+
+_RULE_ARG_RE = re.compile(r'<(?:[^:<>]+:)?([^<>]+)>')
+
+USER_KEYS = ('username', 'caller', 'callee', 'contact_username', 'current_user', 'exclude_user')
+
+def read_capture(path, limit=None):
+    """Records from a capture file in time order, skipping session headers"""
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if 'capture' not in record:
+                records.append(record)
+    records.sort(key=lambda record: record['t'])
+    return records[:limit] if limit else records
+
+def build_path(record):
+    """Request path from the captured route rule, view args and query args"""
+    view_args = record.get('v', {})
+    path = _RULE_ARG_RE.sub(lambda m: quote(str(view_args.get(m.group(1), '')), safe=''), record['r'])
+    if record.get('q'):
+        path += '?' + urlencode(record['q'])
+    return path
+
+def captured_usernames(records):
+    """Pseudonymous usernames referenced anywhere in the capture"""
+    usernames = set()
+    def collect(value, key=None):
+        if isinstance(value, dict):
+            for k, v in value.items():
+                collect(v, k)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item, key)
+        elif key in USER_KEYS and isinstance(value, str):
+            usernames.add(value)
+    for record in records:
+        for section in ('v', 'q', 'b'):
+            collect(record.get(section, {}))
+    return sorted(usernames)
+
+def send(base_url, method, path, body=None, timeout=30):
+    """Send one request; returns (status, response body)"""
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+class CursorMap:
+    """Version cursors returned by the replay target, per route and arguments"""
+    
+    def __init__(self, records):
+        # Only routes polled with ?since= need their responses parsed
+        self.routes = {record['r'] for record in records if 'since' in record.get('q', {})}
+        self._versions = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(record):
+        return (record['r'], tuple(sorted((k, str(v)) for k, v in record.get('q', {}).items() if k != 'since')))
+    
+    def rewrite(self, record):
+        """Record with its captured cursor swapped for the target's own"""
+        if 'since' not in record.get('q', {}):
+            return record
+        with self._lock:
+            version = self._versions.get(self._key(record))
+        query = {k: v for k, v in record['q'].items() if k != 'since'}
+        if version is not None:
+            query['since'] = version
+        return dict(record, q=query)
+    
+    def observe(self, record, status, payload):
+        if record['r'] not in self.routes or status != 200:
+            return
+        try:
+            version = json.loads(payload).get('version')
+        except (ValueError, AttributeError):
+            return
+        if version is not None:
+            with self._lock:
+                self._versions[self._key(record)] = version
+
+def register_users(base_url, usernames):
+    """Create the capture's pseudonymous users so lookups find them"""
+    failed = 0
+    for username in usernames:
+        status, _ = send(base_url, 'POST', '/api/users/register',
+                         {'username': username, 'display_name': f"Replay {username}", 'device_type': 'smarttv'})
+        if status != 200:
+            failed += 1
+    print(f"👤 Registered {len(usernames) - failed}/{len(usernames)} capture users")
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class RouteResults:
+    def __init__(self):
+        self.latencies = []
+        self.captured = []
+        self.errors = 0
+
+def replay(records, args):
+    """Send every record at its scheduled offset; returns (results by route, max dispatch lag ms)"""
+    results = defaultdict(RouteResults)
+    lock = threading.Lock()
+    cursors = CursorMap(records)
+    
+    def run(record):
+        route = f"{record['m']} {record['r']}"
+        record = cursors.rewrite(record)
+        started = time.perf_counter()
+        try:
+            status, payload = send(args.url, record['m'], build_path(record), record.get('b'), args.timeout)
+        except Exception:
+            status = payload = None
+        elapsed = (time.perf_counter() - started) * 1000
+        cursors.observe(record, status, payload)
+        with lock:
+            result = results[route]
+            result.latencies.append(elapsed)
+            result.captured.append(record['ms'])
+            if status is None or status >= 500:
+                result.errors += 1
+    
+    first = records[0]['t']
+    max_lag = 0.0
+    replay_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for record in records:
+            due = replay_started + (record['t'] - first) / args.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay * 1000)
+            executor.submit(run, record)
+    return results, max_lag
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a captured SmartTV workload')
+    parser.add_argument('capture', help='Capture file written with WORKLOAD_CAPTURE_PATH')
+    parser.add_argument('--url', default='http://localhost:3001', help='Server to replay against')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed multiplier (2 = twice as fast)')
+    parser.add_argument('--workers', type=int, default=32, help='Maximum requests in flight')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--limit', type=int, help='Replay only the first N requests')
+    parser.add_argument('--register', action='store_true', help='Register the capture users before replaying')
+    parser.add_argument('--exclude', nargs='*', default=list(DEFAULT_EXCLUDE),
+                        help='Route prefixes to skip (defaults to update uploads/deletes and admin actions)')
+    args = parser.parse_args()
+    
+    records = [r for r in read_capture(args.capture, args.limit)
+               if not any(r['r'].startswith(prefix) for prefix in args.exclude)]
+    if not records:
+        print("❌ No requests to replay")
+        return False
+    
+    span = records[-1]['t'] - records[0]['t']
+    print(f"🎬 Replaying {len(records)} requests captured over {span:.1f}s at {args.speed:g}x against {args.url}")
+    if args.register:
+        register_users(args.url, captured_usernames(records))
+    
+    started = time.perf_counter()
+    results, max_lag = replay(records, args)
+    elapsed = time.perf_counter() - started
+    
+    print("=" * 104)
+    print(f"{'route':<44}{'reqs':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'cap p50':>9}{'cap p95':>9}")
+    for route, result in sorted(results.items(), key=lambda item: len(item[1].latencies), reverse=True):
+        latencies = result.latencies
+        print(f"{route[:43]:<44}{len(latencies):>7}{result.errors:>8}"
+              f"{statistics.median(latencies):>9.2f}{percentile(latencies, 95):>9.2f}"
+              f"{percentile(latencies, 99):>9.2f}{max(latencies):>9.2f}"
+              f"{statistics.median(result.captured):>9.2f}{percentile(result.captured, 95):>9.2f}")
+    
+    total = sum(len(result.latencies) for result in results.values())
+    errors = sum(result.errors for result in results.values())
+    print("=" * 104)
+    print(f"   {total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s), {errors} errors, "
+          f"max dispatch lag {max_lag:.1f}ms")
+    print("   cap p50/p95: server-side latency recorded during capture")
+    return errors == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,220 @@
+"""
+Repository interfaces used by the service layer
+
+Services talk to storage only through these classes, so the same business
+logic runs on SQLite or on the in-process memory backend. Rows are returned
+as plain dicts keyed by the column names of the SQLite schema; methods
+documented as returning read-only rows may instead return Records
+(database.records), which support the same lookups but not assignment.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, List, Any, Iterable, Tuple, Callable
+
+def sort_text(value: Optional[str]) -> tuple:
+    """Sort key for nullable text; SQLite sorts NULL before any text in ascending order"""
+    return (value is not None, value or '')
+
+class UserRepository(ABC):
+    """Users plus the sessions and game scores they own"""
+    
+    @abstractmethod
+    def transaction(self):
+        """Context manager grouping several calls into one unit of work"""
+    
+    @abstractmethod
+    def get_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        """Full user row, including heartbeats not yet persisted"""
+    
+    @abstractmethod
+    def get_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Full user row by primary key"""
+    
+    @abstractmethod
+    def get_by_usernames(self, usernames: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """id, username and display_name for each existing user, keyed by username"""
+    
+    @abstractmethod
+    def exists(self, username: str) -> bool:
+        """Whether a user with this username exists"""
+    
+    @abstractmethod
+    def create(self, username: str, display_name: str, device_type: str, metadata_json: str) -> int:
+        """Insert a user and return its id"""
+    
+    @abstractmethod
+    def touch(self, user_id: int, display_name: str = None):
+        """Set last_seen to now, and the display name when one is given"""
+    
+    @abstractmethod
+    def record_last_seen(self, username: str):
+        """Heartbeat touch of last_seen"""
+    
+    @abstractmethod
+    def update_info(self, username: str, display_name: str = None, metadata_json: str = None):
+        """Update the given profile fields"""
+    
+    @abstractmethod
+    def list_active(self, limit: int) -> List[Dict[str, Any]]:
+        """Active users, most recently seen first"""
+    
+    @abstractmethod
+    def start_session(self, user_id: int, session_token: str, session_type: str, room_name: str = None):
+        """End the user's active sessions and open a new one"""
+    
+    @abstractmethod
+    def end_session(self, session_token: str):
+        """Mark a session as ended"""
+    
+    @abstractmethod
+    def save_game_score(self, user_id: int, game_type: str, score: int, questions_answered: int,
+                        correct_answers: int, game_duration: int = 0, room_name: str = None):
+        """Record a finished game"""
+    
+    @abstractmethod
+    def get_game_stats(self, user_id: int) -> Dict[str, Any]:
+        """games_played, avg_score, best_score, total_correct, total_questions"""
+    
+    @abstractmethod
+    def get_session_stats(self, user_id: int) -> Dict[str, Any]:
+        """total_sessions, video_sessions, trivia_sessions"""
+    
+    @abstractmethod
+    def health_check(self) -> Dict[str, Any]:
+        """Backend status; 'status' is 'healthy' or 'unhealthy'"""
+
+class CallRepository(ABC):
+    """Calls between users and the presence shown in the call directory"""
+    
+    @abstractmethod
+    def transaction(self):
+        """Context manager grouping several calls into one unit of work"""
+    
+    @abstractmethod
+    def list_directory(self, requester: str = None, contacts_only: bool = False,
+                       usernames: Iterable[str] = None) -> List[Dict[str, Any]]:
+        """Users other than the requester with presence_status, updated_at and is_favorite (read-only rows)
+        
+        With usernames, only those users are listed.
+        """
+    
+    @abstractmethod
+    def find_active_between(self, user_id: int, other_user_id: int) -> Optional[Dict[str, Any]]:
+        """call_id and status of a pending, ringing or accepted call in either direction"""
+    
+    @abstractmethod
+    def create(self, caller_id: int, callee_id: int, call_id: str):
+        """Insert a pending call"""
+    
+    @abstractmethod
+    def get(self, call_id: str) -> Optional[Dict[str, Any]]:
+        """Call row with caller_username and callee_username"""
+    
+    @abstractmethod
+    def get_answerable(self, call_id: str, callee_username: str) -> Optional[Dict[str, Any]]:
+        """The call if it is pending or ringing for this callee"""
+    
+    @abstractmethod
+    def accept(self, call_id: str, room_name: str):
+        """Mark a call accepted and record its room"""
+    
+    @abstractmethod
+    def cancel(self, call_id: str, caller_username: str = None) -> int:
+        """Cancel a call (only pending/ringing ones when a caller is given); returns rows changed"""
+    
+    @abstractmethod
+    def decline(self, call_id: str, callee_username: str) -> int:
+        """Decline a pending/ringing call; returns rows changed"""
+    
+    @abstractmethod
+    def end(self, call_id: str, duration: int) -> int:
+        """End an accepted call; returns rows changed"""
+    
+    @abstractmethod
+    def get_answered_ms(self, call_id: str) -> Optional[int]:
+        """When an accepted call was answered, in epoch ms"""
+    
+    @abstractmethod
+    def list_pending_for(self, username: str) -> List[Dict[str, Any]]:
+        """Pending/ringing calls for a callee, newest first"""
+    
+    @abstractmethod
+    def record_presence(self, username: str, status: str, socket_id: str = None) -> bool:
+        """Presence heartbeat; returns False for unknown users"""
+    
+    @abstractmethod
+    def bind_presence_socket(self, username: str, socket_id: str) -> bool:
+        """Keep a user online while a Socket.IO connection is open; returns False for unknown users"""
+    
+    @abstractmethod
+    def release_presence_socket(self, socket_id: str) -> bool:
+        """Forget a closed connection, marking its user offline once none is left; False if it was not bound"""
+    
+    @abstractmethod
+    def add_presence_listener(self, callback: Callable[[List[Tuple[str, str]]], None]):
+        """Call callback with (username, status) pairs after every batch of presence changes"""
+    
+    @abstractmethod
+    def expire_presence(self, now: float = None) -> int:
+        """Mark heartbeat users silent for longer than PRESENCE_TTL_SECONDS offline; returns users expired"""
+    
+    @abstractmethod
+    def archive_finished_before(self, cutoff: str) -> int:
+        """Move finished calls created before the cutoff to call history; returns rows moved"""
+
+class ContactRepository(ABC):
+    """Directed contact relationships between users"""
+    
+    @abstractmethod
+    def transaction(self):
+        """Context manager grouping several calls into one unit of work"""
+    
+    @abstractmethod
+    def exists(self, user_id: int, contact_user_id: int) -> bool:
+        """Whether contact_user_id is in user_id's contact list"""
+    
+    @abstractmethod
+    def add(self, user_id: int, contact_user_id: int):
+        """Add a contact"""
+    
+    @abstractmethod
+    def remove(self, user_id: int, contact_user_id: int):
+        """Remove a contact if present"""
+    
+    @abstractmethod
+    def set_favorite(self, user_id: int, contact_user_id: int, is_favorite: bool) -> int:
+        """Update the favorite flag; returns rows changed"""
+    
+    @abstractmethod
+    def list_with_presence(self, user_id: int) -> List[Dict[str, Any]]:
+        """Contacts with presence_status and presence_updated_at (read-only rows)"""
+    
+    @abstractmethod
+    def list_followers(self, user_id: int) -> List[Dict[str, Any]]:
+        """Users who have this user as a contact, by display name"""
+    
+    @abstractmethod
+    def search_users(self, query: str, limit: int, exclude_username: str = None) -> List[Dict[str, Any]]:
+        """Active users whose username or display name contains the query"""
+    
+    @abstractmethod
+    def get_counts(self, user_id: int) -> Dict[str, int]:
+        """total_contacts, favorite_contacts, online_contacts and mutual_contacts"""
+    
+    @abstractmethod
+    def get_totals(self) -> Dict[str, int]:
+        """total_contact_relationships and users_with_contacts"""
+
+    @abstractmethod
+    def list_edges(self) -> List[Tuple[str, str]]:
+        """Every (username, contact_username) pair"""
+
+class Repositories:
+    """The repositories of one storage backend"""
+    
+    def __init__(self, backend: str, users: UserRepository, calls: CallRepository,
+                 contacts: ContactRepository):
+        self.backend = backend
+        self.users = users
+        self.calls = calls
+        self.contacts = contacts
@@ -0,0 +1,29 @@
+"""
+Selects the storage backend the services run on
+"""
+
+import logging
+import os
+from repositories.base import Repositories
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKENDS = ('sqlite', 'memory')
+
+def create_repositories(backend: str = None) -> Repositories:
+    """Build the repositories for a backend (default: SMARTTV_STORAGE_BACKEND or sqlite)"""
+    backend = (backend or os.getenv('SMARTTV_STORAGE_BACKEND', 'sqlite')).lower()
+    
+    if backend == 'sqlite':
+        from repositories.sqlite_repository import create_sqlite_repositories
+        return create_sqlite_repositories()
+    
+    if backend == 'memory':
+        from repositories.memory_repository import create_memory_repositories
+        logger.warning("⚠️  Using in-memory storage backend: users, calls and contacts are lost on restart")
+        return create_memory_repositories()
+    
+    raise ValueError(f"Unknown storage backend '{backend}', expected one of {', '.join(STORAGE_BACKENDS)}")
+
+# Global instance
+repositories = create_repositories()
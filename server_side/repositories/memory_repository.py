@@ -0,0 +1,755 @@
+"""
+In-process repositories built on dicts and secondary indexes
+
+Nothing touches disk: all state lives in one MemoryStore and is lost on
+restart. Useful for measuring the Python-level cost of an endpoint without
+SQLite in the way, and for single-household deployments that do not need
+their call history to survive a reboot.
+
+Presence follows the same rules as PresenceRegistry: heartbeat users expire
+after PRESENCE_TTL_SECONDS on a timing wheel, bound sockets keep their user
+online, and presence listeners hear about every status change.
+"""
+
+import copy
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Any, Iterable, Tuple, Callable
+from services.heartbeat_buffer import utc_timestamp
+from services.timing_wheel import TimingWheel
+from database.timestamps import now_ms, format_ms
+from services.presence_feed import presence_feed
+from repositories.base import sort_text, UserRepository, CallRepository, ContactRepository, Repositories
+
+LIVE_CALL_STATUSES = ('pending', 'ringing', 'accepted')
+RINGING_CALL_STATUSES = ('pending', 'ringing')
+FINISHED_CALL_STATUSES = ('declined', 'cancelled', 'ended', 'missed')
+
+logger = logging.getLogger(__name__)
+
+# Journal marker for an entry that did not exist yet
+_MISSING = object()
+
+class MemoryStore:
+    """Tables as dicts keyed by primary key, plus the indexes the queries need
+
+    A single re-entrant lock serialises writers and gives transaction() the
+    same all-or-nothing visibility a SQLite write transaction has. Writers
+    call save() before changing an entry, so a transaction that raises puts
+    back every entry it touched (id counters are not rewound).
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._ids = {}
+        # (table, key) -> entry as it was before the open transaction changed it
+        self._journal: Optional[Dict[Tuple[str, Any], Any]] = None
+        
+        # users: id -> row, username -> id
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.user_ids: Dict[str, int] = {}
+        
+        # user_sessions: token -> row, user_id -> tokens of active sessions
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.active_sessions: Dict[int, set] = {}
+        
+        # game_scores: user_id -> rows
+        self.game_scores: Dict[int, List[Dict[str, Any]]] = {}
+        
+        # calls: call_id -> row; live calls by unordered user pair;
+        # pending/ringing calls by callee
+        self.calls: Dict[str, Dict[str, Any]] = {}
+        self.live_calls: Dict[frozenset, str] = {}
+        self.ringing_calls: Dict[int, set] = {}
+        # calls_history: call_id -> archived row
+        self.calls_history: Dict[str, Dict[str, Any]] = {}
+        
+        # user_presence: user_id -> row; bound Socket.IO connections: socket id -> user_id
+        self.presence: Dict[int, Dict[str, Any]] = {}
+        self.presence_sockets: Dict[str, int] = {}
+        
+        # user_contacts: user_id -> {contact_user_id: row}, plus the reverse edges
+        self.contacts: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        self.followers: Dict[int, set] = {}
+    
+        # Online heartbeat users keyed by when they go stale, and status
+        # changes not yet passed to the presence listeners
+        self.presence_ttl = float(os.getenv('PRESENCE_TTL_SECONDS', 180))
+        self.expiry_tick = int(os.getenv('PRESENCE_EXPIRY_TICK_MS', 1000)) / 1000.0
+        self.presence_wheel = TimingWheel(self.expiry_tick, int(self.presence_ttl / self.expiry_tick) + 2, time.time())
+        self._presence_changes: List[Tuple[str, str]] = []
+        self._presence_listeners: List[Callable] = []
+        self._expiry_thread = None
+    
+    def next_id(self, table: str) -> int:
+        counter = self._ids.get(table)
+        if counter is None:
+            counter = self._ids[table] = itertools.count(1)
+        return next(counter)
+    
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            if self._journal is not None:
+                # Nested: part of the enclosing transaction
+                yield self
+                return
+            
+            self._journal = {}
+            try:
+                yield self
+            except BaseException:
+                self._rollback()
+                raise
+            finally:
+                self._journal = None
+    
+    def save(self, table: str, key):
+        """Journal an entry before it is changed; a no-op outside transaction()"""
+        journal = self._journal
+        if journal is None or (table, key) in journal:
+            return
+        entries = getattr(self, table)
+        journal[(table, key)] = copy.deepcopy(entries[key]) if key in entries else _MISSING
+    
+    def _rollback(self):
+        for (table, key), entry in self._journal.items():
+            entries = getattr(self, table)
+            if entry is _MISSING:
+                entries.pop(key, None)
+            else:
+                entries[key] = entry
+    
+    def user_id(self, username: str) -> Optional[int]:
+        return self.user_ids.get(username)
+    
+    def presence_status(self, user_id: int) -> str:
+        presence = self.presence.get(user_id)
+        return presence['status'] if presence else 'offline'
+    
+    def presence_changed(self, user_id: int, previous: str, status: str):
+        """Reschedule expiry and queue a listener notification; caller holds the lock"""
+        if status == 'online' and user_id not in self.presence_sockets.values():
+            self.presence_wheel.schedule(user_id, time.time() + self.presence_ttl)
+            self._start_expiry()
+        else:
+            self.presence_wheel.cancel(user_id)
+        if previous != status:
+            username = self.users[user_id]['username']
+            presence_feed.record(username)
+            self._presence_changes.append((username, status))
+    
+    def add_presence_listener(self, callback: Callable[[List[Tuple[str, str]]], None]):
+        self._presence_listeners.append(callback)
+    
+    def notify_presence(self):
+        """Pass queued status changes to the listeners, outside the store lock"""
+        with self.lock:
+            if not self._presence_changes:
+                return
+            changes, self._presence_changes = self._presence_changes, []
+        for listener in self._presence_listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error(f"Presence listener failed: {e}")
+    
+    def expire_presence(self, now: float = None) -> int:
+        """Mark heartbeat users silent for longer than the TTL offline; returns users expired"""
+        now = now or time.time()
+        with self.lock:
+            due = self.presence_wheel.advance(now)
+            for user_id in due:
+                presence = self.presence.get(user_id)
+                if not presence or presence['status'] != 'online':
+                    continue  # dropped by a rolled-back transaction
+                presence.update(status='offline', updated_at=format_ms(int(now * 1000)), updated_ms=int(now * 1000))
+                self.presence_changed(user_id, 'online', 'offline')
+        
+        if due:
+            logger.info(f"🧹 Marked {len(due)} inactive users as offline")
+            self.notify_presence()
+        return len(due)
+    
+    def _start_expiry(self):
+        if self._expiry_thread is None:
+            self._expiry_thread = threading.Thread(target=self._run_expiry, name='memory-presence-expiry',
+                                                   daemon=True)
+            self._expiry_thread.start()
+    
+    def _run_expiry(self):
+        while True:
+            time.sleep(self.expiry_tick)
+            try:
+                self.expire_presence()
+            except Exception as e:
+                logger.error(f"Presence expiry error: {e}")
+    
+    def set_call_status(self, call: Dict[str, Any], status: str, **fields):
+        """Change a call's status and keep the live/ringing indexes in step"""
+        pair = frozenset((call['caller_id'], call['callee_id']))
+        self.save('calls', call['call_id'])
+        self.save('live_calls', pair)
+        self.save('ringing_calls', call['callee_id'])
+        if call['status'] in LIVE_CALL_STATUSES and self.live_calls.get(pair) == call['call_id']:
+            del self.live_calls[pair]
+        if call['status'] in RINGING_CALL_STATUSES:
+            self.ringing_calls.get(call['callee_id'], set()).discard(call['call_id'])
+        
+        call['status'] = status
+        call.update(fields)
+        
+        if status in LIVE_CALL_STATUSES:
+            self.live_calls[pair] = call['call_id']
+        if status in RINGING_CALL_STATUSES:
+            self.ringing_calls.setdefault(call['callee_id'], set()).add(call['call_id'])
+
+class MemoryRepository:
+    """Shared plumbing for the memory repositories"""
+    
+    def __init__(self, store: MemoryStore):
+        self.store = store
+    
+    def transaction(self):
+        return self.store.transaction()
+
+class MemoryUserRepository(MemoryRepository, UserRepository):
+    
+    def get_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        with self.store.lock:
+            user_id = self.store.user_id(username)
+            return dict(self.store.users[user_id]) if user_id is not None else None
+    
+    def get_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self.store.lock:
+            user = self.store.users.get(user_id)
+            return dict(user) if user else None
+    
+    def get_by_usernames(self, usernames: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        with self.store.lock:
+            for username in usernames:
+                user_id = self.store.user_id(username)
+                if user_id is not None:
+                    user = self.store.users[user_id]
+                    found[username] = {'id': user['id'], 'username': user['username'],
+                                       'display_name': user['display_name']}
+        return found
+    
+    def exists(self, username: str) -> bool:
+        return username in self.store.user_ids
+    
+    def create(self, username: str, display_name: str, device_type: str, metadata_json: str) -> int:
+        with self.store.lock:
+            if username in self.store.user_ids:
+                raise ValueError(f"User {username} already exists")
+            
+            now = utc_timestamp()
+            user_id = self.store.next_id('users')
+            self.store.save('users', user_id)
+            self.store.save('user_ids', username)
+            self.store.users[user_id] = {
+                'id': user_id,
+                'username': username,
+                'display_name': display_name,
+                'device_type': device_type,
+                'created_at': now,
+                'last_seen': now,
+                'last_seen_ms': now_ms(),
+                'is_active': 1,
+                'metadata': metadata_json
+            }
+            self.store.user_ids[username] = user_id
+            return user_id
+    
+    def touch(self, user_id: int, display_name: str = None):
+        with self.store.lock:
+            user = self.store.users.get(user_id)
+            if user:
+                self.store.save('users', user_id)
+                user['last_seen'] = utc_timestamp()
+                user['last_seen_ms'] = now_ms()
+                if display_name is not None:
+                    user['display_name'] = display_name
+    
+    def record_last_seen(self, username: str):
+        with self.store.lock:
+            user_id = self.store.user_id(username)
+            if user_id is not None:
+                self.store.save('users', user_id)
+                self.store.users[user_id].update(last_seen=utc_timestamp(), last_seen_ms=now_ms())
+    
+    def update_info(self, username: str, display_name: str = None, metadata_json: str = None):
+        with self.store.lock:
+            user_id = self.store.user_id(username)
+            if user_id is None:
+                return
+            self.store.save('users', user_id)
+            user = self.store.users[user_id]
+            if display_name:
+                user['display_name'] = display_name
+            if metadata_json:
+                user['metadata'] = metadata_json
+    
+    def list_active(self, limit: int) -> List[Dict[str, Any]]:
+        with self.store.lock:
+            active = [user for user in self.store.users.values() if user['is_active'] == 1]
+            active.sort(key=lambda user: user['last_seen_ms'], reverse=True)
+            return [{'username': user['username'], 'display_name': user['display_name'],
+                     'last_seen': user['last_seen'], 'device_type': user['device_type']}
+                    for user in active[:limit]]
+    
+    def start_session(self, user_id: int, session_token: str, session_type: str, room_name: str = None):
+        with self.store.lock:
+            if session_token in self.store.sessions:
+                raise ValueError(f"Session {session_token} already exists")
+            
+            now = utc_timestamp()
+            self.store.save('active_sessions', user_id)
+            self.store.save('sessions', session_token)
+            for token in self.store.active_sessions.pop(user_id, set()):
+                self.store.save('sessions', token)
+                session = self.store.sessions[token]
+                session['is_active'] = 0
+                session['ended_at'] = now
+            
+            self.store.sessions[session_token] = {
+                'id': self.store.next_id('user_sessions'),
+                'user_id': user_id,
+                'session_token': session_token,
+                'room_name': room_name,
+                'session_type': session_type,
+                'started_at': now,
+                'ended_at': None,
+                'is_active': 1
+            }
+            self.store.active_sessions[user_id] = {session_token}
+    
+    def end_session(self, session_token: str):
+        with self.store.lock:
+            session = self.store.sessions.get(session_token)
+            if session:
+                self.store.save('sessions', session_token)
+                self.store.save('active_sessions', session['user_id'])
+                session['is_active'] = 0
+                session['ended_at'] = utc_timestamp()
+                self.store.active_sessions.get(session['user_id'], set()).discard(session_token)
+    
+    def save_game_score(self, user_id: int, game_type: str, score: int, questions_answered: int,
+                        correct_answers: int, game_duration: int = 0, room_name: str = None):
+        with self.store.lock:
+            self.store.save('game_scores', user_id)
+            self.store.game_scores.setdefault(user_id, []).append({
+                'id': self.store.next_id('game_scores'),
+                'user_id': user_id,
+                'game_type': game_type,
+                'score': score,
+                'questions_answered': questions_answered,
+                'correct_answers': correct_answers,
+                'game_duration': game_duration,
+                'played_at': utc_timestamp(),
+                'room_name': room_name
+            })
+    
+    def get_game_stats(self, user_id: int) -> Dict[str, Any]:
+        with self.store.lock:
+            scores = list(self.store.game_scores.get(user_id, []))
+        
+        if not scores:
+            return {'games_played': 0, 'avg_score': None, 'best_score': None,
+                    'total_correct': None, 'total_questions': None}
+        
+        return {
+            'games_played': len(scores),
+            'avg_score': sum(s['score'] for s in scores) / len(scores),
+            'best_score': max(s['score'] for s in scores),
+            'total_correct': sum(s['correct_answers'] for s in scores),
+            'total_questions': sum(s['questions_answered'] for s in scores)
+        }
+    
+    def get_session_stats(self, user_id: int) -> Dict[str, Any]:
+        with self.store.lock:
+            sessions = [s for s in self.store.sessions.values() if s['user_id'] == user_id]
+        
+        return {
+            'total_sessions': len(sessions),
+            'video_sessions': sum(1 for s in sessions if s['session_type'] == 'video_call'),
+            'trivia_sessions': sum(1 for s in sessions if s['session_type'] == 'trivia_game')
+        }
+    
+    def health_check(self) -> Dict[str, Any]:
+        with self.store.lock:
+            return {
+                'status': 'healthy',
+                'backend': 'memory',
+                'total_users': len(self.store.users),
+                'active_sessions': sum(len(tokens) for tokens in self.store.active_sessions.values()),
+                'total_calls': len(self.store.calls)
+            }
+
+class MemoryCallRepository(MemoryRepository, CallRepository):
+    
+    def list_directory(self, requester: str = None, contacts_only: bool = False,
+                       usernames: Iterable[str] = None) -> List[Dict[str, Any]]:
+        store = self.store
+        with store.lock:
+            requester_id = store.user_id(requester) if requester else None
+            favorites = store.contacts.get(requester_id, {})
+            
+            if usernames is not None:
+                user_ids = {store.user_id(name) for name in usernames} - {None}
+                if contacts_only and requester:
+                    user_ids &= favorites.keys()
+                candidates = [store.users[user_id] for user_id in user_ids]
+            elif contacts_only and requester:
+                candidates = [store.users[contact_id] for contact_id in favorites]
+            else:
+                candidates = store.users.values()
+            
+            rows = []
+            for user in candidates:
+                if requester and user['username'] == requester:
+                    continue
+                presence = store.presence.get(user['id'])
+                contact = favorites.get(user['id'])
+                rows.append({
+                    'username': user['username'],
+                    'display_name': user['display_name'],
+                    'last_seen': user['last_seen'],
+                    'presence_status': presence['status'] if presence else 'offline',
+                    'updated_at': presence['updated_at'] if presence else user['last_seen'],
+                    'updated_ms': presence['updated_ms'] if presence else user['last_seen_ms'],
+                    'is_favorite': 1 if contact and contact['is_favorite'] == 1 else 0
+                })
+        
+        rows.sort(key=lambda row: (-row['is_favorite'], row['presence_status'] != 'online', row['username']))
+        return rows
+    
+    def find_active_between(self, user_id: int, other_user_id: int) -> Optional[Dict[str, Any]]:
+        with self.store.lock:
+            call_id = self.store.live_calls.get(frozenset((user_id, other_user_id)))
+            if call_id is None:
+                return None
+            return {'call_id': call_id, 'status': self.store.calls[call_id]['status']}
+    
+    def create(self, caller_id: int, callee_id: int, call_id: str):
+        with self.store.lock:
+            if call_id in self.store.calls:
+                raise ValueError(f"Call {call_id} already exists")
+            
+            call = {
+                'id': self.store.next_id('calls'),
+                'caller_id': caller_id,
+                'callee_id': callee_id,
+                'call_id': call_id,
+                'room_name': None,
+                'status': None,
+                'created_at': utc_timestamp(),
+                'answered_at': None,
+                'ended_at': None,
+                'duration': 0,
+                'created_ms': now_ms(),
+                'answered_ms': None,
+                'ended_ms': None
+            }
+            self.store.save('calls', call_id)
+            self.store.calls[call_id] = call
+            self.store.set_call_status(call, 'pending')
+    
+    def _with_usernames(self, call: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        caller = self.store.users.get(call['caller_id'])
+        callee = self.store.users.get(call['callee_id'])
+        if not caller or not callee:
+            return None
+        row = dict(call)
+        row['caller_username'] = caller['username']
+        row['callee_username'] = callee['username']
+        return row
+    
+    def get(self, call_id: str) -> Optional[Dict[str, Any]]:
+        with self.store.lock:
+            call = self.store.calls.get(call_id)
+            return self._with_usernames(call) if call else None
+    
+    def get_answerable(self, call_id: str, callee_username: str) -> Optional[Dict[str, Any]]:
+        with self.store.lock:
+            call = self.store.calls.get(call_id)
+            if (not call or call['status'] not in RINGING_CALL_STATUSES
+                    or call['callee_id'] != self.store.user_id(callee_username)):
+                return None
+            return self._with_usernames(call)
+    
+    def accept(self, call_id: str, room_name: str):
+        with self.store.lock:
+            call = self.store.calls.get(call_id)
+            if call:
+                self.store.set_call_status(call, 'accepted', answered_at=utc_timestamp(), answered_ms=now_ms(),
+                                           room_name=room_name)
+    
+    def cancel(self, call_id: str, caller_username: str = None) -> int:
+        with self.store.lock:
+            call = self.store.calls.get(call_id)
+            if not call:
+                return 0
+            if caller_username is not None and (call['status'] not in RINGING_CALL_STATUSES
+                                                or call['caller_id'] != self.store.user_id(caller_username)):
+                return 0
+            self.store.set_call_status(call, 'cancelled', ended_at=utc_timestamp(), ended_ms=now_ms())
+            return 1
+    
+    def decline(self, call_id: str, callee_username: str) -> int:
+        with self.store.lock:
+            call = self.store.calls.get(call_id)
+            if (not call or call['status'] not in RINGING_CALL_STATUSES
+                    or call['callee_id'] != self.store.user_id(callee_username)):
+                return 0
+            self.store.set_call_status(call, 'declined', ended_at=utc_timestamp(), ended_ms=now_ms())
+            return 1
+    
+    def end(self, call_id: str, duration: int) -> int:
+        with self.store.lock:
+            call = self.store.calls.get(call_id)
+            if not call or call['status'] != 'accepted':
+                return 0
+            self.store.set_call_status(call, 'ended', ended_at=utc_timestamp(), ended_ms=now_ms(),
+                                       duration=duration)
+            return 1
+    
+    def get_answered_ms(self, call_id: str) -> Optional[int]:
+        with self.store.lock:
+            call = self.store.calls.get(call_id)
+            return call['answered_ms'] if call and call['status'] == 'accepted' else None
+    
+    def list_pending_for(self, username: str) -> List[Dict[str, Any]]:
+        store = self.store
+        with store.lock:
+            callee_id = store.user_id(username)
+            calls = []
+            for call_id in store.ringing_calls.get(callee_id, ()):
+                call = store.calls[call_id]
+                caller = store.users.get(call['caller_id'])
+                if caller:
+                    calls.append({
+                        'call_id': call_id,
+                        'status': call['status'],
+                        'created_at': call['created_at'],
+                        'caller_username': caller['username'],
+                        'caller_display_name': caller['display_name']
+                    })
+        
+        calls.sort(key=lambda call: call['created_at'], reverse=True)
+        return calls
+    
+    def record_presence(self, username: str, status: str, socket_id: str = None) -> bool:
+        with self.store.lock:
+            user_id = self.store.user_id(username)
+            if user_id is None:
+                return False
+            
+            now = utc_timestamp()
+            updated_ms = now_ms()
+            self.store.save('presence', user_id)
+            presence = self.store.presence.get(user_id)
+            previous = presence['status'] if presence else 'offline'
+            if presence is None:
+                self.store.presence[user_id] = {
+                    'id': self.store.next_id('user_presence'),
+                    'user_id': user_id,
+                    'status': status,
+                    'last_seen': now,
+                    'socket_id': socket_id,
+                    'updated_at': now,
+                    'updated_ms': updated_ms
+                }
+            else:
+                presence.update(status=status, socket_id=socket_id, updated_at=now, updated_ms=updated_ms)
+            self.store.presence_changed(user_id, previous, status)
+        self.store.notify_presence()
+        return True
+    
+    def bind_presence_socket(self, username: str, socket_id: str) -> bool:
+        with self.store.lock:
+            if not self.record_presence(username, 'online', socket_id):
+                return False
+            self.store.save('presence_sockets', socket_id)
+            user_id = self.store.presence_sockets[socket_id] = self.store.user_id(username)
+            # The connection keeps the user online, so it never expires
+            self.store.presence_wheel.cancel(user_id)
+            return True
+    
+    def release_presence_socket(self, socket_id: str) -> bool:
+        store = self.store
+        with store.lock:
+            store.save('presence_sockets', socket_id)
+            user_id = store.presence_sockets.pop(socket_id, None)
+            if user_id is None:
+                return False
+            if user_id not in store.presence_sockets.values():
+                store.save('presence', user_id)
+                presence = store.presence[user_id]
+                previous = presence['status']
+                presence.update(status='offline', socket_id=None, updated_at=utc_timestamp(), updated_ms=now_ms())
+                store.presence_changed(user_id, previous, 'offline')
+        store.notify_presence()
+        return True
+    
+    def add_presence_listener(self, callback: Callable[[List[Tuple[str, str]]], None]):
+        self.store.add_presence_listener(callback)
+    
+    def expire_presence(self, now: float = None) -> int:
+        return self.store.expire_presence(now)
+    
+    def archive_finished_before(self, cutoff: str) -> int:
+        with self.store.lock:
+            expired = [call_id for call_id, call in self.store.calls.items()
+                       if call['status'] in FINISHED_CALL_STATUSES and call['created_at'] < cutoff]
+            archived_at = utc_timestamp()
+            for call_id in expired:
+                self.store.save('calls', call_id)
+                self.store.save('calls_history', call_id)
+                self.store.calls_history[call_id] = dict(self.store.calls.pop(call_id), archived_at=archived_at)
+            return len(expired)
+
+class MemoryContactRepository(MemoryRepository, ContactRepository):
+    
+    def exists(self, user_id: int, contact_user_id: int) -> bool:
+        return contact_user_id in self.store.contacts.get(user_id, {})
+    
+    def add(self, user_id: int, contact_user_id: int):
+        with self.store.lock:
+            self.store.save('contacts', user_id)
+            contacts = self.store.contacts.setdefault(user_id, {})
+            if contact_user_id in contacts:
+                raise ValueError(f"Contact {user_id} -> {contact_user_id} already exists")
+            
+            self.store.save('followers', contact_user_id)
+            contacts[contact_user_id] = {
+                'id': self.store.next_id('user_contacts'),
+                'user_id': user_id,
+                'contact_user_id': contact_user_id,
+                'added_at': utc_timestamp(),
+                'is_favorite': 0
+            }
+            self.store.followers.setdefault(contact_user_id, set()).add(user_id)
+    
+    def remove(self, user_id: int, contact_user_id: int):
+        with self.store.lock:
+            self.store.save('contacts', user_id)
+            self.store.save('followers', contact_user_id)
+            if self.store.contacts.get(user_id, {}).pop(contact_user_id, None) is not None:
+                self.store.followers.get(contact_user_id, set()).discard(user_id)
+    
+    def set_favorite(self, user_id: int, contact_user_id: int, is_favorite: bool) -> int:
+        with self.store.lock:
+            contact = self.store.contacts.get(user_id, {}).get(contact_user_id)
+            if not contact:
+                return 0
+            self.store.save('contacts', user_id)
+            contact['is_favorite'] = 1 if is_favorite else 0
+            return 1
+    
+    def list_with_presence(self, user_id: int) -> List[Dict[str, Any]]:
+        store = self.store
+        with store.lock:
+            contacts = []
+            for contact_id, relation in store.contacts.get(user_id, {}).items():
+                user = store.users.get(contact_id)
+                if not user:
+                    continue
+                presence = store.presence.get(contact_id)
+                contacts.append({
+                    'username': user['username'],
+                    'display_name': user['display_name'],
+                    'last_seen': user['last_seen'],
+                    'added_at': relation['added_at'],
+                    'is_favorite': relation['is_favorite'],
+                    'presence_status': presence['status'] if presence else 'offline',
+                    'presence_updated_at': presence['updated_at'] if presence else None
+                })
+        
+        contacts.sort(key=lambda c: (c['presence_status'] != 'online', -c['is_favorite'],
+                                     sort_text(c['display_name'])))
+        return contacts
+    
+    def list_followers(self, user_id: int) -> List[Dict[str, Any]]:
+        store = self.store
+        with store.lock:
+            followers = []
+            for follower_id in store.followers.get(user_id, ()):
+                user = store.users.get(follower_id)
+                if not user:
+                    continue
+                followers.append({
+                    'username': user['username'],
+                    'display_name': user['display_name'],
+                    'last_seen': user['last_seen'],
+                    'added_at': store.contacts[follower_id][user_id]['added_at'],
+                    'presence_status': store.presence_status(follower_id)
+                })
+        
+        followers.sort(key=lambda f: sort_text(f['display_name']))
+        return followers
+    
+    def search_users(self, query: str, limit: int, exclude_username: str = None) -> List[Dict[str, Any]]:
+        # Same matching as SQLite's LIKE '%query%': case-insensitive for ASCII
+        needle = query.lower()
+        store = self.store
+        with store.lock:
+            matches = []
+            for user in store.users.values():
+                if user['is_active'] != 1 or user['username'] == exclude_username:
+                    continue
+                if needle not in user['username'].lower() and needle not in (user['display_name'] or '').lower():
+                    continue
+                matches.append({
+                    'username': user['username'],
+                    'display_name': user['display_name'],
+                    'last_seen': user['last_seen'],
+                    'device_type': user['device_type'],
+                    'presence_status': store.presence_status(user['id'])
+                })
+        
+        matches.sort(key=lambda u: (u['username'] != query, u['display_name'] != query,
+                                    u['presence_status'] != 'online', sort_text(u['display_name'])))
+        return matches[:limit]
+    
+    def get_counts(self, user_id: int) -> Dict[str, int]:
+        store = self.store
+        with store.lock:
+            contacts = store.contacts.get(user_id, {})
+            return {
+                'total_contacts': len(contacts),
+                'favorite_contacts': sum(1 for c in contacts.values() if c['is_favorite'] == 1),
+                'online_contacts': sum(1 for contact_id in contacts
+                                       if store.presence_status(contact_id) == 'online'),
+                'mutual_contacts': len(store.followers.get(user_id, ()))
+            }
+    
+    def get_totals(self) -> Dict[str, int]:
+        with self.store.lock:
+            return {
+                'total_contact_relationships': sum(len(c) for c in self.store.contacts.values()),
+                'users_with_contacts': sum(1 for c in self.store.contacts.values() if c)
+            }
+
+    def list_edges(self) -> List[Tuple[str, str]]:
+        store = self.store
+        with store.lock:
+            return [(store.users[user_id]['username'], store.users[contact_id]['username'])
+                    for user_id, contacts in store.contacts.items()
+                    for contact_id in contacts
+                    if user_id in store.users and contact_id in store.users]
+
+def create_memory_repositories(store: MemoryStore = None) -> Repositories:
+    """Repositories over one shared MemoryStore"""
+    store = store or MemoryStore()
+    return Repositories(
+        'memory',
+        users=MemoryUserRepository(store),
+        calls=MemoryCallRepository(store),
+        contacts=MemoryContactRepository(store)
+    )
@@ -0,0 +1,571 @@
+"""
+SQLite repositories backed by DatabaseManager
+"""
+
+import json
+from typing import Optional, Dict, List, Any, Iterable, Tuple, Callable
+from database.database import db_manager
+from database.archive import Archiver
+from database.timestamps import NOW_MS_SQL
+from services.heartbeat_buffer import heartbeat_buffer
+from services.presence_registry import presence_registry
+from repositories.base import sort_text, UserRepository, CallRepository, ContactRepository, Repositories
+
+class SQLiteRepository:
+    """Shared plumbing: the database manager, the last_seen write-behind buffer
+    and the presence registry"""
+    
+    def __init__(self, db=None, heartbeats=None, presence=None):
+        self.db = db or db_manager
+        self.heartbeats = heartbeats or heartbeat_buffer
+        self.presence = presence or presence_registry
+    
+    def transaction(self):
+        return self.db.transaction()
+    
+    def _overlay_presence(self, record, updated_at_key: str = None):
+        """Record with its presence columns filled from the registry and any buffered last_seen"""
+        record = self.heartbeats.overlay_record(record)
+        entry = self.presence.get(record['user_id'])
+        if entry is None:
+            return record
+        fields = {'presence_status': entry[0]}
+        if updated_at_key:
+            fields[updated_at_key] = entry[1]
+        if 'updated_ms' in record._index:
+            fields['updated_ms'] = entry[3]
+        return record._replace(**fields)
+
+class SQLiteUserRepository(SQLiteRepository, UserRepository):
+    
+    def get_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        result = self.db.execute_cached(
+            "SELECT * FROM users WHERE username = ?",
+            (username,),
+            fetch='one'
+        )
+        if not result:
+            return None
+        
+        user = dict(result)
+        self.heartbeats.apply_pending(user)
+        return user
+    
+    def get_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+        result = self.db.execute_query(
+            "SELECT * FROM users WHERE id = ?",
+            (user_id,),
+            fetch='one'
+        )
+        return dict(result) if result else None
+    
+    def get_by_usernames(self, usernames: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        usernames = list(usernames)
+        placeholders = ', '.join('?' for _ in usernames)
+        rows = self.db.execute_cached(
+            f"SELECT id, username, display_name FROM users WHERE username IN ({placeholders})",
+            tuple(usernames),
+            fetch='all'
+        )
+        return {row['username']: dict(row) for row in rows or []}
+    
+    def exists(self, username: str) -> bool:
+        return self.heartbeats.is_known_user(username)
+    
+    def create(self, username: str, display_name: str, device_type: str, metadata_json: str) -> int:
+        return self.db.execute_query(
+            f"""INSERT INTO users (username, display_name, device_type, metadata, last_seen_ms)
+               VALUES (?, ?, ?, ?, {NOW_MS_SQL})""",
+            (username, display_name, device_type, metadata_json)
+        )
+    
+    def touch(self, user_id: int, display_name: str = None):
+        self.db.execute_query(
+            f"""UPDATE users
+               SET last_seen = CURRENT_TIMESTAMP, last_seen_ms = {NOW_MS_SQL},
+                   display_name = COALESCE(?, display_name)
+               WHERE id = ?""",
+            (display_name, user_id)
+        )
+    
+    def record_last_seen(self, username: str):
+        # Buffered and coalesced per user
+        self.heartbeats.record_last_seen(username)
+    
+    def update_info(self, username: str, display_name: str = None, metadata_json: str = None):
+        updates = []
+        params = []
+        
+        if display_name:
+            updates.append("display_name = ?")
+            params.append(display_name)
+        
+        if metadata_json:
+            updates.append("metadata = ?")
+            params.append(metadata_json)
+        
+        if not updates:
+            return
+        
+        query = f"UPDATE users SET {', '.join(updates)} WHERE username = ?"
+        params.append(username)
+        self.db.execute_query(query, tuple(params))
+    
+    def list_active(self, limit: int) -> List[Dict[str, Any]]:
+        results = self.db.execute_query(
+            """SELECT username, display_name, last_seen, device_type
+               FROM users
+               WHERE is_active = 1
+               ORDER BY last_seen_ms DESC
+               LIMIT ?""",
+            (limit,),
+            fetch='all'
+        )
+        return [dict(row) for row in results] if results else []
+    
+    def start_session(self, user_id: int, session_token: str, session_type: str, room_name: str = None):
+        with self.db.transaction():
+            # End any existing active sessions for this user
+            self.db.execute_query(
+                """UPDATE user_sessions
+                   SET is_active = 0, ended_at = CURRENT_TIMESTAMP
+                   WHERE user_id = ? AND is_active = 1""",
+                (user_id,)
+            )
+            
+            self.db.execute_query(
+                """INSERT INTO user_sessions (user_id, session_token, session_type, room_name)
+                   VALUES (?, ?, ?, ?)""",
+                (user_id, session_token, session_type, room_name)
+            )
+    
+    def end_session(self, session_token: str):
+        self.db.execute_query(
+            """UPDATE user_sessions
+               SET is_active = 0, ended_at = CURRENT_TIMESTAMP
+               WHERE session_token = ?""",
+            (session_token,)
+        )
+    
+    def save_game_score(self, user_id: int, game_type: str, score: int, questions_answered: int,
+                        correct_answers: int, game_duration: int = 0, room_name: str = None):
+        self.db.execute_query(
+            """INSERT INTO game_scores
+               (user_id, game_type, score, questions_answered, correct_answers,
+                game_duration, room_name)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (user_id, game_type, score, questions_answered, correct_answers,
+             game_duration, room_name)
+        )
+    
+    def get_game_stats(self, user_id: int) -> Dict[str, Any]:
+        return dict(self.db.execute_cached(
+            """SELECT
+                 COUNT(*) as games_played,
+                 AVG(score) as avg_score,
+                 MAX(score) as best_score,
+                 SUM(correct_answers) as total_correct,
+                 SUM(questions_answered) as total_questions
+               FROM game_scores
+               WHERE user_id = ?""",
+            (user_id,),
+            fetch='one'
+        ))
+    
+    def get_session_stats(self, user_id: int) -> Dict[str, Any]:
+        return dict(self.db.execute_cached(
+            """SELECT
+                 COUNT(*) as total_sessions,
+                 COUNT(CASE WHEN session_type = 'video_call' THEN 1 END) as video_sessions,
+                 COUNT(CASE WHEN session_type = 'trivia_game' THEN 1 END) as trivia_sessions
+               FROM user_sessions_all
+               WHERE user_id = ?""",
+            (user_id,),
+            fetch='one'
+        ))
+    
+    def health_check(self) -> Dict[str, Any]:
+        return self.db.health_check()
+
+class SQLiteCallRepository(SQLiteRepository, CallRepository):
+    
+    def list_directory(self, requester: str = None, contacts_only: bool = False,
+                       usernames: Iterable[str] = None) -> List[Dict[str, Any]]:
+        exclude_clause = ""
+        contact_filter = ""
+        username_filter = ""
+        params = []
+        
+        if contacts_only and requester:
+            # Only show users who are in the requesting user's contact list.
+            # An IN list lets SQLite drive the query from user_contacts
+            # instead of probing every user with a correlated EXISTS.
+            contact_filter = """
+                AND u.id IN (
+                    SELECT uc.contact_user_id FROM user_contacts uc
+                    WHERE uc.user_id = (SELECT id FROM users WHERE username = ?)
+                )
+            """
+            params.append(requester)
+        
+        if requester:
+            exclude_clause = "AND u.username != ?"
+            params.append(requester)
+        
+        if usernames is not None:
+            usernames = list(usernames)
+            if not usernames:
+                return []
+            username_filter = f"AND u.username IN ({', '.join('?' for _ in usernames)})"
+            params.extend(usernames)
+        
+        # Presence comes from the registry; the query only resolves users and favorites
+        query = f"""
+            SELECT u.id as user_id, u.username, u.display_name, u.last_seen,
+                   'offline' as presence_status,
+                   u.last_seen as updated_at, u.last_seen_ms as updated_ms,
+                   CASE WHEN uc_fav.is_favorite = 1 THEN 1 ELSE 0 END as is_favorite
+            FROM users u
+            LEFT JOIN user_contacts uc_fav ON (
+                uc_fav.contact_user_id = u.id AND
+                uc_fav.user_id = (SELECT id FROM users WHERE username = ?)
+            )
+            WHERE 1=1 {exclude_clause} {contact_filter} {username_filter}
+        """
+        
+        # The username parameter for the favorite check comes first
+        final_params = [requester] + params
+        
+        results = self.db.execute_query(query, tuple(final_params), fetch='records')
+        
+        overlay = self._overlay_presence
+        rows = [overlay(row, updated_at_key='updated_at') for row in results]
+        # Favorites first, then online users, then by username (ID)
+        rows.sort(key=lambda row: (-row['is_favorite'], row['presence_status'] != 'online', row['username']))
+        return rows
+    
+    def find_active_between(self, user_id: int, other_user_id: int) -> Optional[Dict[str, Any]]:
+        existing_call = self.db.execute_query(
+            """SELECT call_id, status FROM calls
+               WHERE ((caller_id = ? AND callee_id = ?) OR (caller_id = ? AND callee_id = ?))
+               AND status IN ('pending', 'ringing', 'accepted')""",
+            (user_id, other_user_id, other_user_id, user_id),
+            fetch='one'
+        )
+        return dict(existing_call) if existing_call else None
+    
+    def create(self, caller_id: int, callee_id: int, call_id: str):
+        self.db.execute_query(
+            f"""INSERT INTO calls (caller_id, callee_id, call_id, status, created_ms)
+               VALUES (?, ?, ?, 'pending', {NOW_MS_SQL})""",
+            (caller_id, callee_id, call_id)
+        )
+    
+    def get(self, call_id: str) -> Optional[Dict[str, Any]]:
+        call = self.db.execute_query(
+            """SELECT c.*,
+                      u1.username as caller_username,
+                      u2.username as callee_username
+               FROM calls c
+               JOIN users u1 ON c.caller_id = u1.id
+               JOIN users u2 ON c.callee_id = u2.id
+               WHERE c.call_id = ?""",
+            (call_id,),
+            fetch='one'
+        )
+        return dict(call) if call else None
+    
+    def get_answerable(self, call_id: str, callee_username: str) -> Optional[Dict[str, Any]]:
+        call = self.db.execute_query(
+            """SELECT c.*,
+                      u1.username as caller_username,
+                      u2.username as callee_username
+               FROM calls c
+               JOIN users u1 ON c.caller_id = u1.id
+               JOIN users u2 ON c.callee_id = u2.id
+               WHERE c.call_id = ? AND u2.username = ? AND c.status IN ('pending', 'ringing')""",
+            (call_id, callee_username),
+            fetch='one'
+        )
+        return dict(call) if call else None
+    
+    def accept(self, call_id: str, room_name: str):
+        self.db.execute_query(
+            f"""UPDATE calls
+               SET status = 'accepted', answered_at = CURRENT_TIMESTAMP, answered_ms = {NOW_MS_SQL}, room_name = ?
+               WHERE call_id = ?""",
+            (room_name, call_id)
+        )
+    
+    def cancel(self, call_id: str, caller_username: str = None) -> int:
+        if caller_username is None:
+            return self.db.execute_query(
+                f"""UPDATE calls
+                   SET status = 'cancelled', ended_at = CURRENT_TIMESTAMP, ended_ms = {NOW_MS_SQL}
+                   WHERE call_id = ?""",
+                (call_id,)
+            )
+        
+        return self.db.execute_query(
+            f"""UPDATE calls
+               SET status = 'cancelled', ended_at = CURRENT_TIMESTAMP, ended_ms = {NOW_MS_SQL}
+               WHERE call_id = ? AND caller_id = (
+                   SELECT id FROM users WHERE username = ?
+               ) AND status IN ('pending', 'ringing')""",
+            (call_id, caller_username)
+        )
+    
+    def decline(self, call_id: str, callee_username: str) -> int:
+        return self.db.execute_query(
+            f"""UPDATE calls
+               SET status = 'declined', ended_at = CURRENT_TIMESTAMP, ended_ms = {NOW_MS_SQL}
+               WHERE call_id = ? AND callee_id = (
+                   SELECT id FROM users WHERE username = ?
+               ) AND status IN ('pending', 'ringing')""",
+            (call_id, callee_username)
+        )
+    
+    def end(self, call_id: str, duration: int) -> int:
+        return self.db.execute_query(
+            f"""UPDATE calls
+               SET status = 'ended', ended_at = CURRENT_TIMESTAMP, ended_ms = {NOW_MS_SQL}, duration = ?
+               WHERE call_id = ? AND status = 'accepted'""",
+            (duration, call_id)
+        )
+    
+    def get_answered_ms(self, call_id: str) -> Optional[int]:
+        call = self.db.execute_query(
+            """SELECT answered_ms FROM calls
+               WHERE call_id = ? AND status = 'accepted'""",
+            (call_id,),
+            fetch='one'
+        )
+        return call['answered_ms'] if call else None
+    
+    def list_pending_for(self, username: str) -> List[Dict[str, Any]]:
+        calls = self.db.execute_query(
+            """SELECT c.call_id, c.status, c.created_at,
+                      u1.username as caller_username,
+                      u1.display_name as caller_display_name
+               FROM calls c
+               JOIN users u1 ON c.caller_id = u1.id
+               JOIN users u2 ON c.callee_id = u2.id
+               WHERE u2.username = ? AND c.status IN ('pending', 'ringing')
+               ORDER BY c.created_at DESC""",
+            (username,),
+            fetch='all'
+        )
+        return [dict(call) for call in calls] if calls else []
+    
+    def record_presence(self, username: str, status: str, socket_id: str = None) -> bool:
+        # The registry is authoritative and checkpoints to user_presence in batches
+        return self.presence.update(username, status, socket_id)
+    
+    def bind_presence_socket(self, username: str, socket_id: str) -> bool:
+        return self.presence.bind(username, socket_id)
+    
+    def release_presence_socket(self, socket_id: str) -> bool:
+        return self.presence.unbind(socket_id) is not None
+    
+    def add_presence_listener(self, callback: Callable[[List[Tuple[str, str]]], None]):
+        self.presence.add_listener(callback)
+    
+    def expire_presence(self, now: float = None) -> int:
+        return self.presence.expire_due(now)
+    
+    def archive_finished_before(self, cutoff: str) -> int:
+        return Archiver(self.db).archive('calls', cutoff)
+
+class SQLiteContactRepository(SQLiteRepository, ContactRepository):
+    
+    def exists(self, user_id: int, contact_user_id: int) -> bool:
+        contact = self.db.execute_query(
+            "SELECT id FROM user_contacts WHERE user_id = ? AND contact_user_id = ?",
+            (user_id, contact_user_id),
+            fetch='one'
+        )
+        return contact is not None
+    
+    def add(self, user_id: int, contact_user_id: int):
+        self.db.execute_query(
+            "INSERT INTO user_contacts (user_id, contact_user_id) VALUES (?, ?)",
+            (user_id, contact_user_id)
+        )
+    
+    def remove(self, user_id: int, contact_user_id: int):
+        self.db.execute_query(
+            "DELETE FROM user_contacts WHERE user_id = ? AND contact_user_id = ?",
+            (user_id, contact_user_id)
+        )
+    
+    def set_favorite(self, user_id: int, contact_user_id: int, is_favorite: bool) -> int:
+        return self.db.execute_query(
+            "UPDATE user_contacts SET is_favorite = ? WHERE user_id = ? AND contact_user_id = ?",
+            (1 if is_favorite else 0, user_id, contact_user_id)
+        )
+    
+    def list_with_presence(self, user_id: int) -> List[Dict[str, Any]]:
+        # Presence is filled in from the registry, so the cached rows only
+        # change when contacts or users do
+        query = """
+            SELECT
+                u.id as user_id,
+                u.username,
+                u.display_name,
+                u.last_seen,
+                uc.added_at,
+                uc.is_favorite,
+                'offline' as presence_status,
+                NULL as presence_updated_at
+            FROM user_contacts uc
+            JOIN users u ON uc.contact_user_id = u.id
+            WHERE uc.user_id = ?
+        """
+        
+        overlay = self._overlay_presence
+        contacts = [overlay(row, updated_at_key='presence_updated_at')
+                    for row in self.db.execute_cached(query, (user_id,), fetch='records')]
+        # Online users first, favorites next, then alphabetically
+        contacts.sort(key=lambda c: (c['presence_status'] != 'online', -c['is_favorite'],
+                                     sort_text(c['display_name'])))
+        return contacts
+    
+    def list_followers(self, user_id: int) -> List[Dict[str, Any]]:
+        # Users who have added this user to their contacts
+        query = """
+            SELECT
+                u.id as user_id,
+                u.username,
+                u.display_name,
+                u.last_seen,
+                uc.added_at
+            FROM user_contacts uc
+            JOIN users u ON uc.user_id = u.id
+            WHERE uc.contact_user_id = ?
+            ORDER BY u.display_name ASC
+        """
+        
+        followers = []
+        for row in self.db.execute_query(query, (user_id,), fetch='all') or []:
+            follower = dict(row)
+            follower['presence_status'] = self.presence.status(follower.pop('user_id'))
+            self.heartbeats.apply_pending(follower)
+            followers.append(follower)
+        return followers
+    
+    def search_users(self, query: str, limit: int, exclude_username: str = None) -> List[Dict[str, Any]]:
+        search_pattern = f"%{query}%"
+        exclude_clause = ""
+        params = [search_pattern, search_pattern]
+        
+        if exclude_username:
+            exclude_clause = "AND u.username != ?"
+            params.append(exclude_username)
+        
+        # Online status lives in the registry, so online and offline matches
+        # are fetched as two ordered, limited partitions and merged here
+        online_ids = json.dumps(self.presence.online_ids())
+        users = []
+        for online, membership in ((True, 'IN'), (False, 'NOT IN')):
+            search_query = f"""
+                SELECT
+                    u.id as user_id,
+                    u.username,
+                    u.display_name,
+                    u.last_seen,
+                    u.device_type
+                FROM users u
+                WHERE (u.username LIKE ? OR u.display_name LIKE ?) {exclude_clause}
+                AND u.is_active = 1
+                AND u.id {membership} (SELECT value FROM json_each(?))
+                ORDER BY
+                    CASE WHEN u.username = ? THEN 1 ELSE 0 END DESC,  -- Exact username match first
+                    CASE WHEN u.display_name = ? THEN 1 ELSE 0 END DESC,  -- Exact display name match next
+                    u.display_name ASC,
+                    u.id ASC
+                LIMIT ?
+            """
+            rows = self.db.execute_query(search_query, tuple(params + [online_ids, query, query, limit]),
+                                         fetch='all') or []
+            users.extend((online, dict(row)) for row in rows)
+        
+        # Exact username match first, exact display name next, then online users
+        users.sort(key=lambda item: (item[1]['username'] != query, item[1]['display_name'] != query,
+                                     not item[0], sort_text(item[1]['display_name']), item[1]['user_id']))
+        matches = []
+        for _, user in users[:limit]:
+            user['presence_status'] = self.presence.status(user.pop('user_id'))
+            self.heartbeats.apply_pending(user)
+            matches.append(user)
+        return matches
+    
+    def get_counts(self, user_id: int) -> Dict[str, int]:
+        total_contacts = self.db.execute_query(
+            "SELECT COUNT(*) as count FROM user_contacts WHERE user_id = ?",
+            (user_id,),
+            fetch='one'
+        )
+        
+        favorite_contacts = self.db.execute_query(
+            "SELECT COUNT(*) as count FROM user_contacts WHERE user_id = ? AND is_favorite = 1",
+            (user_id,),
+            fetch='one'
+        )
+        
+        contact_ids = self.db.execute_query(
+            "SELECT contact_user_id FROM user_contacts WHERE user_id = ?",
+            (user_id,),
+            fetch='all'
+        )
+        online_contacts = sum(1 for row in contact_ids or []
+                              if self.presence.status(row['contact_user_id']) == 'online')
+        
+        mutual_contacts = self.db.execute_query(
+            "SELECT COUNT(*) as count FROM user_contacts WHERE contact_user_id = ?",
+            (user_id,),
+            fetch='one'
+        )
+        
+        return {
+            'total_contacts': total_contacts['count'] if total_contacts else 0,
+            'favorite_contacts': favorite_contacts['count'] if favorite_contacts else 0,
+            'online_contacts': online_contacts,
+            'mutual_contacts': mutual_contacts['count'] if mutual_contacts else 0
+        }
+    
+    def get_totals(self) -> Dict[str, int]:
+        total_contacts = self.db.execute_query(
+            "SELECT COUNT(*) as count FROM user_contacts",
+            fetch='one'
+        )
+        
+        unique_users_with_contacts = self.db.execute_query(
+            "SELECT COUNT(DISTINCT user_id) as count FROM user_contacts",
+            fetch='one'
+        )
+        
+        return {
+            'total_contact_relationships': total_contacts['count'] if total_contacts else 0,
+            'users_with_contacts': unique_users_with_contacts['count'] if unique_users_with_contacts else 0
+        }
+
+    def list_edges(self) -> List[Tuple[str, str]]:
+        rows = self.db.execute_read(
+            """
+            SELECT owner.username AS username, contact.username AS contact_username
+            FROM user_contacts uc
+            JOIN users owner ON owner.id = uc.user_id
+            JOIN users contact ON contact.id = uc.contact_user_id
+            """,
+            fetch='records'
+        )
+        return [(row['username'], row['contact_username']) for row in rows]
+
+def create_sqlite_repositories(db=None, heartbeats=None, presence=None) -> Repositories:
+    """Repositories that share one DatabaseManager, heartbeat buffer and presence registry"""
+    return Repositories(
+        'sqlite',
+        users=SQLiteUserRepository(db, heartbeats, presence),
+        calls=SQLiteCallRepository(db, heartbeats, presence),
+        contacts=SQLiteContactRepository(db, heartbeats, presence)
+    )
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+List, verify, create or restore smarttv.db backups.
+Usage: python restore_backup.py --list
+       python restore_backup.py --create
+       python restore_backup.py --verify latest
+       python restore_backup.py latest [--db /path/to/smarttv.db]
+Stop the server before restoring over the live database.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.backup import BackupManager, BackupError
+
+def print_manifest(manifest):
+    rows = ', '.join(f"{table}={count}" for table, count in manifest['row_counts'].items())
+    print(f"   {manifest['name']}  {manifest['size_bytes'] / 1024 / 1024:>7.1f} MB  "
+          f"schema v{manifest['schema_version']}  {rows}")
+
+def main():
+    parser = argparse.ArgumentParser(description='SmartTV database backups')
+    parser.add_argument('backup', nargs='?', help="Backup to restore (name, file or 'latest')")
+    parser.add_argument('--db', help='Database to restore into (defaults to SMARTTV_DB_PATH / the live database)')
+    parser.add_argument('--dir', help='Backup directory (defaults to DB_BACKUP_DIR)')
+    parser.add_argument('--list', action='store_true', help='List backups, newest first')
+    parser.add_argument('--create', action='store_true', help='Take a backup now')
+    parser.add_argument('--verify', metavar='BACKUP', help='Check a backup against its manifest checksum')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING)
+    backups = BackupManager(backup_dir=args.dir)
+    
+    try:
+        if args.create:
+            print("💾 Creating backup")
+            print_manifest(backups.create_backup())
+        elif args.list:
+            manifests = backups.list_backups()
+            print(f"💾 {len(manifests)} backups in {backups.backup_dir}")
+            for manifest in manifests:
+                print_manifest(manifest)
+        elif args.verify:
+            manifest = backups.verify(args.verify)
+            print(f"✅ {manifest['name']} matches sha256 {manifest['sha256']}")
+        elif args.backup:
+            result = backups.restore(args.backup, args.db)
+            print(f"✅ Restored {result['name']} to {result['restored_to']} in {result['restore_ms']}ms")
+            print_manifest(result)
+        else:
+            parser.print_help()
+            return False
+    except BackupError as e:
+        print(f"❌ {e}")
+        return False
+    
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Build a production-sized synthetic fleet directly in SQLite.
+Usage: python seed_fleet.py --db /tmp/fleet.db [--users 100000] [--seed 42]
+
+Bulk-inserts users, a power-law contact graph, presence rows, call and
+session histories and game scores in chunked transactions. The same seed and
+options always produce the same rows; only the timestamps move, since they
+are anchored at the time of seeding so liveness windows stay meaningful.
+Finished calls and ended sessions past the archive thresholds go straight to
+the history tables, as the archiver would have left them.
+
+test_query_plans.py and benchmark_storage_profile.py seed through seed_fleet().
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import DatabaseManager
+from database.timestamps import sql_epoch_ms
+
+# Usernames are 'U' plus four base-36 digits, the 5-character format /register accepts
+USERNAME_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+MAX_USERS = len(USERNAME_ALPHABET) ** 4
+
+FIRST_NAMES = ('Alice', 'Bob', 'Carol', 'Dave', 'Eve', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy',
+               'Mallory', 'Nina', 'Oscar', 'Peggy', 'Rupert', 'Sybil', 'Trent', 'Uma', 'Victor', 'Wendy')
+LAST_NAMES = ('Smith', 'Johnson', 'Wilson', 'Brown', 'Davis', 'Miller', 'Garcia', 'Lopez', 'Clark', 'Lewis',
+              'Walker', 'Young', 'King', 'Wright', 'Hill', 'Green', 'Baker', 'Nelson', 'Carter', 'Reed')
+DEVICE_MODELS = ('Samsung TV', 'LG TV', 'Raspberry Pi 4', 'Raspberry Pi 5', 'Sony Bravia')
+APP_VERSIONS = ('1.0.0', '1.1.0', '1.2.0', '1.2.1')
+
+# Final status of finished calls, weighted
+FINISHED_CALL_MIX = (('ended', 60), ('missed', 15), ('declined', 15), ('cancelled', 10))
+
+# Out-degree follows a Lomax (shifted Pareto) tail with this shape; popularity of contact targets is skewed by POPULARITY_SKEW
+CONTACT_PARETO_ALPHA = 1.5
+POPULARITY_SKEW = 2.5
+
+def username(index: int) -> str:
+    """Username of the index-th seeded user (user id index + 1)"""
+    chars = []
+    for _ in range(4):
+        index, digit = divmod(index, len(USERNAME_ALPHABET))
+        chars.append(USERNAME_ALPHABET[digit])
+    return 'U' + ''.join(reversed(chars))
+
+def display_name(index: int) -> str:
+    return f"{FIRST_NAMES[index % len(FIRST_NAMES)]} {LAST_NAMES[index // len(FIRST_NAMES) % len(LAST_NAMES)]}"
+
+class Timestamps:
+    """CURRENT_TIMESTAMP-format (UTC) strings relative to one anchor"""
+    
+    def __init__(self, now: float = None):
+        self.now = int(now if now is not None else time.time())
+    
+    def ago(self, seconds: float) -> str:
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.now - int(seconds)))
+
+def insert_chunks(db, query: str, rows, chunk_size: int) -> int:
+    """executemany in one short transaction per chunk; returns rows sent"""
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            with db.transaction() as conn:
+                conn.executemany(query, chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        with db.transaction() as conn:
+            conn.executemany(query, chunk)
+        total += len(chunk)
+    return total
+
+def poisson_offsets(rng: random.Random, count: int, window: float):
+    """About ``count`` event ages spread uniformly over ``window`` seconds, oldest first"""
+    if count <= 0:
+        return
+    rate = count / window
+    age = window - rng.expovariate(rate)
+    while age > 0:
+        yield age
+        age -= rng.expovariate(rate)
+
+def seed_fleet(db, users: int = 100000, seed: int = 42, avg_contacts: float = 12, max_contacts: int = 500,
+               mutual_ratio: float = 0.6, favorite_ratio: float = 0.1, online_ratio: float = 0.2,
+               calls_per_user: float = 5, sessions_per_user: float = 2, scores_per_user: float = 1,
+               history_days: float = 30, archive: bool = True, chunk_size: int = 50000,
+               now: float = None, verbose: bool = False):
+    """Seed an empty database; returns rows inserted per table"""
+    if users > MAX_USERS:
+        raise ValueError(f"At most {MAX_USERS} users fit the 5-character username format")
+    existing = db.execute_query("SELECT COUNT(*) FROM users", fetch='one')[0]
+    if existing:
+        raise ValueError(f"Database already has {existing} users; seed an empty database")
+    
+    rng = random.Random(seed)
+    ts = Timestamps(now)
+    window = history_days * 86400
+    call_archive_age = int(os.getenv('CALL_ARCHIVE_AFTER_MINUTES', 60)) * 60
+    session_archive_age = int(os.getenv('SESSION_ARCHIVE_AFTER_HOURS', 24)) * 3600
+    counts = {}
+    
+    def step(table, count, started, history_table=None, history=0):
+        counts[table] = count
+        if history_table:
+            counts[history_table] = history
+        if verbose:
+            elapsed = time.perf_counter() - started
+            archived = f"  (+{history} archived)" if history_table else ''
+            print(f"   {table:<24}{count + history:>10} rows  {elapsed:>7.1f}s  "
+                  f"{(count + history) / max(elapsed, 1e-9):>10.0f} rows/s{archived}")
+    
+    # Users: online TVs were seen within the last minute, the rest decay over days
+    online = [rng.random() < online_ratio for _ in range(users)]
+    last_seen_age = [rng.uniform(0, 60) if online[i] else min(rng.expovariate(1 / 86400) + 60, window)
+                     for i in range(users)]
+    started = time.perf_counter()
+    step('users', insert_chunks(db,
+        f"""INSERT INTO users (id, username, display_name, device_type, created_at, last_seen, metadata,
+                               last_seen_ms)
+           VALUES (?1, ?2, ?3, 'smarttv', ?4, ?5, ?6, {sql_epoch_ms('?5')})""",
+        ((i + 1, username(i), display_name(i),
+          ts.ago(last_seen_age[i] + rng.uniform(0, window)), ts.ago(last_seen_age[i]),
+          json.dumps({'device_model': rng.choice(DEVICE_MODELS), 'app_version': rng.choice(APP_VERSIONS)}))
+         for i in range(users)),
+        chunk_size), started)
+    
+    # Presence: most TVs have connected at least once
+    started = time.perf_counter()
+    step('user_presence', insert_chunks(db,
+        f"""INSERT INTO user_presence (user_id, status, last_seen, updated_at, updated_ms)
+            VALUES (?1, ?2, ?3, ?4, {sql_epoch_ms('?4')})""",
+        ((i + 1, 'online' if online[i] else 'offline', ts.ago(last_seen_age[i]), ts.ago(last_seen_age[i]))
+         for i in range(users) if online[i] or rng.random() < 0.9),
+        chunk_size), started)
+    
+    # Contacts: Pareto out-degree, targets drawn by skewed popularity so a few TVs
+    # (family hubs) appear in many lists; a share of edges is reciprocated
+    popularity = list(range(1, users + 1))
+    rng.shuffle(popularity)
+    
+    def pick_popular():
+        return popularity[int(users * rng.random() ** POPULARITY_SKEW)]
+    
+    def contact_rows():
+        for user_id in range(1, users + 1):
+            degree = min(max_contacts, users - 1, int((rng.paretovariate(CONTACT_PARETO_ALPHA) - 1) * avg_contacts / 2))
+            targets = set()
+            for _ in range(degree * 2):
+                if len(targets) >= degree:
+                    break
+                target = pick_popular()
+                if target != user_id:
+                    targets.add(target)
+            for target in sorted(targets):
+                added = ts.ago(rng.uniform(0, window))
+                favorite = 1 if rng.random() < favorite_ratio else 0
+                yield (user_id, target, added, favorite)
+                if rng.random() < mutual_ratio:
+                    yield (target, user_id, added, 1 if rng.random() < favorite_ratio else 0)
+    
+    started = time.perf_counter()
+    insert_chunks(db,
+        "INSERT OR IGNORE INTO user_contacts (user_id, contact_user_id, added_at, is_favorite) VALUES (?, ?, ?, ?)",
+        contact_rows(), chunk_size)
+    step('user_contacts', db.execute_query("SELECT COUNT(*) FROM user_contacts", fetch='one')[0], started)
+    
+    # Calls, oldest first so ids follow time and archived rows keep the lowest ids
+    statuses = [status for status, weight in FINISHED_CALL_MIX for _ in range(weight)]
+    
+    def call_rows():
+        call_number = 0
+        for age in poisson_offsets(rng, int(users * calls_per_user), window):
+            call_number += 1
+            caller, callee = rng.randint(1, users), pick_popular()
+            if caller == callee:
+                continue
+            status = rng.choice(statuses)
+            ring = rng.uniform(2, 20)
+            duration = 0
+            answered_at = None
+            if status == 'ended':
+                duration = int(rng.expovariate(1 / 600)) + 1
+                answered_at = ts.ago(age - ring)
+                ended_age = age - ring - duration
+            elif status == 'missed':
+                ended_age = age - 30
+            else:
+                ended_age = age - ring
+            if ended_age <= 0:
+                # Still in progress at the anchor time
+                status, ended_age = ('accepted', None) if answered_at else ('ringing', None)
+            archived_at = None
+            if archive and ended_age is not None and age > call_archive_age:
+                archived_at = ts.ago(age - call_archive_age)
+            yield archived_at, (call_number, caller, callee, str(uuid.UUID(int=rng.getrandbits(128))),
+                             f"call_{call_number}" if answered_at else None, status, ts.ago(age), answered_at,
+                             ts.ago(ended_age) if ended_age is not None else None, duration)
+        
+        # TVs being rung right now
+        for _ in range(max(1, int(users * online_ratio * 0.01))):
+            call_number += 1
+            caller, callee = rng.randint(1, users), pick_popular()
+            age = rng.uniform(0, 30)
+            yield None, (call_number, caller, callee, str(uuid.UUID(int=rng.getrandbits(128))), None,
+                          rng.choice(('pending', 'ringing')), ts.ago(age), None, None, 0)
+    
+    started = time.perf_counter()
+    live_calls, history_calls = split_rows(db, call_rows(), chunk_size,
+        f"""INSERT INTO calls (id, caller_id, callee_id, call_id, room_name, status, created_at,
+                               answered_at, ended_at, duration, created_ms, answered_ms, ended_ms)
+           VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, ?10,
+                   {sql_epoch_ms('?7')}, {sql_epoch_ms('?8')}, {sql_epoch_ms('?9')})""",
+        """INSERT INTO calls_history (id, caller_id, callee_id, call_id, room_name, status, created_at,
+                                      answered_at, ended_at, duration, archived_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""")
+    step('calls', live_calls, started, 'calls_history', history_calls)
+    
+    # Sessions, oldest first; a few recent ones are still active
+    def session_rows():
+        session_number = 0
+        for age in poisson_offsets(rng, int(users * sessions_per_user), window):
+            session_number += 1
+            length = rng.expovariate(1 / 900) + 30
+            active = length > age
+            archived_at = None
+            if archive and not active and age - length > session_archive_age:
+                archived_at = ts.ago(age - length - session_archive_age)
+            yield archived_at, (session_number, rng.randint(1, users), f"seed_{session_number}",
+                             f"room_{session_number}", rng.choice(('video_call', 'trivia_game')),
+                             ts.ago(age), None if active else ts.ago(age - length), 1 if active else 0)
+    
+    started = time.perf_counter()
+    live_sessions, history_sessions = split_rows(db, session_rows(), chunk_size,
+        """INSERT INTO user_sessions (id, user_id, session_token, room_name, session_type,
+                                      started_at, ended_at, is_active)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        """INSERT INTO user_sessions_history (id, user_id, session_token, room_name, session_type,
+                                              started_at, ended_at, is_active, archived_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""")
+    step('user_sessions', live_sessions, started, 'user_sessions_history', history_sessions)
+    
+    # Game scores: trivia rounds of ten questions
+    def score_rows():
+        for _ in range(int(users * scores_per_user)):
+            correct = rng.randint(0, 10)
+            yield (rng.randint(1, users), correct * 100 + rng.randint(0, 99), correct,
+                   rng.randint(60, 600), ts.ago(rng.uniform(0, window)))
+    
+    started = time.perf_counter()
+    step('game_scores', insert_chunks(db,
+        """INSERT INTO game_scores (user_id, game_type, score, questions_answered, correct_answers,
+                                    game_duration, played_at)
+           VALUES (?, 'trivia', ?, 10, ?, ?, ?)""",
+        score_rows(), chunk_size), started)
+    
+    # Archived rows can hold the highest ids; keep AUTOINCREMENT above them so
+    # the archiver's INSERT OR REPLACE never overwrites history
+    with db.transaction() as conn:
+        for table, history_table in (('calls', 'calls_history'), ('user_sessions', 'user_sessions_history')):
+            highest = conn.execute(
+                f"SELECT MAX(id) FROM (SELECT id FROM {table} UNION ALL SELECT id FROM {history_table})"
+            ).fetchone()[0] or 0
+            if conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (highest, table)).rowcount == 0:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, highest))
+    
+    db.table_versions.bump_all()
+    return counts
+
+def split_rows(db, rows, chunk_size: int, live_query: str, history_query: str):
+    """Insert (archived_at, row) pairs into the history table, or the live one when archived_at is None
+
+    Returns (live, history) row counts.
+    """
+    live, history = [], []
+    counts = [0, 0]
+    
+    def flush(final=False):
+        with db.transaction() as conn:
+            if live and (final or len(live) >= chunk_size):
+                conn.executemany(live_query, live)
+                counts[0] += len(live)
+                live.clear()
+            if history and (final or len(history) >= chunk_size):
+                conn.executemany(history_query, history)
+                counts[1] += len(history)
+                history.clear()
+    
+    for archived_at, row in rows:
+        if archived_at:
+            history.append(row + (archived_at,))
+        else:
+            live.append(row)
+        if len(live) >= chunk_size or len(history) >= chunk_size:
+            flush()
+    flush(final=True)
+    return counts[0], counts[1]
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a synthetic SmartTV fleet')
+    parser.add_argument('--db', required=True, help='Database file to create or fill (must have no users)')
+    parser.add_argument('--users', type=int, default=100000, help='Number of TVs')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--avg-contacts', type=float, default=12, help='Mean contact list length before reciprocation')
+    parser.add_argument('--calls-per-user', type=float, default=5, help='Calls per TV over the history window')
+    parser.add_argument('--sessions-per-user', type=float, default=2, help='Sessions per TV over the history window')
+    parser.add_argument('--scores-per-user', type=float, default=1, help='Game scores per TV')
+    parser.add_argument('--online', type=float, default=0.2, help='Share of TVs online now')
+    parser.add_argument('--days', type=float, default=30, help='History window in days')
+    parser.add_argument('--no-archive', action='store_true', help='Keep all calls and sessions in the live tables')
+    args = parser.parse_args()
+    
+    print(f"🌱 Seeding {args.users} TVs into {args.db} (seed {args.seed})")
+    print("=" * 64)
+    db = DatabaseManager(db_path=args.db)
+    started = time.perf_counter()
+    try:
+        counts = seed_fleet(
+            db, args.users, args.seed, avg_contacts=args.avg_contacts, online_ratio=args.online,
+            calls_per_user=args.calls_per_user, sessions_per_user=args.sessions_per_user,
+            scores_per_user=args.scores_per_user, history_days=args.days, archive=not args.no_archive,
+            verbose=True
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        return False
+    finally:
+        db.close()
+    
+    print("=" * 64)
+    print(f"✅ {sum(counts.values())} rows in {time.perf_counter() - started:.1f}s: "
+          + ', '.join(f"{table}={count}" for table, count in counts.items()))
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
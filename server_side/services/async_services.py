@@ -0,0 +1,149 @@
+"""
+Async variants of the user, call/presence and contact services
+
+Each method awaits the synchronous service method on the database executor,
+so a multi-statement unit of work (initiate_call, add_contact, ...) still
+runs start to finish on one thread inside its transaction. With the memory
+backend there is no blocking I/O and methods run inline on the event loop.
+"""
+
+from typing import Optional, Dict, List, Any
+from database.async_database import async_db_manager
+from repositories.factory import repositories as default_repositories
+from services.user_service import UserService
+from services.call_service import CallService
+from services.contact_service import ContactService
+
+class AsyncService:
+    """Runs a synchronous service's methods without blocking the event loop"""
+    
+    def __init__(self, service, repositories, async_db=None):
+        self.service = service
+        self.async_db = async_db or async_db_manager
+        self.inline = repositories.backend == 'memory'
+    
+    async def _call(self, method, *args, **kwargs):
+        if self.inline:
+            return method(*args, **kwargs)
+        return await self.async_db.run(method, *args, **kwargs)
+
+class AsyncUserService(AsyncService):
+    
+    def __init__(self, repositories=None, async_db=None):
+        repositories = repositories or default_repositories
+        super().__init__(UserService(repositories), repositories, async_db)
+    
+    async def register_or_update_user(self, username: str, display_name: str = None,
+                                      device_type: str = 'smarttv', metadata: Dict = None) -> Dict[str, Any]:
+        return await self._call(self.service.register_or_update_user, username, display_name, device_type, metadata)
+    
+    async def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        return await self._call(self.service.get_user_by_username, username)
+    
+    async def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self._call(self.service.get_user_by_id, user_id)
+    
+    async def update_last_seen(self, username: str) -> bool:
+        return await self._call(self.service.update_last_seen, username)
+    
+    async def update_user_info(self, username: str, display_name: str = None, metadata: Dict = None) -> bool:
+        return await self._call(self.service.update_user_info, username, display_name, metadata)
+    
+    async def get_active_users(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return await self._call(self.service.get_active_users, limit)
+    
+    async def create_session(self, username: str, session_type: str = 'video_call',
+                             room_name: str = None) -> Optional[str]:
+        return await self._call(self.service.create_session, username, session_type, room_name)
+    
+    async def end_session(self, session_token: str) -> bool:
+        return await self._call(self.service.end_session, session_token)
+    
+    async def get_user_stats(self, username: str) -> Dict[str, Any]:
+        return await self._call(self.service.get_user_stats, username)
+    
+    async def save_game_score(self, username: str, game_type: str, score: int,
+                              questions_answered: int, correct_answers: int,
+                              game_duration: int = 0, room_name: str = None) -> bool:
+        return await self._call(self.service.save_game_score, username, game_type, score,
+                                questions_answered, correct_answers, game_duration, room_name)
+
+class AsyncCallService(AsyncService):
+    
+    def __init__(self, repositories=None, async_db=None):
+        repositories = repositories or default_repositories
+        super().__init__(CallService(repositories), repositories, async_db)
+    
+    async def get_online_users(self, exclude_username: str = None, contacts_only: bool = False,
+                               include_offline: bool = False) -> List[Dict[str, Any]]:
+        return await self._call(self.service.get_online_users, exclude_username, contacts_only, include_offline)
+    
+    async def get_online_users_since(self, exclude_username: str = None, contacts_only: bool = False,
+                                     since: int = None) -> Dict[str, Any]:
+        return await self._call(self.service.get_online_users_since, exclude_username, contacts_only, since)
+    
+    async def initiate_call(self, caller_username: str, callee_username: str) -> Optional[Dict[str, Any]]:
+        return await self._call(self.service.initiate_call, caller_username, callee_username)
+    
+    async def answer_call(self, call_id: str, callee_username: str) -> Optional[Dict[str, Any]]:
+        return await self._call(self.service.answer_call, call_id, callee_username)
+    
+    async def decline_call(self, call_id: str, callee_username: str) -> bool:
+        return await self._call(self.service.decline_call, call_id, callee_username)
+    
+    async def cancel_call(self, call_id: str, caller_username: str) -> bool:
+        return await self._call(self.service.cancel_call, call_id, caller_username)
+    
+    async def end_call(self, call_id: str, username: str) -> bool:
+        return await self._call(self.service.end_call, call_id, username)
+    
+    async def get_call_status(self, call_id: str) -> Optional[Dict[str, Any]]:
+        return await self._call(self.service.get_call_status, call_id)
+    
+    async def get_pending_calls_for_user(self, username: str) -> List[Dict[str, Any]]:
+        return await self._call(self.service.get_pending_calls_for_user, username)
+    
+    async def update_presence(self, username: str, status: str = 'online', socket_id: str = None) -> bool:
+        return await self._call(self.service.update_presence, username, status, socket_id)
+    
+    async def connect_presence(self, username: str, socket_id: str) -> bool:
+        return await self._call(self.service.connect_presence, username, socket_id)
+    
+    async def disconnect_presence(self, socket_id: str) -> bool:
+        return await self._call(self.service.disconnect_presence, socket_id)
+    
+    async def cleanup_old_calls(self, hours: int = 24) -> int:
+        return await self._call(self.service.cleanup_old_calls, hours)
+
+class AsyncContactService(AsyncService):
+    
+    def __init__(self, repositories=None, async_db=None):
+        repositories = repositories or default_repositories
+        super().__init__(ContactService(repositories), repositories, async_db)
+    
+    async def add_contact(self, username: str, contact_username: str) -> Dict[str, Any]:
+        return await self._call(self.service.add_contact, username, contact_username)
+    
+    async def remove_contact(self, username: str, contact_username: str) -> bool:
+        return await self._call(self.service.remove_contact, username, contact_username)
+    
+    async def get_contact_list_with_status(self, username: str) -> List[Dict[str, Any]]:
+        return await self._call(self.service.get_contact_list_with_status, username)
+    
+    async def get_mutual_contacts(self, username: str) -> List[Dict[str, Any]]:
+        return await self._call(self.service.get_mutual_contacts, username)
+    
+    async def search_users(self, query: str, limit: int = 20, exclude_username: str = None) -> List[Dict[str, Any]]:
+        return await self._call(self.service.search_users, query, limit, exclude_username)
+    
+    async def set_favorite_status(self, username: str, contact_username: str, is_favorite: bool) -> bool:
+        return await self._call(self.service.set_favorite_status, username, contact_username, is_favorite)
+    
+    async def is_contact(self, username: str, contact_username: str) -> bool:
+        return await self._call(self.service.is_contact, username, contact_username)
+    
+    async def get_contact_stats(self, username: str) -> Dict[str, Any]:
+        return await self._call(self.service.get_contact_stats, username)
+    
+    async def get_health_status(self) -> Dict[str, Any]:
+        return await self._call(self.service.get_health_status)
@@ -3,9 +3,14 @@ Background service for automated cleanup and maintenance tasks
 """
 
 import logging
-from datetime import datetime, timedelta
+import os
+from datetime import datetime
+from typing import Optional
 from apscheduler.schedulers.background import BackgroundScheduler
 from database.database import db_manager
+from database.archive import archiver
+from database.backup import backup_manager
+from database.timestamps import now_ms, NOW_MS_SQL
 from services.twilio_service import TwilioService
 
 logger = logging.getLogger(__name__)
@@ -16,6 +21,13 @@ class BackgroundService:
     def __init__(self):
         self.scheduler = BackgroundScheduler()
         self.db = db_manager
+        self.archiver = archiver
+        self.backups = backup_manager
+        self.backup_interval_hours = float(os.getenv('DB_BACKUP_INTERVAL_HOURS', 6))
+        self.vacuum_interval_minutes = float(os.getenv('DB_VACUUM_INTERVAL_MINUTES', 30))
+        self.vacuum_max_pages = int(os.getenv('DB_VACUUM_MAX_PAGES', 500))
+        self.vacuum_min_free_pages = int(os.getenv('DB_VACUUM_MIN_FREE_PAGES', 100))
+        self.last_vacuum = None
         self.is_running = False
         
         # Initialize Twilio service for room monitoring
@@ -33,26 +45,37 @@ class BackgroundService:
             return
         
         try:
-            # Clean up inactive users every 2 minutes
+            # Archive finished calls and ended sessions every 5 minutes
             self.scheduler.add_job(
-                func=self.cleanup_inactive_users,
+                func=self.archive_history,
                 trigger="interval",
-                minutes=2,
-                id='cleanup_inactive_users',
-                name='Cleanup Inactive Users',
+                minutes=5,
+                id='archive_history',
+                name='Archive Calls and Sessions',
                 replace_existing=True
             )
             
-            # Clean up old calls every 5 minutes
+            # Return free pages left by archival and presence churn to the filesystem
             self.scheduler.add_job(
-                func=self.cleanup_old_calls,
+                func=self.vacuum_database,
                 trigger="interval",
-                minutes=5,
-                id='cleanup_old_calls',
-                name='Cleanup Old Calls',
+                minutes=self.vacuum_interval_minutes,
+                id='vacuum_database',
+                name='Incremental Vacuum',
                 replace_existing=True
             )
             
+            # Online database backup (DB_BACKUP_INTERVAL_HOURS=0 disables it)
+            if self.backup_interval_hours > 0:
+                self.scheduler.add_job(
+                    func=self.backup_database,
+                    trigger="interval",
+                    hours=self.backup_interval_hours,
+                    id='backup_database',
+                    name='Backup Database',
+                    replace_existing=True
+                )
+            
             # Sync calls with Twilio reality every 3 minutes (if Twilio available)
             if self.twilio_service:
                 self.scheduler.add_job(
@@ -88,64 +111,48 @@ class BackgroundService:
         except Exception as e:
             logger.error(f"Error stopping background service: {e}")
     
-    def cleanup_inactive_users(self):
-        """Mark users as offline if they haven't been active in the last 3 minutes"""
+    def archive_history(self):
+        """Move finished calls and ended sessions past their retention age to history tables"""
         try:
-            three_minutes_ago = datetime.now() - timedelta(minutes=3)
+            moved = self.archiver.run()
             
-            # Get count of users who will be marked offline
-            count_query = """
-                SELECT COUNT(*) FROM user_presence 
-                WHERE status = 'online' AND updated_at < ?
-            """
-            result = self.db.execute_query(count_query, (three_minutes_ago.isoformat(),), fetch='one')
-            users_to_cleanup = result[0] if result else 0
-            
-            if users_to_cleanup > 0:
-                # Update presence to offline for inactive users
-                update_query = """
-                    UPDATE user_presence 
-                    SET status = 'offline', updated_at = CURRENT_TIMESTAMP
-                    WHERE status = 'online' AND updated_at < ?
-                """
-                self.db.execute_query(update_query, (three_minutes_ago.isoformat(),))
-                
-                logger.info(f"🧹 Marked {users_to_cleanup} inactive users as offline")
+            if any(moved.values()):
+                logger.info(f"🗄️ Archived {moved['calls']} calls and {moved['user_sessions']} sessions")
             else:
-                logger.debug("👥 All users are active - no cleanup needed")
+                logger.debug("📞 No finished calls or sessions to archive")
                 
         except Exception as e:
-            logger.error(f"Failed to cleanup inactive users: {e}")
+            logger.error(f"Failed to archive calls and sessions: {e}")
     
-    def cleanup_old_calls(self):
-        """Clean up old completed calls (older than 1 hour)"""
+    def vacuum_database(self):
+        """Reclaim up to DB_VACUUM_MAX_PAGES free pages once the freelist is worth shrinking"""
         try:
-            one_hour_ago = datetime.now() - timedelta(hours=1)
+            # Refresh the per-table page scan reported by the health checks
+            freelist = self.db.get_fragmentation_stats(scan_pages=True)['freelist_count']
             
-            # Get count of calls to be cleaned
-            count_query = """
-                SELECT COUNT(*) FROM calls 
-                WHERE status IN ('declined', 'cancelled', 'ended', 'missed') 
-                AND created_at < ?
-            """
-            result = self.db.execute_query(count_query, (one_hour_ago.isoformat(),), fetch='one')
-            calls_to_cleanup = result[0] if result else 0
+            # A small freelist is cheaper to reuse for new rows than to give back
+            if freelist < self.vacuum_min_free_pages:
+                logger.debug(f"🧽 {freelist} free pages - no vacuum needed")
+                return
             
-            if calls_to_cleanup > 0:
-                # Delete old completed calls
-                delete_query = """
-                    DELETE FROM calls 
-                    WHERE status IN ('declined', 'cancelled', 'ended', 'missed') 
-                    AND created_at < ?
-                """
-                self.db.execute_query(delete_query, (one_hour_ago.isoformat(),))
-                
-                logger.info(f"🗑️ Cleaned up {calls_to_cleanup} old call records")
-            else:
-                logger.debug("📞 No old calls to cleanup")
-                
+            self.last_vacuum = dict(self.db.incremental_vacuum(self.vacuum_max_pages),
+                                    timestamp=datetime.now().isoformat())
+            if 'skipped' in self.last_vacuum:
+                logger.warning(f"🧽 {freelist} free pages not reclaimed: {self.last_vacuum['skipped']} "
+                               f"(run vacuum_db.py once during a quiet window)")
+                return
+            logger.info(f"🧽 Incremental vacuum freed {self.last_vacuum['pages_freed']} pages "
+                        f"({self.last_vacuum['freelist_after']} still free) in {self.last_vacuum['elapsed_ms']}ms")
+        
+        except Exception as e:
+            logger.error(f"Failed to vacuum database: {e}")
+    
+    def backup_database(self):
+        """Take an online backup of the database and prune old ones"""
+        try:
+            self.backups.create_backup()
         except Exception as e:
-            logger.error(f"Failed to cleanup old calls: {e}")
+            logger.error(f"Failed to back up database: {e}")
     
     def sync_calls_with_twilio(self):
         """Sync database call status with Twilio room reality (crash-resistant)"""
@@ -156,7 +163,7 @@ class BackgroundService:
         try:
             # Get all accepted calls from database
             accepted_calls_query = """
-                SELECT call_id, room_name, answered_at, created_at,
+                SELECT call_id, room_name, answered_at, answered_ms, created_at,
                        caller_id, callee_id
                 FROM calls 
                 WHERE status = 'accepted' AND room_name IS NOT NULL
@@ -210,7 +217,7 @@ class BackgroundService:
                     
                     if should_end_call:
                         # End the call in database
-                        success = self._end_call_with_twilio_sync(call_id, call['answered_at'], end_reason)
+                        success = self._end_call_with_twilio_sync(call_id, call['answered_ms'], end_reason)
                         if success:
                             calls_ended += 1
                             logger.info(f"🔧 Ended call {call_id} - {end_reason}")
@@ -232,11 +239,10 @@ class BackgroundService:
         """Check if a call should be considered abandoned (empty room too long)"""
         try:
             # If room is empty for more than 5 minutes, consider it abandoned
-            answered_at = datetime.fromisoformat(call['answered_at'])
-            time_since_answered = datetime.now() - answered_at
+            seconds_since_answered = (now_ms() - call['answered_ms']) / 1000
             
             # Conservative: don't end calls that just started
-            if time_since_answered.total_seconds() < 300:  # 5 minutes
+            if seconds_since_answered < 300:  # 5 minutes
                 return False
                 
             # If room has been empty, it's likely abandoned
@@ -250,27 +256,25 @@ class BackgroundService:
         """Check if a call has had only one participant for too long"""
         try:
             # If only one person for more than 10 minutes, likely other person crashed
-            answered_at = datetime.fromisoformat(call['answered_at'])
-            time_since_answered = datetime.now() - answered_at
+            seconds_since_answered = (now_ms() - call['answered_ms']) / 1000
             
             # Conservative: only end if call has been going >10 minutes with 1 person
-            return time_since_answered.total_seconds() > 600  # 10 minutes
+            return seconds_since_answered > 600  # 10 minutes
             
         except Exception as e:
             logger.error(f"Error checking single participant timeout: {e}")
             return False
     
-    def _end_call_with_twilio_sync(self, call_id: str, answered_at: str, reason: str = "twilio_sync") -> bool:
+    def _end_call_with_twilio_sync(self, call_id: str, answered_ms: Optional[int], reason: str = "twilio_sync") -> bool:
         """End a call with proper duration calculation"""
         try:
-            # Calculate duration from answered_at to now
-            answered_time = datetime.fromisoformat(answered_at)
-            duration = int((datetime.now() - answered_time).total_seconds())
+            # Calculate duration from answered_ms to now
+            duration = max(0, (now_ms() - answered_ms) // 1000) if answered_ms else 0
             
             # Update call status in database
             result = self.db.execute_query(
-                """UPDATE calls 
-                   SET status = 'ended', ended_at = CURRENT_TIMESTAMP, duration = ?
+                f"""UPDATE calls 
+                   SET status = 'ended', ended_at = CURRENT_TIMESTAMP, ended_ms = {NOW_MS_SQL}, duration = ?
                    WHERE call_id = ? AND status = 'accepted'""",
                 (duration, call_id)
             )
@@ -288,6 +292,9 @@ class BackgroundService:
         """Get background service status"""
         return {
             'running': self.is_running,
+            'archive': self.archiver.stats(),
+            'backups': self.backups.stats(),
+            'last_vacuum': self.last_vacuum,
             'jobs': [
                 {
                     'id': job.id,
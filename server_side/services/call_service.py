@@ -3,89 +3,34 @@ import logging
 import uuid
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Any
-from database.database import db_manager
+from database.archive import cutoff_timestamp
+from database.contention import DatabaseBusyError
+from database.timestamps import now_ms
+from repositories.factory import repositories as default_repositories
+from services.presence_feed import presence_feed
 
 logger = logging.getLogger(__name__)
 
+# Online users without a presence update this long are shown as offline
+ONLINE_WINDOW_MS = 120 * 1000
+
 class CallService:
     """Service layer for managing user-to-user calls"""
     
-    def __init__(self):
-        self.db = db_manager
+    def __init__(self, repositories=None, feed=None):
+        repositories = repositories or default_repositories
+        self.users = repositories.users
+        self.calls = repositories.calls
+        self.feed = feed or presence_feed
     
     def get_online_users(self, exclude_username: str = None, contacts_only: bool = False, include_offline: bool = False) -> List[Dict[str, Any]]:
         """Get list of users who are currently online, optionally filtered by contact list. If include_offline=True, shows all users with status"""
         try:
             logger.info(f"=== GET_ONLINE_USERS CALLED === exclude: {exclude_username}, contacts_only: {contacts_only}, include_offline: {include_offline}")
-            exclude_clause = ""
-            contact_filter = ""
-            params = []
-            
-            if contacts_only and exclude_username:
-                # Only show users who are in the requesting user's contact list
-                contact_filter = """
-                    AND EXISTS (
-                        SELECT 1 FROM user_contacts uc 
-                        JOIN users requester ON requester.username = ?
-                        WHERE uc.user_id = requester.id AND uc.contact_user_id = u.id
-                    )
-                """
-                params.append(exclude_username)
-            
-            if exclude_username:
-                exclude_clause = "AND u.username != ?"
-                params.append(exclude_username)
-            
-            # Use presence table status as primary source of truth
-            query = f"""
-                SELECT u.username, u.display_name, u.last_seen,
-                       COALESCE(up.status, 'offline') as presence_status,
-                       COALESCE(up.updated_at, u.last_seen) as updated_at,
-                       CASE WHEN uc_fav.is_favorite = 1 THEN 1 ELSE 0 END as is_favorite
-                FROM users u
-                LEFT JOIN user_presence up ON u.id = up.user_id
-                LEFT JOIN user_contacts uc_fav ON (
-                    uc_fav.contact_user_id = u.id AND 
-                    uc_fav.user_id = (SELECT id FROM users WHERE username = ?)
-                )
-                WHERE 1=1 {exclude_clause} {contact_filter}
-                ORDER BY 
-                    CASE WHEN uc_fav.is_favorite = 1 THEN 1 ELSE 0 END DESC,  -- Favorites first
-                    CASE WHEN COALESCE(up.status, 'offline') = 'online' THEN 1 ELSE 0 END DESC,  -- Online users first (removed 10-second check)
-                    u.username ASC  -- Sort by username (ID)
-            """
+            results = self.calls.list_directory(exclude_username, contacts_only)
+            logger.info(f"Query returned {len(results)} rows")
             
-            # Add the username parameter for the favorite check
-            final_params = []
-            if exclude_username:
-                final_params.append(exclude_username)  # For favorite check
-            final_params.extend(params)  # Add other parameters
-            
-            results = self.db.execute_query(query, tuple(final_params), fetch='all')
-            logger.info(f"Query returned {len(results) if results else 0} rows")
-            
-            all_users = []
-            for row in results or []:
-                try:
-                    # Convert row to dict for safe access
-                    row_dict = dict(row)
-                    
-                    # Determine if user is actually online based on presence status and recency
-                    is_online = self._is_user_actually_online(row_dict['presence_status'], row_dict.get('updated_at'))
-                    
-                    logger.info(f"User {row_dict['username']}: presence_status={row_dict['presence_status']}, is_online={is_online}, updated_at={row_dict.get('updated_at', 'N/A')}")
-                    
-                    all_users.append({
-                        'username': row_dict['username'],
-                        'display_name': row_dict['display_name'],
-                        'last_seen': row_dict['last_seen'],
-                        'presence_status': row_dict['presence_status'],
-                        'is_online': is_online,
-                        'is_favorite': bool(row_dict['is_favorite']) if row_dict['is_favorite'] is not None else False
-                    })
-                except Exception as row_error:
-                    logger.error(f"Error processing row: {row_error}")
-                    continue
+            all_users = self._directory_entries(results)
             
             logger.info(f"Returning {len(all_users)} users: {[u['username'] + '(' + ('ON' if u['is_online'] else 'OFF') + ')' for u in all_users]}")
             return all_users
@@ -98,75 +43,102 @@ class CallService:
             logger.error(f"Traceback: {traceback.format_exc()}")
             return []
     
+    def get_online_users_since(self, exclude_username: str = None, contacts_only: bool = False,
+                               since: int = None) -> Dict[str, Any]:
+        """Directory changes since a version cursor, or a full snapshot without a usable one
+        
+        Returns version (the cursor for the next call), full, users and, for
+        deltas, removed: usernames that left this requester's directory.
+        """
+        # Taken before reading, so a change that lands mid-query is sent again next time
+        version = self.feed.version
+        changed = self.feed.changed_since(since, exclude_username) if since is not None else None
+        
+        if changed is None:
+            users = self.get_online_users(exclude_username, contacts_only)
+            return {'version': version, 'full': True, 'users': users, 'removed': []}
+        
+        changed.discard(exclude_username)
+        try:
+            rows = self.calls.list_directory(exclude_username, contacts_only, changed) if changed else []
+        except DatabaseBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to get directory changes since {since}: {e}")
+            users = self.get_online_users(exclude_username, contacts_only)
+            return {'version': version, 'full': True, 'users': users, 'removed': []}
+        
+        users = self._directory_entries(rows)
+        listed = {user['username'] for user in users}
+        return {'version': version, 'full': False, 'users': users, 'removed': sorted(changed - listed)}
+    
+    def _directory_entries(self, rows) -> List[Dict[str, Any]]:
+        """Directory rows as API entries, favorites first, then online users, then by username"""
+        entries = []
+        now = now_ms()
+        for row_dict in rows:
+            try:
+                # Determine if user is actually online based on presence status and recency
+                is_online = self._is_user_actually_online(row_dict['presence_status'], row_dict.get('updated_ms'), now)
+                
+                logger.info(f"User {row_dict['username']}: presence_status={row_dict['presence_status']}, is_online={is_online}, updated_at={row_dict.get('updated_at', 'N/A')}")
+                
+                entries.append({
+                    'username': row_dict['username'],
+                    'display_name': row_dict['display_name'],
+                    'last_seen': row_dict['last_seen'],
+                    'presence_status': row_dict['presence_status'],
+                    'is_online': is_online,
+                    'is_favorite': bool(row_dict['is_favorite']) if row_dict['is_favorite'] is not None else False
+                })
+            except Exception as row_error:
+                logger.error(f"Error processing row: {row_error}")
+                continue
+        
+        # Buffered heartbeats may change the online ordering the backend produced
+        entries.sort(key=lambda u: (not u['is_favorite'], u['presence_status'] != 'online', u['username']))
+        return entries
+    
     def initiate_call(self, caller_username: str, callee_username: str) -> Optional[Dict[str, Any]]:
         """Initiate a call from caller to callee"""
         try:
             logger.info(f"=== INITIATING CALL: {caller_username} -> {callee_username} ===")
             
-            # Get user IDs
-            caller = self.db.execute_query(
-                "SELECT id, username FROM users WHERE username = ?",
-                (caller_username,),
-                fetch='one'
-            )
-            callee = self.db.execute_query(
-                "SELECT id, username FROM users WHERE username = ?",
-                (callee_username,),
-                fetch='one'
-            )
-            
-            logger.info(f"Caller lookup: {caller}")
-            logger.info(f"Callee lookup: {callee}")
-            
-            if not caller or not callee:
-                logger.warning(f"Invalid users for call: {caller_username} -> {callee_username}")
-                logger.warning(f"Caller found: {caller is not None}, Callee found: {callee is not None}")
-                return None
-            
-            # Check ALL calls in database for debugging
-            all_calls = self.db.execute_query(
-                "SELECT call_id, caller_id, callee_id, status FROM calls",
-                (),
-                fetch='all'
-            )
-            logger.info(f"All calls in database: {[dict(call) for call in all_calls] if all_calls else 'None'}")
-            
-            # Check for existing calls between these users and auto-cleanup
-            existing_call_query = """SELECT call_id, status FROM calls 
-                   WHERE ((caller_id = ? AND callee_id = ?) OR (caller_id = ? AND callee_id = ?))
-                   AND status IN ('pending', 'ringing', 'accepted')"""
-            existing_call = self.db.execute_query(
-                existing_call_query,
-                (caller['id'], callee['id'], callee['id'], caller['id']),
-                fetch='one'
-            )
-            
-            logger.info(f"Existing call query: {existing_call_query}")
-            logger.info(f"Query params: caller_id={caller['id']}, callee_id={callee['id']}")
-            logger.info(f"Existing call result: {dict(existing_call) if existing_call else 'None'}")
-            
-            if existing_call:
-                logger.info(f"Auto-clearing existing call between {caller_username} and {callee_username}: {dict(existing_call)}")
+            # Lookups, conflict check and insert run as one unit of work so two
+            # TVs calling each other at the same moment cannot both end up with
+            # an active call
+            with self.calls.transaction():
+                # Get user IDs
+                users_by_name = self.users.get_by_usernames((caller_username, callee_username))
+                caller = users_by_name.get(caller_username)
+                callee = users_by_name.get(callee_username)
                 
-                # Automatically clear the existing call to allow the new one
-                self.db.execute_query(
-                    """UPDATE calls 
-                       SET status = 'cancelled', ended_at = CURRENT_TIMESTAMP
-                       WHERE call_id = ?""",
-                    (existing_call['call_id'],)
-                )
+                logger.info(f"Caller lookup: {caller}")
+                logger.info(f"Callee lookup: {callee}")
                 
-                logger.info(f"Previous call {existing_call['call_id']} auto-cancelled to allow new call")
-            
-            # Generate unique call ID
-            call_id = str(uuid.uuid4())
-            
-            # Create call record
-            self.db.execute_query(
-                """INSERT INTO calls (caller_id, callee_id, call_id, status) 
-                   VALUES (?, ?, ?, 'pending')""",
-                (caller['id'], callee['id'], call_id)
-            )
+                if not caller or not callee:
+                    logger.warning(f"Invalid users for call: {caller_username} -> {callee_username}")
+                    logger.warning(f"Caller found: {caller is not None}, Callee found: {callee is not None}")
+                    return None
+                
+                # Check for existing calls between these users and auto-cleanup
+                existing_call = self.calls.find_active_between(caller['id'], callee['id'])
+                
+                logger.info(f"Existing call result: {existing_call}")
+                
+                if existing_call:
+                    logger.info(f"Auto-clearing existing call between {caller_username} and {callee_username}: {existing_call}")
+                    
+                    # Automatically clear the existing call to allow the new one
+                    self.calls.cancel(existing_call['call_id'])
+                    
+                    logger.info(f"Previous call {existing_call['call_id']} auto-cancelled to allow new call")
+                
+                # Generate unique call ID
+                call_id = str(uuid.uuid4())
+                
+                # Create call record
+                self.calls.create(caller['id'], callee['id'], call_id)
             
             logger.info(f"Call initiated: {caller_username} -> {callee_username} (ID: {call_id})")
             
@@ -178,6 +150,9 @@ class CallService:
                 'created_at': datetime.now().isoformat()
             }
             
+        except DatabaseBusyError:
+            # Let the route answer 503 so the TV retries instead of giving up
+            raise
         except Exception as e:
             logger.error(f"Failed to initiate call: {e}")
             return None
@@ -185,33 +160,19 @@ class CallService:
     def answer_call(self, call_id: str, callee_username: str) -> Optional[Dict[str, Any]]:
         """Answer an incoming call"""
         try:
-            # Get call details
-            call = self.db.execute_query(
-                """SELECT c.*, 
-                          u1.username as caller_username,
-                          u2.username as callee_username
-                   FROM calls c
-                   JOIN users u1 ON c.caller_id = u1.id
-                   JOIN users u2 ON c.callee_id = u2.id
-                   WHERE c.call_id = ? AND u2.username = ? AND c.status IN ('pending', 'ringing')""",
-                (call_id, callee_username),
-                fetch='one'
-            )
-            
-            if not call:
-                logger.warning(f"Invalid call answer attempt: {call_id} by {callee_username}")
-                return None
-            
-            # Generate unique room name for this call
-            room_name = f"call_{call_id[:8]}"
-            
-            # Update call status
-            self.db.execute_query(
-                """UPDATE calls 
-                   SET status = 'accepted', answered_at = CURRENT_TIMESTAMP, room_name = ?
-                   WHERE call_id = ?""",
-                (room_name, call_id)
-            )
+            with self.calls.transaction():
+                # Get call details
+                call = self.calls.get_answerable(call_id, callee_username)
+                
+                if not call:
+                    logger.warning(f"Invalid call answer attempt: {call_id} by {callee_username}")
+                    return None
+                
+                # Generate unique room name for this call
+                room_name = f"call_{call_id[:8]}"
+                
+                # Update call status
+                self.calls.accept(call_id, room_name)
             
             logger.info(f"Call answered: {call['caller_username']} -> {callee_username} (Room: {room_name})")
             
@@ -231,14 +192,7 @@ class CallService:
         """Decline an incoming call"""
         try:
             # Update call status
-            result = self.db.execute_query(
-                """UPDATE calls 
-                   SET status = 'declined', ended_at = CURRENT_TIMESTAMP
-                   WHERE call_id = ? AND callee_id = (
-                       SELECT id FROM users WHERE username = ?
-                   ) AND status IN ('pending', 'ringing')""",
-                (call_id, callee_username)
-            )
+            result = self.calls.decline(call_id, callee_username)
             
             if result:
                 logger.info(f"Call declined: {call_id} by {callee_username}")
@@ -252,14 +206,7 @@ class CallService:
     def cancel_call(self, call_id: str, caller_username: str) -> bool:
         """Cancel an outgoing call"""
         try:
-            result = self.db.execute_query(
-                """UPDATE calls 
-                   SET status = 'cancelled', ended_at = CURRENT_TIMESTAMP
-                   WHERE call_id = ? AND caller_id = (
-                       SELECT id FROM users WHERE username = ?
-                   ) AND status IN ('pending', 'ringing')""",
-                (call_id, caller_username)
-            )
+            result = self.calls.cancel(call_id, caller_username)
             
             if result:
                 logger.info(f"Call cancelled: {call_id} by {caller_username}")
@@ -274,25 +221,14 @@ class CallService:
         """End an active call"""
         try:
             # Calculate duration
-            call = self.db.execute_query(
-                """SELECT answered_at FROM calls 
-                   WHERE call_id = ? AND status = 'accepted'""",
-                (call_id,),
-                fetch='one'
-            )
+            answered_ms = self.calls.get_answered_ms(call_id)
             
             duration = 0
-            if call and call['answered_at']:
-                answered_time = datetime.fromisoformat(call['answered_at'])
-                duration = int((datetime.now() - answered_time).total_seconds())
+            if answered_ms:
+                duration = max(0, (now_ms() - answered_ms) // 1000)
             
             # Update call status
-            result = self.db.execute_query(
-                """UPDATE calls 
-                   SET status = 'ended', ended_at = CURRENT_TIMESTAMP, duration = ?
-                   WHERE call_id = ? AND status = 'accepted'""",
-                (duration, call_id)
-            )
+            result = self.calls.end(call_id, duration)
             
             if result:
                 logger.info(f"Call ended: {call_id} by {username} (Duration: {duration}s)")
@@ -306,19 +242,7 @@ class CallService:
     def get_call_status(self, call_id: str) -> Optional[Dict[str, Any]]:
         """Get current status of a call"""
         try:
-            call = self.db.execute_query(
-                """SELECT c.*, 
-                          u1.username as caller_username,
-                          u2.username as callee_username
-                   FROM calls c
-                   JOIN users u1 ON c.caller_id = u1.id
-                   JOIN users u2 ON c.callee_id = u2.id
-                   WHERE c.call_id = ?""",
-                (call_id,),
-                fetch='one'
-            )
-            
-            return dict(call) if call else None
+            return self.calls.get(call_id)
             
         except Exception as e:
             logger.error(f"Failed to get call status: {e}")
@@ -327,20 +251,7 @@ class CallService:
     def get_pending_calls_for_user(self, username: str) -> List[Dict[str, Any]]:
         """Get pending/ringing calls for a user"""
         try:
-            calls = self.db.execute_query(
-                """SELECT c.call_id, c.status, c.created_at,
-                          u1.username as caller_username,
-                          u1.display_name as caller_display_name
-                   FROM calls c
-                   JOIN users u1 ON c.caller_id = u1.id
-                   JOIN users u2 ON c.callee_id = u2.id
-                   WHERE u2.username = ? AND c.status IN ('pending', 'ringing')
-                   ORDER BY c.created_at DESC""",
-                (username,),
-                fetch='all'
-            )
-            
-            return [dict(call) for call in calls] if calls else []
+            return self.calls.list_pending_for(username)
             
         except Exception as e:
             logger.error(f"Failed to get pending calls: {e}")
@@ -350,83 +261,59 @@ class CallService:
         """Update user presence status"""
         try:
             logger.info(f"=== UPDATE_PRESENCE === User: {username}, Status: {status}, Socket: {socket_id}")
-            user = self.db.execute_query(
-                "SELECT id FROM users WHERE username = ?",
-                (username,),
-                fetch='one'
-            )
-            
-            if not user:
-                return False
-            
-            # Insert or update presence
-            self.db.execute_query(
-                """INSERT INTO user_presence (user_id, status, socket_id, updated_at)
-                   VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                   ON CONFLICT(user_id) DO UPDATE SET
-                   status = excluded.status,
-                   socket_id = excluded.socket_id,
-                   updated_at = excluded.updated_at""",
-                (user['id'], status, socket_id)
-            )
-            
-            return True
+            return self.calls.record_presence(username, status, socket_id)
             
+        except DatabaseBusyError:
+            raise
         except Exception as e:
             logger.error(f"Failed to update presence for {username}: {e}")
             return False
     
+    def connect_presence(self, username: str, socket_id: str) -> bool:
+        """Bind a Socket.IO connection to a user, who stays online until it closes"""
+        try:
+            bound = self.calls.bind_presence_socket(username, socket_id)
+            if bound:
+                logger.info(f"🔌 {username} online via socket {socket_id}")
+            return bound
+        
+        except Exception as e:
+            logger.error(f"Failed to bind presence socket for {username}: {e}")
+            return False
+    
+    def disconnect_presence(self, socket_id: str) -> bool:
+        """Release a closed Socket.IO connection; its user goes offline once none is left"""
+        try:
+            released = self.calls.release_presence_socket(socket_id)
+            if released:
+                logger.info(f"🔌 Presence socket {socket_id} closed")
+            return released
+        
+        except Exception as e:
+            logger.error(f"Failed to release presence socket {socket_id}: {e}")
+            return False
+    
     def cleanup_old_calls(self, hours: int = 24) -> int:
-        """Clean up old completed calls"""
+        """Move old completed calls to call history"""
         try:
-            cutoff_time = datetime.now() - timedelta(hours=hours)
+            cutoff_time = cutoff_timestamp(timedelta(hours=hours))
             
-            result = self.db.execute_query(
-                """DELETE FROM calls 
-                   WHERE status IN ('declined', 'cancelled', 'ended', 'missed') 
-                   AND created_at < ?""",
-                (cutoff_time.isoformat(),)
-            )
+            result = self.calls.archive_finished_before(cutoff_time)
             
-            logger.info(f"Cleaned up old calls: {result} records removed")
-            return result or 0
+            logger.info(f"Cleaned up old calls: {result} records archived")
+            return result
             
         except Exception as e:
             logger.error(f"Failed to cleanup old calls: {e}")
             return 0
     
-    def _is_user_actually_online(self, presence_status: str, updated_at: str) -> bool:
+    def _is_user_actually_online(self, presence_status: str, updated_ms: Optional[int], now: int = None) -> bool:
         """Determine if a user is actually online based on presence status and timestamp freshness"""
-        try:
-            # If status is not online, definitely offline
-            if presence_status != 'online':
-                return False
-            
-            # If no timestamp available, assume offline
-            if not updated_at:
-                return False
-                
-            # Parse the timestamp
-            try:
-                if updated_at.endswith('Z'):
-                    # Handle UTC timezone
-                    updated_time = datetime.fromisoformat(updated_at.replace('Z', '+00:00'))
-                else:
-                    updated_time = datetime.fromisoformat(updated_at)
-            except ValueError:
-                # If timestamp parsing fails, assume offline
-                logger.warning(f"Could not parse timestamp: {updated_at}")
-                return False
-            
-            # User is online if they updated presence within the last 2 minutes
-            # This gives some buffer over the background service's 1-minute threshold
-            time_diff = (datetime.now() - updated_time).total_seconds()
-            is_recent = time_diff <= 120  # 2 minutes
-            
-            logger.debug(f"Presence check: status={presence_status}, age={time_diff}s, is_recent={is_recent}")
-            return is_recent
+        # If status is not online or there is no timestamp, the user is offline
+        if presence_status != 'online' or updated_ms is None:
+            return False
             
-        except Exception as e:
-            logger.error(f"Error determining online status: {e}")
-            # Default to offline if we can't determine status safely
-            return False
\ No newline at end of file
+        # User is online if they updated presence within the last 2 minutes
+        # This gives some buffer over the background service's 1-minute threshold
+        age_ms = (now if now is not None else now_ms()) - updated_ms
+        return age_ms <= ONLINE_WINDOW_MS
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+Reverse contact adjacency for targeted presence pushes
+
+A presence change only matters to the users who have that user as a
+contact. The graph maps each username to its watchers (the reverse edges of
+user_contacts), so a batch of changes is fanned out with one dict lookup per
+changed user instead of a query. It is loaded once from the repositories and
+kept current by ContactService as contacts are added and removed.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Any, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ContactGraph:
+    """contact username -> set of usernames that have them as a contact"""
+    
+    def __init__(self, repositories=None):
+        self._repositories = repositories
+        self._lock = threading.Lock()
+        self._load_lock = threading.RLock()
+        self._watchers: Dict[str, Set[str]] = {}
+        self._edges = 0
+        self._loaded = False
+        self._load_ms = 0.0
+        
+        # Edge changes made while a load reads the table, replayed after the swap
+        self._loading = False
+        self._pending: List[Tuple[bool, str, str]] = []
+        
+        # Metrics
+        self._fan_outs = 0
+        self._deliveries = 0
+    
+    def load(self):
+        """Rebuild the graph from user_contacts"""
+        if self._repositories is None:
+            from repositories.factory import repositories
+            self._repositories = repositories
+        
+        with self._load_lock:
+            started = time.perf_counter()
+            with self._lock:
+                self._loading = True
+                self._pending = []
+            try:
+                edges = self._repositories.contacts.list_edges()
+                watchers = {}
+                for username, contact_username in edges:
+                    watchers.setdefault(contact_username, set()).add(username)
+                edge_count = sum(len(users) for users in watchers.values())
+            except Exception:
+                with self._lock:
+                    self._loading = False
+                    self._pending = []
+                raise
+            
+            with self._lock:
+                # The snapshot may predate changes that were journaled while it was read
+                for added, username, contact_username in self._pending:
+                    edge_count += self._apply(watchers, added, username, contact_username)
+                self._watchers = watchers
+                self._edges = edge_count
+                self._loaded = True
+                self._loading = False
+                self._pending = []
+                self._load_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"🕸️ Contact graph loaded {edge_count} edges in {self._load_ms:.1f}ms")
+    
+    def add(self, username: str, contact_username: str):
+        """username added contact_username to their contacts"""
+        self._change(True, username, contact_username)
+    
+    def remove(self, username: str, contact_username: str):
+        self._change(False, username, contact_username)
+    
+    def watchers_of(self, username: str) -> Set[str]:
+        """Users who have username in their contact list"""
+        self._ensure_loaded()
+        with self._lock:
+            return set(self._watchers.get(username, ()))
+    
+    def fan_out(self, changes: List[Tuple[str, str]]) -> Dict[str, List[Dict[str, str]]]:
+        """Group (username, status) changes by the watcher who should receive them"""
+        self._ensure_loaded()
+        deliveries: Dict[str, List[Dict[str, str]]] = {}
+        with self._lock:
+            for username, status in changes:
+                for watcher in self._watchers.get(username, ()):
+                    deliveries.setdefault(watcher, []).append({'username': username, 'status': status})
+            self._fan_outs += 1
+            self._deliveries += len(deliveries)
+        return deliveries
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'loaded': self._loaded,
+                'users_watched': len(self._watchers),
+                'edges': self._edges,
+                'load_ms': round(self._load_ms, 2),
+                'fan_outs': self._fan_outs,
+                'deliveries': self._deliveries
+            }
+    
+    def _change(self, added: bool, username: str, contact_username: str):
+        with self._lock:
+            if self._loading:
+                self._pending.append((added, username, contact_username))
+            # Before the first load the edge is read from the table anyway
+            if self._loaded:
+                self._edges += self._apply(self._watchers, added, username, contact_username)
+    
+    @staticmethod
+    def _apply(watchers: Dict[str, Set[str]], added: bool, username: str, contact_username: str) -> int:
+        """Apply one edge change to watchers, returning the change in edge count"""
+        if added:
+            users = watchers.setdefault(contact_username, set())
+            if username in users:
+                return 0
+            users.add(username)
+            return 1
+        users = watchers.get(contact_username)
+        if not users or username not in users:
+            return 0
+        users.discard(username)
+        if not users:
+            del watchers[contact_username]
+        return -1
+    
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._load_lock:
+                # Another thread may have finished the load while we waited
+                if not self._loaded:
+                    self.load()
+
+# Global instance
+contact_graph = ContactGraph()
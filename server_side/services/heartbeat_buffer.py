@@ -0,0 +1,209 @@
+"""
+Write-behind buffer that coalesces last_seen heartbeats
+
+Presence itself is held by services.presence_registry.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any
+from database.database import db_manager
+from database.result_cache import written_tables
+from database.timestamps import sql_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+# last_seen_ms is derived from the same text, so the two never disagree
+LAST_SEEN_UPDATE = f"UPDATE users SET last_seen = ?1, last_seen_ms = {sql_epoch_ms('?1')} WHERE username = ?2"
+
+def utc_timestamp() -> str:
+    """Current time in SQLite CURRENT_TIMESTAMP format (UTC)"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+class HeartbeatBuffer:
+    """Keeps only the latest last_seen per user and flushes them in batches
+
+    last_seen touches are held in memory and written with one executemany in
+    a single transaction, either every ``flush_interval_ms`` or as soon as
+    ``max_pending`` users are buffered. Readers use get_last_seen() to see
+    values that have not reached the database yet.
+    """
+    
+    def __init__(self, db=None, flush_interval_ms: int = None, max_pending: int = None,
+                 enabled: bool = None):
+        self.db = db or db_manager
+        self.flush_interval = (flush_interval_ms or int(os.getenv('HEARTBEAT_FLUSH_INTERVAL_MS', 1000))) / 1000.0
+        self.max_pending = max_pending or int(os.getenv('HEARTBEAT_BUFFER_MAX', 500))
+        if enabled is None:
+            enabled = os.getenv('HEARTBEAT_WRITE_BEHIND', 'true').lower() == 'true'
+        self.enabled = enabled
+        
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        
+        # username -> last_seen
+        self._last_seen: Dict[str, str] = {}
+        # Entries taken by a flush that has not committed yet, still visible to readers
+        self._inflight_last_seen: Dict[str, str] = {}
+        # Usernames confirmed to exist, so heartbeats skip the lookup SELECT
+        self._known_users = set()
+        
+        # Metrics
+        self._enqueued = 0
+        self._rows_flushed = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._last_flush = 0.0
+        self._total_flush = 0.0
+        self._max_flush = 0.0
+    
+    def is_known_user(self, username: str) -> bool:
+        """Check that a user exists, caching positive answers"""
+        if username in self._known_users:
+            return True
+        
+        user = self.db.execute_query(
+            "SELECT id FROM users WHERE username = ?",
+            (username,),
+            fetch='one'
+        )
+        if user:
+            self._known_users.add(username)
+        return user is not None
+    
+    def record_last_seen(self, username: str):
+        """Buffer a last_seen touch, replacing any pending one for the user"""
+        with self._lock:
+            self._last_seen[username] = utc_timestamp()
+            self._enqueued += 1
+        self._after_record()
+    
+    def get_last_seen(self, username: str) -> Optional[str]:
+        """Latest buffered last_seen for a user, or None if nothing is pending"""
+        with self._lock:
+            return self._last_seen.get(username) or self._inflight_last_seen.get(username)
+    
+    def apply_pending(self, row: Dict[str, Any]):
+        """Overlay a buffered last_seen onto a result row keyed by username"""
+        last_seen = self.get_last_seen(row['username'])
+        if last_seen and 'last_seen' in row:
+            row['last_seen'] = last_seen
+        
+    def overlay_record(self, record):
+        """apply_pending() for immutable Records: returns a patched copy, or the record itself"""
+        last_seen = self.get_last_seen(record['username'])
+        if last_seen and 'last_seen' in record._index:
+            return record._replace(last_seen=last_seen)
+        return record
+    
+    def flush(self) -> int:
+        """Write all pending last_seen touches in one transaction; returns rows written"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._last_seen:
+                    return 0
+                last_seen, self._last_seen = self._last_seen, {}
+                self._inflight_last_seen = last_seen
+            
+            started = time.perf_counter()
+            try:
+                with self.db.transaction(immediate=False) as conn:
+                    conn.executemany(LAST_SEEN_UPDATE, [
+                        (seen_at, username) for username, seen_at in last_seen.items()
+                    ])
+                    self.db.mark_written(*written_tables(LAST_SEEN_UPDATE))
+            except Exception as e:
+                logger.error(f"Failed to flush heartbeat buffer: {e}")
+                with self._lock:
+                    # Re-queue what did not commit, keeping anything newer that arrived meanwhile
+                    for username, seen_at in last_seen.items():
+                        self._last_seen.setdefault(username, seen_at)
+                    self._inflight_last_seen = {}
+                    self._failed_flushes += 1
+                return 0
+            
+            elapsed = time.perf_counter() - started
+            rows = len(last_seen)
+            with self._lock:
+                self._inflight_last_seen = {}
+                self._flushes += 1
+                self._rows_flushed += rows
+                self._last_flush = elapsed
+                self._total_flush += elapsed
+                self._max_flush = max(self._max_flush, elapsed)
+            
+            logger.debug(f"💓 Flushed {rows} last_seen heartbeats in {elapsed * 1000:.1f}ms")
+            return rows
+    
+    def start(self):
+        """Start the periodic flush thread"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='heartbeat-flush', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Stop the flush thread and write out anything still pending"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Coalescing and flush-latency metrics"""
+        with self._lock:
+            pending = len(self._last_seen)
+            in_flight = len(self._inflight_last_seen)
+            coalesced = self._enqueued - self._rows_flushed - pending - in_flight
+            return {
+                'enabled': self.enabled,
+                'flush_interval_ms': int(self.flush_interval * 1000),
+                'max_pending': self.max_pending,
+                'pending': pending,
+                'writes_received': self._enqueued,
+                'rows_flushed': self._rows_flushed,
+                'writes_coalesced': max(coalesced, 0),
+                'flushes': self._flushes,
+                'failed_flushes': self._failed_flushes,
+                'last_flush_ms': round(self._last_flush * 1000, 3),
+                'avg_flush_ms': round(self._total_flush / self._flushes * 1000, 3) if self._flushes else 0.0,
+                'max_flush_ms': round(self._max_flush * 1000, 3)
+            }
+    
+    def _after_record(self):
+        if not self.enabled:
+            # Write-through mode keeps the old one-write-per-heartbeat behaviour
+            self.flush()
+            return
+        
+        if self._thread is None:
+            self.start()
+        
+        with self._lock:
+            full = len(self._last_seen) >= self.max_pending
+        if full:
+            self._wakeup.set()
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Heartbeat flush loop error: {e}")
+
+# Global instance
+heartbeat_buffer = HeartbeatBuffer()
+atexit.register(heartbeat_buffer.stop)
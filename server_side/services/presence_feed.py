@@ -0,0 +1,88 @@
+"""
+Version cursors for incremental call directory refreshes
+
+Every change that can alter a row of the call directory (a presence status
+transition, a display name change, a new user, or a favorite/contact change
+seen by one viewer) is appended to a bounded log under a new version. A
+client that sends back the version of its last response receives only the
+users changed since then. A cursor older than the log, or from before a
+restart, gets a full snapshot instead.
+
+Versions start from the clock at startup, so cursors from a previous process
+always read as too old.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, List, Any, Iterable, Tuple
+from services.presence_registry import presence_registry
+
+class PresenceFeed:
+    """Bounded log of (version, username, viewer) changes; viewer None means everyone"""
+    
+    def __init__(self, max_changes: int = None):
+        self.max_changes = max_changes or int(os.getenv('PRESENCE_FEED_MAX_CHANGES', 10000))
+        self._lock = threading.Lock()
+        self._version = int(time.time() * 1000) * 1000
+        # Cursors below this version may have missed evicted changes
+        self._floor = self._version
+        self._changes = deque()
+        
+        # Metrics
+        self._deltas = 0
+        self._snapshots = 0
+    
+    @property
+    def version(self) -> int:
+        return self._version
+    
+    def record(self, username: str, viewer: str = None) -> int:
+        """Log a change to one user's directory row; returns the new version"""
+        return self.record_many((username,), viewer)
+    
+    def record_many(self, usernames: Iterable[str], viewer: str = None) -> int:
+        with self._lock:
+            for username in usernames:
+                self._version += 1
+                self._changes.append((self._version, username, viewer))
+            while len(self._changes) > self.max_changes:
+                self._floor = self._changes.popleft()[0]
+            return self._version
+    
+    def record_presence_changes(self, changes: List[Tuple[str, str]]):
+        """Presence registry listener"""
+        self.record_many(username for username, _ in changes)
+    
+    def changed_since(self, version: int, viewer: str = None) -> Optional[set]:
+        """Usernames changed after version as seen by viewer, or None if the cursor is too old"""
+        with self._lock:
+            if version < self._floor or version > self._version:
+                self._snapshots += 1
+                return None
+            
+            changed = set()
+            # Newest first, stopping at the cursor: cost is the size of the delta
+            for change_version, username, change_viewer in reversed(self._changes):
+                if change_version <= version:
+                    break
+                if change_viewer is None or change_viewer == viewer:
+                    changed.add(username)
+            self._deltas += 1
+            return changed
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'version': self._version,
+                'oldest_cursor': self._floor,
+                'changes': len(self._changes),
+                'max_changes': self.max_changes,
+                'deltas_served': self._deltas,
+                'snapshots_forced': self._snapshots
+            }
+
+# Global instance
+presence_feed = PresenceFeed()
+presence_registry.add_listener(presence_feed.record_presence_changes)
@@ -0,0 +1,436 @@
+"""
+Authoritative in-process presence, checkpointed to user_presence
+
+Presence flips every few seconds per TV and is read by every directory,
+contact list and search request. The registry keeps it in memory as the
+source of truth: status codes and update times live in flat arrays indexed by
+user id, socket ids in a sparse dict. Heartbeats change an entry in O(1) and
+mark it dirty, and a background thread writes dirty entries to user_presence
+every PRESENCE_CHECKPOINT_INTERVAL_MS in one deferred transaction. The
+registry is rebuilt from the table on first use, so a restart loses at most
+one checkpoint interval.
+
+Usernames are resolved to ids once per process and cached, so steady-state
+heartbeats do not query the database at all. An online user without a
+heartbeat for PRESENCE_TTL_SECONDS goes offline: every heartbeat reschedules
+the user on a timing wheel in O(1), and the background thread collects due
+users every PRESENCE_EXPIRY_TICK_MS. TVs that bind a Socket.IO connection
+with presence_hello stay online for as long as the connection does: Engine.IO
+pings keep it alive, so bound users are never expired and report a fresh
+update time, and they go offline when their last socket disconnects.
+
+Listeners registered with add_listener() are told about every status change
+as (username, status) pairs. The registry is per process: run a single
+server process, as the Socket.IO server already requires.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from array import array
+from typing import Optional, Dict, List, Any, Tuple, Callable
+from database.database import db_manager
+from database.result_cache import written_tables
+from services.timing_wheel import TimingWheel
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_UPSERT = """
+    INSERT INTO user_presence (user_id, status, socket_id, updated_at, updated_ms)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+    status = excluded.status,
+    socket_id = excluded.socket_id,
+    updated_at = excluded.updated_at,
+    updated_ms = excluded.updated_ms
+"""
+
+LOAD_QUERY = """
+    SELECT user_id, status, socket_id, updated_ms / 1000.0 AS updated_epoch
+    FROM user_presence
+"""
+
+# Status code 0 marks a user with no presence entry
+NO_ENTRY = 0
+
+def format_timestamp(epoch: float) -> str:
+    """Epoch seconds in SQLite CURRENT_TIMESTAMP format (UTC)"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+class PresenceRegistry:
+    """User id -> (status, updated_at, socket_id), written back to SQLite in batches"""
+    
+    def __init__(self, db=None, checkpoint_interval_ms: int = None, write_behind: bool = None,
+                 ttl_seconds: float = None, expiry_tick_ms: int = None):
+        self.db = db or db_manager
+        self.checkpoint_interval = (checkpoint_interval_ms or
+                                    int(os.getenv('PRESENCE_CHECKPOINT_INTERVAL_MS', 5000))) / 1000.0
+        self.ttl = ttl_seconds or float(os.getenv('PRESENCE_TTL_SECONDS', 180))
+        self.expiry_tick = (expiry_tick_ms or int(os.getenv('PRESENCE_EXPIRY_TICK_MS', 1000))) / 1000.0
+        if write_behind is None:
+            write_behind = os.getenv('HEARTBEAT_WRITE_BEHIND', 'true').lower() == 'true'
+        self.write_behind = write_behind
+        
+        self._lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._loaded = False
+        
+        # Status strings are interned as small codes; index 0 is NO_ENTRY
+        self._status_names = [None, 'offline', 'online']
+        self._status_codes = {'offline': 1, 'online': 2}
+        self._status = array('B')
+        self._updated = array('d')
+        self._sockets: Dict[int, str] = {}
+        # Ids currently online, so online lookups and expiry skip the full arrays
+        self._online = set()
+        # Connected sockets bound by presence_hello: socket id -> user id, and user id -> socket ids
+        self._socket_users: Dict[str, int] = {}
+        self._live: Dict[int, set] = {}
+        # Online users without a bound socket, keyed by when they go stale
+        self._wheel = self._new_wheel()
+        # Status changes not yet passed to listeners, and the reverse of _user_ids
+        self._transitions: List[Tuple[int, str]] = []
+        self._listeners: List[Callable] = []
+        self._usernames: Dict[int, str] = {}
+        # Usernames confirmed to exist
+        self._user_ids: Dict[str, int] = {}
+        # User ids changed since the last checkpoint
+        self._dirty = set()
+        
+        # Metrics
+        self._updates = 0
+        self._checkpoints = 0
+        self._rows_checkpointed = 0
+        self._failed_checkpoints = 0
+        self._last_checkpoint = 0.0
+        self._loaded_rows = 0
+        self._load_ms = 0.0
+        self._expired = 0
+        self._last_expiry_ms = 0.0
+    
+    def load(self):
+        """Rebuild the registry from user_presence"""
+        started = time.perf_counter()
+        rows = self.db.execute_read(LOAD_QUERY, fetch='all')
+        with self._lock:
+            self._status = array('B')
+            self._updated = array('d')
+            self._sockets = {}
+            self._online = set()
+            self._wheel = self._new_wheel()
+            for row in rows:
+                # Users left online by the last run expire on the first tick once stale
+                self._set(row['user_id'], row['status'], row['socket_id'], row['updated_epoch'] or 0.0)
+            self._dirty.clear()
+            self._transitions.clear()
+            self._loaded = True
+            self._loaded_rows = len(rows)
+            self._load_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"📡 Presence registry loaded {len(rows)} entries in {self._load_ms:.1f}ms")
+    
+    def resolve(self, username: str) -> Optional[int]:
+        """User id for a username, cached once the user is known to exist"""
+        user_id = self._user_ids.get(username)
+        if user_id is not None:
+            return user_id
+        
+        user = self.db.execute_query("SELECT id FROM users WHERE username = ?", (username,), fetch='one')
+        if not user:
+            return None
+        self._user_ids[username] = user['id']
+        self._usernames[user['id']] = username
+        return user['id']
+    
+    def update(self, username: str, status: str, socket_id: str = None) -> bool:
+        """Record a heartbeat; returns False for unknown users"""
+        user_id = self.resolve(username)
+        if user_id is None:
+            return False
+        
+        self._ensure_loaded()
+        with self._lock:
+            if socket_id is None and user_id in self._live:
+                # HTTP status changes keep the socket bound by presence_hello
+                socket_id = self._sockets.get(user_id)
+            self._set(user_id, status, socket_id, time.time())
+            self._dirty.add(user_id)
+            self._updates += 1
+        
+        self._after_change()
+        return True
+    
+    def bind(self, username: str, socket_id: str) -> bool:
+        """Mark a user online for as long as socket_id stays connected; returns False for unknown users"""
+        user_id = self.resolve(username)
+        if user_id is None:
+            return False
+        
+        # A socket speaks for one user; saying hello again as someone else releases the first
+        if self._socket_users.get(socket_id, user_id) != user_id:
+            self.unbind(socket_id)
+        
+        self._ensure_loaded()
+        with self._lock:
+            self._socket_users[socket_id] = user_id
+            self._live.setdefault(user_id, set()).add(socket_id)
+            self._set(user_id, 'online', socket_id, time.time())
+            self._dirty.add(user_id)
+            self._updates += 1
+        
+        self._after_change()
+        return True
+    
+    def unbind(self, socket_id: str) -> Optional[int]:
+        """Release a disconnected socket; its user goes offline once no bound socket is left
+        
+        Returns the user id the socket was bound to, or None.
+        """
+        with self._lock:
+            user_id = self._socket_users.pop(socket_id, None)
+            if user_id is None:
+                return None
+            
+            sockets = self._live[user_id]
+            sockets.discard(socket_id)
+            if sockets:
+                # Another page or a reconnect still holds the user online
+                if self._sockets.get(user_id) == socket_id:
+                    self._sockets[user_id] = next(iter(sockets))
+                return user_id
+            
+            del self._live[user_id]
+            self._set(user_id, 'offline', None, time.time())
+            self._dirty.add(user_id)
+            self._updates += 1
+        
+        self._after_change()
+        return user_id
+    
+    def get(self, user_id: int) -> Optional[Tuple[str, str, Optional[str], int]]:
+        """(status, updated_at, socket_id, updated_ms) for a user, or None without an entry"""
+        self._ensure_loaded()
+        with self._lock:
+            if user_id >= len(self._status) or self._status[user_id] == NO_ENTRY:
+                return None
+            # A bound socket is answering Engine.IO pings, so its user was seen just now
+            updated = time.time() if user_id in self._live else self._updated[user_id]
+            return (self._status_names[self._status[user_id]], format_timestamp(updated),
+                    self._sockets.get(user_id), int(updated * 1000))
+    
+    def status(self, user_id: int) -> str:
+        """Presence status, 'offline' for users without an entry"""
+        self._ensure_loaded()
+        code = self._status[user_id] if user_id < len(self._status) else NO_ENTRY
+        return self._status_names[code] if code != NO_ENTRY else 'offline'
+    
+    def online_ids(self) -> List[int]:
+        """Snapshot of the user ids currently online"""
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._online)
+    
+    def count(self, status: str = 'online') -> int:
+        self._ensure_loaded()
+        if status == 'online':
+            return len(self._online)
+        code = self._status_codes.get(status)
+        return self._status.count(code) if code else 0
+    
+    def expire_due(self, now: float = None) -> int:
+        """Mark users whose heartbeat is older than the TTL offline; returns users expired"""
+        self._ensure_loaded()
+        now = now or time.time()
+        started = time.perf_counter()
+        with self._lock:
+            due = self._wheel.advance(now)
+            for user_id in due:
+                self._set(user_id, 'offline', self._sockets.get(user_id), now)
+                self._dirty.add(user_id)
+            self._expired += len(due)
+            self._last_expiry_ms = (time.perf_counter() - started) * 1000
+        
+        if due:
+            logger.info(f"🧹 Marked {len(due)} inactive users as offline")
+            self._after_change()
+        return len(due)
+    
+    def add_listener(self, callback: Callable[[List[Tuple[str, str]]], None]):
+        """Call callback with [(username, status), ...] after each batch of status changes"""
+        self._listeners.append(callback)
+    
+    def checkpoint(self) -> int:
+        """Write entries changed since the last checkpoint; returns rows written"""
+        with self._checkpoint_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                dirty, self._dirty = self._dirty, set()
+                rows = [(user_id, self._status_names[self._status[user_id]], self._sockets.get(user_id),
+                         format_timestamp(self._updated[user_id]), int(self._updated[user_id] * 1000))
+                        for user_id in dirty]
+            
+            started = time.perf_counter()
+            try:
+                with self.db.transaction(immediate=False) as conn:
+                    conn.executemany(CHECKPOINT_UPSERT, rows)
+                    self.db.mark_written(*written_tables(CHECKPOINT_UPSERT))
+            except Exception as e:
+                logger.error(f"Failed to checkpoint presence: {e}")
+                with self._lock:
+                    self._dirty |= dirty
+                    self._failed_checkpoints += 1
+                return 0
+            
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._checkpoints += 1
+                self._rows_checkpointed += len(rows)
+                self._last_checkpoint = elapsed
+            logger.debug(f"📡 Checkpointed {len(rows)} presence entries in {elapsed * 1000:.1f}ms")
+            return len(rows)
+    
+    def start(self):
+        """Start the expiry and checkpoint thread"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='presence-registry', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Stop the expiry and checkpoint thread and write out anything still dirty"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._loaded:
+            self.checkpoint()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Entry counts, checkpoint metrics and memory footprint"""
+        with self._lock:
+            entries = len(self._status) - self._status.count(NO_ENTRY)
+            return {
+                'loaded': self._loaded,
+                'entries': entries,
+                'online': len(self._online),
+                'dirty': len(self._dirty),
+                'known_usernames': len(self._user_ids),
+                'bound_sockets': len(self._socket_users),
+                'ttl_seconds': self.ttl,
+                'expiry_tick_ms': int(self.expiry_tick * 1000),
+                'scheduled_expiries': len(self._wheel),
+                'expired': self._expired,
+                'last_expiry_ms': round(self._last_expiry_ms, 3),
+                'write_behind': self.write_behind,
+                'checkpoint_interval_ms': int(self.checkpoint_interval * 1000),
+                'updates': self._updates,
+                'checkpoints': self._checkpoints,
+                'rows_checkpointed': self._rows_checkpointed,
+                'failed_checkpoints': self._failed_checkpoints,
+                'last_checkpoint_ms': round(self._last_checkpoint * 1000, 3),
+                'loaded_rows': self._loaded_rows,
+                'load_ms': round(self._load_ms, 1),
+                'array_bytes': self._status.itemsize * len(self._status) + self._updated.itemsize * len(self._updated)
+            }
+    
+    def _after_change(self):
+        if not self.write_behind:
+            # Write-through keeps the old one-write-per-heartbeat behaviour
+            self.checkpoint()
+        elif self._thread is None:
+            self.start()
+        self._notify()
+    
+    def _notify(self):
+        with self._lock:
+            if not self._transitions:
+                return
+            transitions, self._transitions = self._transitions, []
+        if not self._listeners:
+            return
+        
+        usernames = self._lookup_usernames({user_id for user_id, _ in transitions})
+        changes = [(usernames[user_id], status) for user_id, status in transitions if user_id in usernames]
+        for listener in self._listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error(f"Presence listener failed: {e}")
+    
+    def _lookup_usernames(self, user_ids) -> Dict[int, str]:
+        """Usernames for ids, querying only those not resolved by this process yet"""
+        found = {user_id: self._usernames[user_id] for user_id in user_ids if user_id in self._usernames}
+        missing = [user_id for user_id in user_ids if user_id not in found]
+        if missing:
+            placeholders = ', '.join('?' for _ in missing)
+            rows = self.db.execute_read(f"SELECT id, username FROM users WHERE id IN ({placeholders})",
+                                        tuple(missing), fetch='all')
+            for row in rows:
+                found[row['id']] = row['username']
+        return found
+    
+    def _new_wheel(self) -> TimingWheel:
+        slots = int(self.ttl / self.expiry_tick) + 2
+        return TimingWheel(self.expiry_tick, slots, time.time())
+    
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._checkpoint_lock:
+                if not self._loaded:
+                    self.load()
+    
+    def _set(self, user_id: int, status: str, socket_id: Optional[str], updated: float):
+        """Store an entry, growing the arrays to cover user_id; caller holds the lock"""
+        status = status or 'offline'
+        code = self._status_codes.get(status)
+        if code is None:
+            if len(self._status_names) >= 256:
+                raise ValueError(f"Too many distinct presence statuses, cannot add {status!r}")
+            code = self._status_codes[status] = len(self._status_names)
+            self._status_names.append(status)
+        
+        missing = user_id + 1 - len(self._status)
+        if missing > 0:
+            # Grow geometrically so a stream of new users does not copy on every insert
+            missing = max(missing, len(self._status) // 2)
+            self._status.extend(bytes(missing))
+            self._updated.extend(array('d', bytes(8 * missing)))
+        
+        if self._status[user_id] != code and self._loaded:
+            self._transitions.append((user_id, status))
+        self._status[user_id] = code
+        self._updated[user_id] = updated
+        if status == 'online':
+            self._online.add(user_id)
+            if user_id in self._live:
+                self._wheel.cancel(user_id)
+            else:
+                self._wheel.schedule(user_id, updated + self.ttl)
+        else:
+            self._online.discard(user_id)
+            self._wheel.cancel(user_id)
+        if socket_id:
+            self._sockets[user_id] = socket_id
+        else:
+            self._sockets.pop(user_id, None)
+    
+    def _run(self):
+        next_checkpoint = time.monotonic() + self.checkpoint_interval
+        while not self._stopped.wait(self.expiry_tick):
+            try:
+                self.expire_due()
+                if time.monotonic() >= next_checkpoint:
+                    next_checkpoint = time.monotonic() + self.checkpoint_interval
+                    self.checkpoint()
+            except Exception as e:
+                logger.error(f"Presence registry loop error: {e}")
+
+# Global instance
+presence_registry = PresenceRegistry()
+atexit.register(presence_registry.stop)
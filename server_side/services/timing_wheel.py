@@ -0,0 +1,67 @@
+"""
+Hashed timing wheel for expiring many keys at O(1) cost per reschedule
+"""
+
+from typing import Dict, Hashable, List
+
+class TimingWheel:
+    """Keys with deadlines, collected once their tick has passed
+
+    The wheel has ``slots`` buckets of ``tick`` seconds each. Scheduling,
+    rescheduling and cancelling a key move it between buckets in O(1), and
+    advancing visits only the buckets whose ticks have passed. A deadline
+    more than one revolution away stays in its bucket and is re-checked each
+    time round. Keys expire at most one tick late. Not thread-safe: callers
+    hold their own lock.
+    """
+    
+    def __init__(self, tick: float, slots: int, now: float):
+        self.tick = tick
+        self._buckets: List[set] = [set() for _ in range(max(slots, 1))]
+        self._deadlines: Dict[Hashable, float] = {}
+        self._slot_of: Dict[Hashable, int] = {}
+        # First tick not yet collected
+        self._next_tick = int(now // tick)
+    
+    def __len__(self) -> int:
+        return len(self._deadlines)
+    
+    def __contains__(self, key) -> bool:
+        return key in self._deadlines
+    
+    def schedule(self, key: Hashable, deadline: float):
+        """Expire key at deadline, replacing any earlier schedule"""
+        slot = max(int(deadline // self.tick), self._next_tick) % len(self._buckets)
+        previous = self._slot_of.get(key)
+        if previous != slot:
+            if previous is not None:
+                self._buckets[previous].discard(key)
+            self._buckets[slot].add(key)
+            self._slot_of[key] = slot
+        self._deadlines[key] = deadline
+    
+    def cancel(self, key: Hashable):
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self._buckets[slot].discard(key)
+            del self._deadlines[key]
+    
+    def advance(self, now: float) -> List[Hashable]:
+        """Remove and return the keys whose deadline is at or before now"""
+        last_tick = int(now // self.tick) - 1
+        if last_tick < self._next_tick:
+            return []
+        
+        # After a long stall every bucket is due; visit each one once
+        ticks = min(last_tick - self._next_tick + 1, len(self._buckets))
+        expired = []
+        for offset in range(ticks):
+            bucket = self._buckets[(self._next_tick + offset) % len(self._buckets)]
+            due = [key for key in bucket if self._deadlines[key] <= now]
+            for key in due:
+                bucket.discard(key)
+                del self._slot_of[key]
+                del self._deadlines[key]
+            expired.extend(due)
+        self._next_tick = last_tick + 1
+        return expired
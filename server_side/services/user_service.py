@@ -2,57 +2,61 @@ import json
 import logging
 from datetime import datetime
 from typing import Optional, Dict, List, Any
-from database.database import db_manager
+from database.contention import DatabaseBusyError
+from repositories.factory import repositories as default_repositories
+from services.presence_feed import presence_feed
 
 logger = logging.getLogger(__name__)
 
 class UserService:
     """Service layer for user management operations"""
     
-    def __init__(self):
-        self.db = db_manager
+    def __init__(self, repositories=None, feed=None):
+        self.users = (repositories or default_repositories).users
+        self.feed = feed or presence_feed
     
     def register_or_update_user(self, username: str, display_name: str = None, 
                                device_type: str = 'smarttv', metadata: Dict = None) -> Dict[str, Any]:
         """Register a new user or update existing user's last seen"""
         try:
-            # Check if user already exists
-            existing_user = self.get_user_by_username(username)
-            
-            if existing_user:
-                # Update last seen and optionally display name
-                self.update_last_seen(username)
-                if display_name and display_name != existing_user['display_name']:
-                    self.update_user_info(username, display_name=display_name)
-                
-                user_data = self.get_user_by_username(username)
-                logger.info(f"User {username} updated")
-                return {
-                    'user_id': user_data['id'],
-                    'username': user_data['username'],
-                    'display_name': user_data['display_name'],
-                    'is_new_user': False,
-                    'last_seen': user_data['last_seen']
-                }
-            else:
-                # Create new user
-                metadata_json = json.dumps(metadata or {})
-                
-                user_id = self.db.execute_query(
-                    """INSERT INTO users (username, display_name, device_type, metadata) 
-                       VALUES (?, ?, ?, ?)""",
-                    (username, display_name or username, device_type, metadata_json)
-                )
-                
-                logger.info(f"New user {username} registered with ID {user_id}")
-                return {
-                    'user_id': user_id,
-                    'username': username,
-                    'display_name': display_name or username,
-                    'is_new_user': True,
-                    'created_at': datetime.now().isoformat()
-                }
+            # Existence check and insert/update share one transaction so two
+            # concurrent registrations of the same username cannot collide
+            with self.users.transaction():
+                # Check if user already exists
+                existing_user = self.get_user_by_username(username)
                 
+                if existing_user:
+                    # Update last seen and optionally display name in one statement
+                    new_display_name = display_name if display_name and display_name != existing_user['display_name'] else None
+                    self.users.touch(existing_user['id'], new_display_name)
+                    if new_display_name:
+                        self.feed.record(username)
+                    
+                    user_data = self.get_user_by_id(existing_user['id'])
+                    logger.info(f"User {username} updated")
+                    return {
+                        'user_id': user_data['id'],
+                        'username': user_data['username'],
+                        'display_name': user_data['display_name'],
+                        'is_new_user': False,
+                        'last_seen': user_data['last_seen']
+                    }
+                else:
+                    # Create new user
+                    metadata_json = json.dumps(metadata or {})
+                    
+                    user_id = self.users.create(username, display_name or username, device_type, metadata_json)
+                    self.feed.record(username)
+                    
+                    logger.info(f"New user {username} registered with ID {user_id}")
+                    return {
+                        'user_id': user_id,
+                        'username': username,
+                        'display_name': display_name or username,
+                        'is_new_user': True,
+                        'created_at': datetime.now().isoformat()
+                    }
+        
         except Exception as e:
             logger.error(f"Failed to register/update user {username}: {e}")
             raise
@@ -60,12 +64,9 @@ class UserService:
     def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """Get user by username"""
         try:
-            result = self.db.execute_query(
-                "SELECT * FROM users WHERE username = ?",
-                (username,),
-                fetch='one'
-            )
-            return dict(result) if result else None
+            return self.users.get_by_username(username)
+        except DatabaseBusyError:
+            raise
         except Exception as e:
             logger.error(f"Failed to get user {username}: {e}")
             return None
@@ -73,24 +74,18 @@ class UserService:
     def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user by ID"""
         try:
-            result = self.db.execute_query(
-                "SELECT * FROM users WHERE id = ?",
-                (user_id,),
-                fetch='one'
-            )
-            return dict(result) if result else None
+            return self.users.get_by_id(user_id)
         except Exception as e:
             logger.error(f"Failed to get user by ID {user_id}: {e}")
             return None
     
     def update_last_seen(self, username: str) -> bool:
-        """Update user's last seen timestamp"""
+        """Update user's last seen timestamp (buffered and coalesced per user)"""
         try:
-            self.db.execute_query(
-                "UPDATE users SET last_seen = CURRENT_TIMESTAMP WHERE username = ?",
-                (username,)
-            )
+            self.users.record_last_seen(username)
             return True
+        except DatabaseBusyError:
+            raise
         except Exception as e:
             logger.error(f"Failed to update last seen for {username}: {e}")
             return False
@@ -99,24 +94,12 @@ class UserService:
                         metadata: Dict = None) -> bool:
         """Update user information"""
         try:
-            updates = []
-            params = []
-            
-            if display_name:
-                updates.append("display_name = ?")
-                params.append(display_name)
-            
-            if metadata:
-                updates.append("metadata = ?")
-                params.append(json.dumps(metadata))
-            
-            if not updates:
+            if not display_name and not metadata:
                 return True
             
-            query = f"UPDATE users SET {', '.join(updates)} WHERE username = ?"
-            params.append(username)
-            
-            self.db.execute_query(query, tuple(params))
+            self.users.update_info(username, display_name, json.dumps(metadata) if metadata else None)
+            if display_name:
+                self.feed.record(username)
             logger.info(f"Updated user info for {username}")
             return True
             
@@ -127,16 +110,7 @@ class UserService:
     def get_active_users(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get recently active users"""
         try:
-            results = self.db.execute_query(
-                """SELECT username, display_name, last_seen, device_type 
-                   FROM users 
-                   WHERE is_active = 1 
-                   ORDER BY last_seen DESC 
-                   LIMIT ?""",
-                (limit,),
-                fetch='all'
-            )
-            return [dict(row) for row in results] if results else []
+            return self.users.list_active(limit)
         except Exception as e:
             logger.error(f"Failed to get active users: {e}")
             return []
@@ -145,28 +119,17 @@ class UserService:
                       room_name: str = None) -> Optional[str]:
         """Create a new user session"""
         try:
-            user = self.get_user_by_username(username)
-            if not user:
-                logger.warning(f"Cannot create session for non-existent user: {username}")
-                return None
-            
-            # Generate session token (simple timestamp-based for now)
-            session_token = f"{username}_{int(datetime.now().timestamp())}"
-            
-            # End any existing active sessions for this user
-            self.db.execute_query(
-                """UPDATE user_sessions 
-                   SET is_active = 0, ended_at = CURRENT_TIMESTAMP 
-                   WHERE user_id = ? AND is_active = 1""",
-                (user['id'],)
-            )
-            
-            # Create new session
-            self.db.execute_query(
-                """INSERT INTO user_sessions (user_id, session_token, session_type, room_name) 
-                   VALUES (?, ?, ?, ?)""",
-                (user['id'], session_token, session_type, room_name)
-            )
+            with self.users.transaction():
+                user = self.get_user_by_username(username)
+                if not user:
+                    logger.warning(f"Cannot create session for non-existent user: {username}")
+                    return None
+                
+                # Generate session token (simple timestamp-based for now)
+                session_token = f"{username}_{int(datetime.now().timestamp())}"
+                
+                # End any existing active sessions for this user and create the new one
+                self.users.start_session(user['id'], session_token, session_type, room_name)
             
             logger.info(f"Created {session_type} session for {username}")
             return session_token
@@ -178,12 +141,7 @@ class UserService:
     def end_session(self, session_token: str) -> bool:
         """End a user session"""
         try:
-            self.db.execute_query(
-                """UPDATE user_sessions 
-                   SET is_active = 0, ended_at = CURRENT_TIMESTAMP 
-                   WHERE session_token = ?""",
-                (session_token,)
-            )
+            self.users.end_session(session_token)
             logger.info(f"Ended session {session_token}")
             return True
         except Exception as e:
@@ -197,31 +155,8 @@ class UserService:
             if not user:
                 return {}
             
-            # Get game stats
-            game_stats = self.db.execute_query(
-                """SELECT 
-                     COUNT(*) as games_played,
-                     AVG(score) as avg_score,
-                     MAX(score) as best_score,
-                     SUM(correct_answers) as total_correct,
-                     SUM(questions_answered) as total_questions
-                   FROM game_scores 
-                   WHERE user_id = ?""",
-                (user['id'],),
-                fetch='one'
-            )
-            
-            # Get session stats
-            session_stats = self.db.execute_query(
-                """SELECT 
-                     COUNT(*) as total_sessions,
-                     COUNT(CASE WHEN session_type = 'video_call' THEN 1 END) as video_sessions,
-                     COUNT(CASE WHEN session_type = 'trivia_game' THEN 1 END) as trivia_sessions
-                   FROM user_sessions 
-                   WHERE user_id = ?""",
-                (user['id'],),
-                fetch='one'
-            )
+            game_stats = self.users.get_game_stats(user['id'])
+            session_stats = self.users.get_session_stats(user['id'])
             
             return {
                 'username': user['username'],
@@ -252,14 +187,8 @@ class UserService:
                 logger.warning(f"Cannot save score for non-existent user: {username}")
                 return False
             
-            self.db.execute_query(
-                """INSERT INTO game_scores 
-                   (user_id, game_type, score, questions_answered, correct_answers, 
-                    game_duration, room_name) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                (user['id'], game_type, score, questions_answered, correct_answers,
-                 game_duration, room_name)
-            )
+            self.users.save_game_score(user['id'], game_type, score, questions_answered,
+                                       correct_answers, game_duration, room_name)
             
             logger.info(f"Saved {game_type} score {score} for {username}")
             return True
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN QUERY PLAN regression harness for the service and admin SQL.
+
+Seeds a synthetic fleet with seed_fleet.py, runs every registered scenario
+through the real service methods while recording each SQL statement they
+issue, then captures EXPLAIN QUERY PLAN for every distinct statement. Fails
+when a hot-path statement does a full SCAN of users, calls or user_contacts,
+and writes a plan report that can be diffed between releases.
+
+Usage: python test_query_plans.py [--users 20000] [--report query_plan_report.txt]
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import DatabaseManager
+from database.query_stats import normalize_sql
+from services.heartbeat_buffer import HeartbeatBuffer, LAST_SEEN_UPDATE
+from services.presence_registry import PresenceRegistry, CHECKPOINT_UPSERT
+from seed_fleet import seed_fleet, username, display_name
+
+# Tables whose full scan on a hot path fails the check
+GUARDED_TABLES = ('users', 'calls', 'user_contacts')
+
+_TABLE_REF_RE = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_SQL_KEYWORDS = {'where', 'on', 'join', 'left', 'inner', 'set', 'order', 'group', 'limit',
+                 'values', 'select', 'using', 'natural', 'cross', 'as'}
+
+class RecordingDatabaseManager(DatabaseManager):
+    """DatabaseManager that remembers every statement run per scenario"""
+    
+    def __init__(self, *args, **kwargs):
+        self.recording = None
+        self.recorded = {}
+        super().__init__(*args, **kwargs)
+    
+    def _run_query(self, conn, query, params, fetch):
+        if self.recording is not None:
+            statements = self.recorded.setdefault(self.recording, {})
+            statements.setdefault(normalize_sql(query), (query, tuple(params)))
+        return super()._run_query(conn, query, params, fetch)
+
+class Scenario:
+    """A named workload step; hot scenarios must not full-scan guarded tables"""
+    
+    def __init__(self, name, hot_path, run, allowed_scans=()):
+        self.name = name
+        self.hot_path = hot_path
+        self.run = run
+        self.allowed_scans = set(allowed_scans)
+
+def table_aliases(query):
+    """Map aliases (and bare names) used in a statement to table names"""
+    aliases = {}
+    for table, alias in _TABLE_REF_RE.findall(query):
+        aliases[table] = table
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+def full_scans(plan_details, query):
+    """Guarded tables that the plan reads with a full SCAN"""
+    aliases = table_aliases(query)
+    scanned = set()
+    for detail in plan_details:
+        match = re.match(r'^SCAN (\w+)', detail)
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if table in GUARDED_TABLES:
+                scanned.add(table)
+    return scanned
+
+def build_scenarios(db):
+    """Register every service/admin code path whose SQL should be checked"""
+    from services.user_service import UserService
+    from services.call_service import CallService
+    from services.contact_service import ContactService
+    
+    from repositories.sqlite_repository import create_sqlite_repositories
+    
+    repositories = create_sqlite_repositories(db, HeartbeatBuffer(db=db, enabled=False),
+                                              PresenceRegistry(db=db, write_behind=False))
+    users, calls, contacts = UserService(repositories), CallService(repositories), ContactService(repositories)
+    
+    pending_call = db.execute_query(
+        """SELECT c.call_id, callee.username AS callee FROM calls c
+           JOIN users callee ON callee.id = c.callee_id WHERE c.status = 'pending' LIMIT 1""",
+        fetch='one'
+    )
+    state = {}
+    
+    def initiate():
+        state['call'] = calls.initiate_call(username(1), username(2))
+    
+    scenarios = [
+        # Users
+        Scenario('users.register_existing', True, lambda: users.register_or_update_user(username(1), 'Renamed')),
+        Scenario('users.register_new', True, lambda: users.register_or_update_user('NEW01', 'New')),
+        Scenario('users.get_by_username', True, lambda: users.get_user_by_username(username(3))),
+        Scenario('users.get_by_id', True, lambda: users.get_user_by_id(3)),
+        Scenario('users.update_info', True, lambda: users.update_user_info(username(3), display_name='Three')),
+        Scenario('users.create_session', True, lambda: users.create_session(username(3))),
+        Scenario('users.end_session', True, lambda: users.end_session('seed_1')),
+        Scenario('users.stats', True, lambda: users.get_user_stats(username(3))),
+        Scenario('users.save_score', True, lambda: users.save_game_score(username(3), 'trivia', 5, 10, 5)),
+        Scenario('users.active', False, lambda: users.get_active_users()),
+        # Calls
+        Scenario('calls.online_users', True, lambda: calls.get_online_users(username(1)),
+                 allowed_scans={'users'}),  # lists the whole directory by design
+        Scenario('calls.online_contacts', True, lambda: calls.get_online_users(username(1), contacts_only=True)),
+        Scenario('calls.initiate', True, initiate),
+        Scenario('calls.answer', True, lambda: calls.answer_call(pending_call['call_id'], pending_call['callee'])),
+        Scenario('calls.decline', True, lambda: calls.decline_call(state['call']['call_id'], username(2))),
+        Scenario('calls.cancel', True, lambda: calls.cancel_call(state['call']['call_id'], username(1))),
+        Scenario('calls.end', True, lambda: calls.end_call(pending_call['call_id'], pending_call['callee'])),
+        Scenario('calls.status', True, lambda: calls.get_call_status(pending_call['call_id'])),
+        Scenario('calls.pending', True, lambda: calls.get_pending_calls_for_user(username(2))),
+        Scenario('calls.presence', True, lambda: calls.update_presence(username(4), 'online')),
+        Scenario('calls.cleanup', False, lambda: calls.cleanup_old_calls()),
+        # Contacts
+        Scenario('contacts.add', True, lambda: contacts.add_contact(username(5), username(6))),
+        Scenario('contacts.remove', True, lambda: contacts.remove_contact(username(5), username(6))),
+        Scenario('contacts.list', True, lambda: contacts.get_contact_list_with_status(username(5))),
+        Scenario('contacts.mutual', True, lambda: contacts.get_mutual_contacts(username(5))),
+        Scenario('contacts.search', True, lambda: contacts.search_users(display_name(12), exclude_username=username(5)),
+                 allowed_scans={'users'}),  # substring LIKE cannot use an index
+        Scenario('contacts.favorite', True, lambda: contacts.set_favorite_status(username(5), username(6), True)),
+        Scenario('contacts.is_contact', True, lambda: contacts.is_contact(username(5), username(6))),
+        Scenario('contacts.stats', True, lambda: contacts.get_contact_stats(username(5))),
+        Scenario('contacts.health', False, lambda: contacts.get_health_status()),
+    ]
+    
+    # Heartbeat flush and presence checkpoint statements run through executemany, so register them directly
+    scenarios.append(Scenario('heartbeats.flush', True, lambda: [
+        db.execute_query(CHECKPOINT_UPSERT, (8, 'online', None, '2024-01-01 00:00:00', 1704067200000)),
+        db.execute_query(LAST_SEEN_UPDATE, ('2024-01-01 00:00:00', username(7)))
+    ]))
+    
+    scenarios.extend(build_background_scenarios(db))
+    scenarios.extend(build_admin_scenarios(db))
+    return scenarios
+
+def build_background_scenarios(db):
+    try:
+        from services.background_service import BackgroundService
+    except ImportError as e:
+        print(f"⚠️  Skipping background service queries: {e}")
+        return []
+    
+    from database.archive import Archiver
+    
+    background = BackgroundService()
+    background.db = db
+    background.archiver = Archiver(db)
+    return [
+        Scenario('background.archive_history', False, background.archive_history),
+    ]
+
+def build_admin_scenarios(db):
+    try:
+        from flask import Flask
+        import api.admin_routes as admin_routes
+    except ImportError as e:
+        print(f"⚠️  Skipping admin route queries: {e}")
+        return []
+    
+    admin_routes.db_manager = db
+    app = Flask(__name__)
+    
+    def call_view(view):
+        def run():
+            with app.test_request_context():
+                view()
+        return run
+    
+    return [
+        Scenario(f'admin.{name}', False, call_view(view))
+        for name, view in [
+            ('users', admin_routes.get_all_users),
+            ('sessions', admin_routes.get_all_sessions),
+            ('calls', admin_routes.get_all_calls),
+            ('presence', admin_routes.get_all_presence),
+            ('contacts', admin_routes.get_all_contacts),
+            ('scores', admin_routes.get_all_game_scores),
+            ('stats', admin_routes.get_database_stats),
+        ]
+    ]
+
+def run_harness(user_count=20000, report_path=None, seed=42):
+    """Seed, run all scenarios and check their plans; returns the results"""
+    work_dir = tempfile.mkdtemp(prefix='smarttv-plans-')
+    try:
+        db = RecordingDatabaseManager(db_path=os.path.join(work_dir, 'plans.db'))
+        # Everything stays in the live tables: they are what the hot paths
+        # read, and the archive scenario needs rows to move
+        seed_fleet(db, user_count, seed, archive=False)
+        
+        scenarios = build_scenarios(db)
+        for scenario in scenarios:
+            db.recording = scenario.name
+            scenario.run()
+        db.recording = None
+        
+        results = []
+        violations = []
+        for scenario in scenarios:
+            for query, (raw_query, params) in sorted(db.recorded.get(scenario.name, {}).items()):
+                plan = db.execute_query(f"EXPLAIN QUERY PLAN {raw_query}", params, fetch='all')
+                details = [row['detail'] for row in plan]
+                scans = full_scans(details, query) - scenario.allowed_scans
+                result = {
+                    'scenario': scenario.name,
+                    'hot_path': scenario.hot_path,
+                    'query': query,
+                    'plan': details,
+                    'full_scans': sorted(scans)
+                }
+                results.append(result)
+                if scenario.hot_path and scans:
+                    violations.append(result)
+        
+        if report_path:
+            write_report(results, report_path, user_count)
+        
+        db.close()
+        return {'results': results, 'violations': violations}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def write_report(results, path, user_count):
+    """Plain-text plan report, stable across runs so releases can be diffed"""
+    with open(path, 'w') as f:
+        f.write(f"# SmartTV query plan report ({user_count} seeded users)\n")
+        for result in results:
+            marker = 'HOT ' if result['hot_path'] else 'COLD'
+            status = f"FULL SCAN: {', '.join(result['full_scans'])}" if result['full_scans'] else 'ok'
+            f.write(f"\n[{marker}] {result['scenario']} -- {status}\n")
+            f.write(f"  SQL: {result['query']}\n")
+            for detail in result['plan']:
+                f.write(f"    {detail}\n")
+
+def test_query_plans():
+    """Hot-path queries must not fall back to full table scans"""
+    outcome = run_harness(user_count=int(os.getenv('QUERY_PLAN_USERS', 5000)))
+    assert not outcome['violations'], "\n".join(
+        f"{v['scenario']}: SCAN {', '.join(v['full_scans'])} -- {v['query']}" for v in outcome['violations']
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='Check EXPLAIN QUERY PLAN for every registered query')
+    parser.add_argument('--users', type=int, default=20000, help='Number of synthetic users to seed')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic data')
+    parser.add_argument('--report', default='query_plan_report.txt', help='Where to write the plan report')
+    args = parser.parse_args()
+    
+    print("🔎 Query plan regression check")
+    print("=" * 50)
+    outcome = run_harness(args.users, args.report, args.seed)
+    
+    print(f"   Checked {len(outcome['results'])} statements, report written to {args.report}")
+    if outcome['violations']:
+        print(f"\n❌ {len(outcome['violations'])} hot-path statements fall back to a full scan:")
+        for violation in outcome['violations']:
+            print(f"   - {violation['scenario']}: SCAN {', '.join(violation['full_scans'])}")
+            print(f"     {violation['query']}")
+        sys.exit(1)
+    
+    print("✅ No hot-path full scans of users, calls or user_contacts")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Run the same service workload on the SQLite and memory backends and check
+that both return the same results (timestamps aside).
+Usage: python test_repositories.py
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import DatabaseManager
+from services.heartbeat_buffer import HeartbeatBuffer
+from services.presence_registry import PresenceRegistry
+from services.presence_feed import presence_feed
+from repositories.sqlite_repository import create_sqlite_repositories
+from repositories.memory_repository import create_memory_repositories
+from services.user_service import UserService
+from services.call_service import CallService
+from services.contact_service import ContactService
+
+# Values that legitimately differ between runs
+VOLATILE_KEYS = {'created_at', 'last_seen', 'added_at', 'presence_updated_at', 'member_since',
+                 'call_id', 'room_name', 'timestamp', 'version', 'last_seen_ms', 'created_ms',
+                 'answered_ms', 'ended_ms', 'updated_ms'}
+
+def strip_volatile(value):
+    if isinstance(value, dict):
+        return {k: strip_volatile(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [strip_volatile(v) for v in value]
+    return value
+
+def run_workload(repositories):
+    """Exercise every service method once, returning the results in order"""
+    users = UserService(repositories)
+    calls = CallService(repositories)
+    contacts = ContactService(repositories)
+    results = []
+    presence_changes = []
+    repositories.calls.add_presence_listener(presence_changes.extend)
+    
+    for name in ('TV_ALPHA', 'TV_BRAVO', 'TV_CHARLIE', 'TV_DELTA'):
+        results.append(users.register_or_update_user(name, name.title().replace('_', ' ')))
+    results.append(users.register_or_update_user('TV_ALPHA', 'Living Room'))
+    results.append(users.update_user_info('TV_BRAVO', metadata={'room': 'kitchen'}))
+    results.append(users.get_user_by_username('TV_BRAVO')['metadata'])
+    results.append(users.create_session('TV_ALPHA') is not None)
+    results.append(users.save_game_score('TV_ALPHA', 'trivia', 80, 10, 8))
+    results.append(users.save_game_score('TV_ALPHA', 'trivia', 60, 10, 6))
+    results.append(users.get_user_stats('TV_ALPHA'))
+    results.append(len(users.get_active_users()))
+    
+    results.append(contacts.add_contact('TV_ALPHA', 'TV_BRAVO'))
+    results.append(contacts.add_contact('TV_ALPHA', 'TV_CHARLIE'))
+    results.append(contacts.add_contact('TV_ALPHA', 'TV_BRAVO'))
+    results.append(contacts.add_contact('TV_DELTA', 'TV_ALPHA'))
+    results.append(contacts.set_favorite_status('TV_ALPHA', 'TV_CHARLIE', True))
+    results.append(contacts.is_contact('TV_ALPHA', 'TV_BRAVO'))
+    results.append(contacts.is_contact('TV_BRAVO', 'TV_ALPHA'))
+    
+    results.append(calls.update_presence('TV_BRAVO', 'online'))
+    results.append(calls.update_presence('TV_CHARLIE', 'away'))
+    results.append(calls.update_presence('TV_UNKNOWN', 'online'))
+    results.append(calls.connect_presence('TV_DELTA', 'socket-1'))
+    results.append(calls.connect_presence('TV_DELTA', 'socket-2'))
+    results.append(calls.connect_presence('TV_UNKNOWN', 'socket-3'))
+    results.append(calls.disconnect_presence('socket-1'))
+    results.append(calls.disconnect_presence('socket-3'))
+    
+    results.append(contacts.get_contact_list_with_status('TV_ALPHA'))
+    results.append(contacts.get_mutual_contacts('TV_ALPHA'))
+    results.append(contacts.search_users('tv_', exclude_username='TV_ALPHA'))
+    results.append(contacts.get_contact_stats('TV_ALPHA'))
+    results.append(contacts.get_health_status())
+    results.append(sorted(repositories.contacts.list_edges()))
+    results.append(calls.get_online_users('TV_ALPHA'))
+    results.append(calls.get_online_users('TV_ALPHA', contacts_only=True))
+    snapshot = calls.get_online_users_since('TV_ALPHA')
+    contacts_snapshot = calls.get_online_users_since('TV_ALPHA', contacts_only=True)
+    results.append(snapshot)
+    
+    first = calls.initiate_call('TV_ALPHA', 'TV_BRAVO')
+    results.append(first)
+    results.append(calls.get_pending_calls_for_user('TV_BRAVO'))
+    # Calling again auto-cancels the first call
+    second = calls.initiate_call('TV_BRAVO', 'TV_ALPHA')
+    results.append(calls.get_call_status(first['call_id']))
+    results.append(calls.cancel_call(first['call_id'], 'TV_ALPHA'))
+    results.append(calls.answer_call(second['call_id'], 'TV_BRAVO'))
+    results.append(calls.answer_call(second['call_id'], 'TV_ALPHA'))
+    results.append(calls.end_call(second['call_id'], 'TV_ALPHA'))
+    results.append(calls.end_call(second['call_id'], 'TV_ALPHA'))
+    third = calls.initiate_call('TV_CHARLIE', 'TV_DELTA')
+    results.append(calls.decline_call(third['call_id'], 'TV_DELTA'))
+    results.append(calls.get_call_status(third['call_id']))
+    results.append(calls.initiate_call('TV_ALPHA', 'TV_NOBODY'))
+    
+    results.append(contacts.remove_contact('TV_ALPHA', 'TV_BRAVO'))
+    results.append(contacts.get_contact_stats('TV_ALPHA'))
+    results.append(calls.update_presence('TV_DELTA', 'away'))
+    results.append(calls.get_online_users_since('TV_ALPHA', since=snapshot['version']))
+    results.append(calls.get_online_users_since('TV_ALPHA', contacts_only=True,
+                                                since=contacts_snapshot['version']))
+    
+    # TVs that stop sending heartbeats go offline once the TTL has passed
+    results.append(calls.update_presence('TV_CHARLIE', 'online'))
+    results.append(repositories.calls.expire_presence(time.time() + 3600))
+    results.append(contacts.get_contact_list_with_status('TV_ALPHA'))
+    results.append(calls.get_online_users('TV_ALPHA'))
+    results.append(presence_changes)
+    
+    # A transaction that raises leaves nothing behind
+    alpha_id = users.get_user_by_username('TV_ALPHA')['id']
+    charlie_id = users.get_user_by_username('TV_CHARLIE')['id']
+    try:
+        with repositories.contacts.transaction():
+            echo_id = repositories.users.create('TV_ECHO', 'Echo', 'smart_tv', '{}')
+            repositories.contacts.add(alpha_id, echo_id)
+            repositories.contacts.set_favorite(alpha_id, charlie_id, False)
+            repositories.users.update_info('TV_ALPHA', display_name='Rolled Back')
+            raise RuntimeError('rollback')
+    except RuntimeError:
+        pass
+    results.append(users.get_user_by_username('TV_ECHO'))
+    results.append(users.get_user_by_username('TV_ALPHA')['display_name'])
+    results.append(contacts.get_contact_list_with_status('TV_ALPHA'))
+    results.append(sorted(repositories.contacts.list_edges()))
+    return results
+
+def main():
+    print("🧪 Repository backend parity check")
+    print("=" * 50)
+    # Expected failures (unknown users, wrong callee) would otherwise flood the output
+    logging.disable(logging.CRITICAL)
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        db = DatabaseManager(db_path=os.path.join(work_dir, 'parity.db'))
+        presence = PresenceRegistry(db=db, write_behind=False)
+        presence.add_listener(presence_feed.record_presence_changes)
+        sqlite_repositories = create_sqlite_repositories(db, HeartbeatBuffer(db=db, enabled=False), presence)
+        
+        timings = {}
+        outputs = {}
+        for backend, repositories in (('sqlite', sqlite_repositories),
+                                      ('memory', create_memory_repositories())):
+            started = time.perf_counter()
+            outputs[backend] = strip_volatile(run_workload(repositories))
+            timings[backend] = (time.perf_counter() - started) * 1000
+        db.close()
+    
+    mismatches = [(i, a, b) for i, (a, b) in enumerate(zip(outputs['sqlite'], outputs['memory'])) if a != b]
+    for backend, elapsed in timings.items():
+        print(f"   {backend:<8}{elapsed:>8.1f} ms")
+    
+    if mismatches:
+        print(f"\n❌ {len(mismatches)} results differ between backends:")
+        for index, sqlite_result, memory_result in mismatches:
+            print(f"   step {index}:\n     sqlite: {sqlite_result}\n     memory: {memory_result}")
+        return False
+    
+    print(f"\n✅ {len(outputs['sqlite'])} results match")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
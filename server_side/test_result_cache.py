@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Check the version keys the result cache derives from SQL, so heartbeat writes
+keep invalidating only the volatile users columns.
+Usage: python test_result_cache.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.result_cache import read_tables, written_tables
+from services.heartbeat_buffer import LAST_SEEN_UPDATE
+
+def check(label, actual, expected):
+    ok = actual == expected
+    print(f"   {'✅' if ok else '❌'} {label}: {actual}" + ('' if ok else f" (expected {expected})"))
+    return ok
+
+def main():
+    print("🧪 Result cache version keys")
+    print("=" * 50)
+    results = [
+        check("heartbeat flush writes", written_tables(LAST_SEEN_UPDATE),
+              ('users.last_seen', 'users.last_seen_ms')),
+        check("profile lookup reads", read_tables("SELECT id, username, display_name FROM users WHERE username = ?"),
+              ('users',)),
+    ]
+    
+    try:
+        from api.admin_routes import ACTIVE_USERS_QUERY
+    except ImportError as e:
+        print(f"⚠️  Skipping admin route queries: {e}")
+    else:
+        results.append(check("active users count reads", read_tables(ACTIVE_USERS_QUERY),
+                             ('users', 'users.last_seen_ms')))
+    
+    print(f"\n{'✅ All checks passed' if all(results) else '❌ Some checks failed'}")
+    return all(results)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+One-time full VACUUM that switches an existing smarttv.db to incremental auto-vacuum.
+Usage: python vacuum_db.py [--db /path/to/smarttv.db] [--force]
+Writes wait until it finishes and it needs about twice the file size free on
+disk, so run it during a quiet window (or with the server stopped).
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Full VACUUM of the SmartTV database')
+    parser.add_argument('--db', help='Database to vacuum (defaults to SMARTTV_DB_PATH / the live database)')
+    parser.add_argument('--force', action='store_true', help='Vacuum even if auto_vacuum is already INCREMENTAL')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.db:
+        # Set before the import, which opens (and migrates) the global database
+        os.environ['SMARTTV_DB_PATH'] = args.db
+    from database.database import db_manager as db
+    
+    try:
+        stats = db.get_fragmentation_stats()
+        print(f"🧽 {db.db_path}: auto_vacuum={stats['auto_vacuum']}, {stats['file_bytes'] / 1024 / 1024:.1f} MB, "
+              f"{stats['freelist_count']} free pages")
+        if stats['auto_vacuum'] == 'INCREMENTAL' and not args.force:
+            print("✅ Already incremental; the background service reclaims free pages")
+            return True
+        
+        result = db.full_vacuum()
+        if not result['vacuumed']:
+            print(f"❌ Skipped: {result['skipped']}")
+            return False
+        print(f"✅ auto_vacuum={result['auto_vacuum_after']}, {result['bytes_before'] / 1024 / 1024:.1f} MB -> "
+              f"{result['bytes_after'] / 1024 / 1024:.1f} MB in {result['elapsed_ms']}ms")
+        return result['auto_vacuum_after'] == 'INCREMENTAL'
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)